@@ -20,10 +20,10 @@ from .static_hooker import StaticHooker
 from .reassembler import Reassembler
 from .binary_optimizer import BinaryOptimizer
 from .disassembly import Disassembly
-from .variable_recovery import VariableRecovery, VariableRecoveryFast
+from .variable_recovery import VariableRecovery, VariableRecoveryFast, VariableRecoveryBatch
 from .identifier import Identifier
 from .callee_cleanup_finder import CalleeCleanupFinder
-from .reaching_definitions import ReachingDefinitionAnalysis
+from .reaching_definitions import ReachingDefinitionAnalysis, InterproceduralReachingDefinitions
 from .calling_convention import CallingConventionAnalysis
 from .code_tagging import CodeTagging
 from .stack_pointer_tracker import StackPointerTracker
@@ -0,0 +1,65 @@
+import concurrent.futures
+
+from .forward_analysis import CallGraphVisitor
+
+
+def sort_functions(kb, func_addrs):
+    """
+    Order functions so that callees come before their callers. Functions that are not in the call graph come last, and
+    SimProcedures are left out.
+
+    :param KnowledgeBase kb:    The knowledge base that holds the functions.
+    :param list func_addrs:     Addresses of the functions.
+    :return:                    A list of function addresses.
+    :rtype:                     list
+    """
+
+    targets = set(func_addrs)
+    callgraph = kb.functions.callgraph.subgraph(targets)
+    order = list(CallGraphVisitor(callgraph).nodes())[::-1]
+    seen = set(order)
+    order.extend(addr for addr in func_addrs if addr not in seen)
+
+    return [ addr for addr in order if not kb.functions.function(addr=addr).is_simprocedure ]
+
+
+_worker_project = None
+_worker_kb = None
+_worker_args = None
+
+
+def _worker_init(project, kb, args):
+    global _worker_project, _worker_kb, _worker_args  # pylint:disable=global-statement
+    _worker_project, _worker_kb, _worker_args = project, kb, args
+
+
+def worker_context():
+    """
+    Get the objects that the worker pool of the current process was created with. This function is called inside
+    worker processes.
+
+    :return:    A tuple of the project, the knowledge base, and the other arguments of new_worker_pool().
+    :rtype:     tuple
+    """
+
+    return _worker_project, _worker_kb, _worker_args
+
+
+def new_worker_pool(workers, project, kb, *args):
+    """
+    Create a process pool whose workers analyze functions of a project. The project, the knowledge base, and all other
+    arguments are sent to each worker once, and tasks get them with worker_context().
+
+    Analyses that need calling conventions (e.g., VariableRecoveryFast) recover them for the whole binary. Recovering
+    them before the first pool is created saves each worker from doing it again.
+
+    :param int workers:         Number of worker processes.
+    :param angr.Project project: The project.
+    :param KnowledgeBase kb:    The knowledge base.
+    :param args:                Other objects that the workers need. They must be picklable.
+    :return:                    The process pool.
+    :rtype:                     concurrent.futures.ProcessPoolExecutor
+    """
+
+    return concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_worker_init,
+                                                  initargs=(project, kb, args))
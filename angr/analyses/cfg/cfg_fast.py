@@ -4,6 +4,7 @@ import math
 import re
 import string
 from collections import defaultdict
+import concurrent.futures
 
 from sortedcontainers import SortedDict
 
@@ -787,6 +788,106 @@ class CFGJob:
                     )
 
 
+#
+# Parallel pre-lifting
+#
+
+
+def _block_size_limit(project, addr, real_addr):
+    """
+    Get the maximum size of a basic block starting at `addr`, only taking into account information that does not
+    change during CFG recovery (object sections and the maximum size of a VEX IRSB).
+
+    :param project:         The angr project.
+    :param int addr:        Address of the block.
+    :param int real_addr:   Address of the block without the THUMB bit.
+    :return:                The maximum size of the block, or None if no block may start at this address.
+    :rtype:                 int or None
+    """
+
+    distance = VEX_IRSB_MAX_SIZE
+    obj = project.loader.find_object_containing(addr, membership_check=False)
+    if obj:
+        # is there a section?
+        has_executable_section = len([ sec for sec in obj.sections if sec.is_executable ]) > 0  # pylint:disable=len-as-condition
+        section = project.loader.find_section_containing(addr)
+        if has_executable_section and section is None:
+            # the basic block should not exist here...
+            return None
+        if section is not None:
+            if not section.is_executable:
+                # the section is not executable...
+                return None
+            distance = section.vaddr + section.memsize - real_addr
+            distance = min(distance, VEX_IRSB_MAX_SIZE)
+        # TODO: handle segment information as well
+
+    return distance
+
+
+_prelift_project = None
+
+
+def _prelift_worker_init(project):
+    global _prelift_project  # pylint:disable=global-statement
+    _prelift_project = project
+
+
+def _prelift_region(start, end, opt_level, extra_stop_points):
+    """
+    Lift all basic blocks that can be reached by a linear sweep (as well as direct jump targets) inside a region.
+    This function is executed inside worker processes.
+
+    :param int start:               Start address of the region.
+    :param int end:                 End address of the region (exclusive).
+    :param int opt_level:           VEX optimization level.
+    :param dict extra_stop_points:  Extra stop points (known thunks) to pass to the lifter.
+    :return:                        A dict mapping block addresses to tuples of (size limit, bytes, IRSB).
+    :rtype:                         dict
+    """
+
+    project = _prelift_project
+    alignment = project.arch.instruction_alignment
+    blocks = { }
+
+    next_addr = start
+    pending = [ ]
+    while pending or next_addr < end:
+        sweeping = not pending
+        if sweeping:
+            addr = next_addr
+            next_addr += alignment
+        else:
+            addr = pending.pop()
+
+        if addr in blocks:
+            if sweeping:
+                next_addr = addr + blocks[addr][2].size
+            continue
+
+        distance = _block_size_limit(project, addr, addr)
+        if distance is None or distance <= 0:
+            continue
+        try:
+            block = project.factory.block(addr, size=distance, opt_level=opt_level, collect_data_refs=True,
+                                          extra_stop_points=extra_stop_points)
+            irsb = block.vex_nostmt
+        except (SimTranslationError, SimMemoryError, SimEngineError):
+            continue
+        if irsb.size == 0 or irsb.jumpkind == 'Ijk_NoDecode':
+            continue
+
+        blocks[addr] = (distance, block.bytes, irsb)
+        if sweeping:
+            # continue the linear sweep right after this block
+            next_addr = addr + irsb.size
+        for target in irsb.constant_jump_targets:
+            if start <= target < end and target not in blocks:
+                pending.append(target)
+
+    return blocks
+
+
 class CFGFast(ForwardAnalysis, CFGBase):    # pylint: disable=abstract-method
     """
     We find functions inside the given binary, and build a control-flow graph in very fast manners: instead of
@@ -855,6 +956,8 @@ class CFGFast(ForwardAnalysis, CFGBase):    # pylint: disable=abstract-method
                  detect_tail_calls=False,
                  low_priority=False,
                  cfb=None,
+                 parallel=None,
+                 previous_cfg=None,
                  start=None,  # deprecated
                  end=None,  # deprecated
                  **extra_arch_options
@@ -893,6 +996,12 @@ class CFGFast(ForwardAnalysis, CFGBase):    # pylint: disable=abstract-method
                                              types will be loaded.
         :param base_state:              A state to use as a backer for all memory loads
         :param bool detect_tail_calls:  Enable aggressive tail-call optimization detection.
+        :param int parallel:            Number of worker processes used to lift basic blocks of all regions in advance.
+                                        The CFG recovery itself is still performed in the current process, so the
+                                        result is identical to a serial run. None or 1 disables parallel lifting.
+        :param CFGFast previous_cfg:    A CFG recovered on a previous version of the same binary. When specified, only
+                                        functions whose bytes have changed (and their callers) are analyzed again, and
+                                        everything else is reused from the previous CFG.
         :param int start:               (Deprecated) The beginning address of CFG recovery.
         :param int end:                 (Deprecated) The end address of CFG recovery.
         :param CFGArchOptions arch_options: Architecture-specific options.
@@ -998,6 +1107,22 @@ class CFGFast(ForwardAnalysis, CFGBase):    # pylint: disable=abstract-method
 
         self._cfb = cfb
 
+        self._parallel = parallel
+        if self._parallel is not None and self._parallel > 1 and base_state is not None:
+            l.warning('Parallel lifting is not supported when "base_state" is specified. Disable it.')
+            self._parallel = None
+        # A mapping between block addresses and blocks lifted by worker processes
+        self._prelifted_blocks = { }
+        # Extra stop points that worker processes lifted blocks with
+        self._prelifted_stop_points = frozenset()
+        # Number of blocks that were taken from (or had to be lifted again in spite of) _prelifted_blocks
+        self._prelifted_hits = 0
+        self._prelifted_misses = 0
+
+        self._previous_cfg = previous_cfg
+        # Edges from reused nodes to nodes that are analyzed again
+        self._dangling_edges = [ ]
+
         l.debug("CFG recovery covers %d regions:", len(self._regions))
         for start_addr in self._regions:
             l.debug("... %#x - %#x", start_addr, self._regions[start_addr])
@@ -1319,12 +1444,18 @@ class CFGFast(ForwardAnalysis, CFGBase):    # pylint: disable=abstract-method
 
     def _pre_analysis(self):
 
+        # Collect everything that can be reused from the previous CFG before any function is cleared
+        reusable = self._diff_previous_cfg() if self._previous_cfg is not None else None
+
         # Call _initialize_cfg() before self.functions is used.
         self._initialize_cfg()
 
         # Scan for __x86_return_thunk and friends
         self._known_thunks = self._find_thunks()
 
+        if self._parallel is not None and self._parallel > 1:
+            self._prelift_blocks()
+
         # Initialize variables used during analysis
         self._pending_jobs = PendingJobs(self.functions, self._deregister_analysis_job)
         self._traced_addresses = set()
@@ -1375,6 +1506,9 @@ class CFGFast(ForwardAnalysis, CFGBase):    # pylint: disable=abstract-method
         self._nodes = {}
         self._nodes_by_addr = defaultdict(list)
 
+        if reusable is not None:
+            self._restore_previous_cfg(**reusable)
+
         if self._use_function_prologues and self.project.concrete_target is None:
             self._function_prologue_addrs = sorted(self._func_addrs_from_prologues())
             # make a copy of those prologue addresses, so that we can pop from the list
@@ -1531,6 +1665,20 @@ class CFGFast(ForwardAnalysis, CFGBase):    # pylint: disable=abstract-method
 
     def _post_analysis(self):
 
+        # blocks that are not consumed by now will never be used
+        if self._prelifted_hits or self._prelifted_misses:
+            l.debug("%d prelifted blocks are used, %d blocks are lifted again, and %d prelifted blocks are unused.",
+                    self._prelifted_hits, self._prelifted_misses, len(self._prelifted_blocks))
+        self._prelifted_blocks = { }
+
+        # reconnect reused nodes with nodes that are analyzed again
+        for src_node, dst_addr, data in self._dangling_edges:
+            dst_node = self._nodes.get(dst_addr, None)
+            if dst_node is not None:
+                self._graph.add_edge(src_node, dst_node, **data)
+        self._dangling_edges = [ ]
+        self._previous_cfg = None
+
         self._make_completed_functions()
 
         if self._normalize:
@@ -3550,22 +3698,9 @@ class CFGFast(ForwardAnalysis, CFGBase):    # pylint: disable=abstract-method
                 real_addr = addr
 
             # if possible, check the distance between `addr` and the end of this section
-            distance = VEX_IRSB_MAX_SIZE
-            obj = self.project.loader.find_object_containing(addr, membership_check=False)
-            if obj:
-                # is there a section?
-                has_executable_section = len([ sec for sec in obj.sections if sec.is_executable ]) > 0  # pylint:disable=len-as-condition
-                section = self.project.loader.find_section_containing(addr)
-                if has_executable_section and section is None:
-                    # the basic block should not exist here...
-                    return None, None, None, None
-                if section is not None:
-                    if not section.is_executable:
-                        # the section is not executable...
-                        return None, None, None, None
-                    distance = section.vaddr + section.memsize - real_addr
-                    distance = min(distance, VEX_IRSB_MAX_SIZE)
-                # TODO: handle segment information as well
+            distance = _block_size_limit(self.project, addr, real_addr)
+            if distance is None:
+                return None, None, None, None
 
             # also check the distance between `addr` and the closest function.
             # we don't want to have a basic block that spans across function boundaries
@@ -3589,7 +3724,9 @@ class CFGFast(ForwardAnalysis, CFGBase):    # pylint: disable=abstract-method
             irsb = None
             irsb_string = None
             try:
-                lifted_block = self._lift(addr, size=distance, opt_level=self._iropt_level, collect_data_refs=True)
+                lifted_block = self._pop_prelifted_block(addr, distance)
+                if lifted_block is None:
+                    lifted_block = self._lift(addr, size=distance, opt_level=self._iropt_level, collect_data_refs=True)
                 irsb = lifted_block.vex_nostmt
                 irsb_string = lifted_block.bytes[:irsb.size]
             except SimTranslationError:
@@ -3736,6 +3873,320 @@ class CFGFast(ForwardAnalysis, CFGBase):    # pylint: disable=abstract-method
                 if not state.regs.gp.symbolic and state.solver.is_false(state.regs.gp == 0xffffffff):
                     function.info['gp'] = state.regs.gp._model_concrete.value
 
+    def _diff_previous_cfg(self):
+        """
+        Compare nodes of the previous CFG against the memory of the current project, and determine which functions
+        must be analyzed again. A function is analyzed again if the bytes of any of its blocks have changed, or if it
+        has an edge going into such a function.
+
+        :return: A dict of everything that can be reused. See _restore_previous_cfg() for its keys.
+        :rtype:  dict
+        """
+
+        previous = self._previous_cfg
+        memory = self.project.loader.memory
+
+        changed_funcs = set()
+        for node in previous.graph.nodes():
+            if node.byte_string is None or node.size == 0:
+                # SimProcedures and syscalls do not have any bytes
+                continue
+            if not self._inside_regions(node.addr):
+                changed_funcs.add(node.function_address)
+                continue
+            real_addr = self._real_address(self.project.arch, node.addr)
+            try:
+                data = memory.load(real_addr, node.size)
+            except KeyError:
+                data = None
+            if data != node.byte_string:
+                changed_funcs.add(node.function_address)
+
+        # callers of changed functions are analyzed again as well, since their edges may change
+        dirty_funcs = set(changed_funcs)
+        for src, dst in previous.graph.edges():
+            if dst.function_address in changed_funcs:
+                dirty_funcs.add(src.function_address)
+
+        l.debug("%d functions have changed. %d functions will be analyzed again.", len(changed_funcs),
+                len(dirty_funcs))
+
+        clean_nodes = [ n for n in previous.graph.nodes() if n.function_address not in dirty_funcs ]
+
+        # whether calls into functions that are analyzed again return is determined again
+        dirty_call_sites = { }
+        for src, dst, data in previous.graph.edges(data=True):
+            if data.get('jumpkind', None) == 'Ijk_Call' and src.function_address not in dirty_funcs and \
+                    dst.function_address in dirty_funcs:
+                dirty_call_sites[src] = dst.addr
+
+        clean_edges = [ ]
+        dangling_edges = [ ]
+        pending_returns = [ ]
+        for src, dst, data in previous.graph.edges(data=True):
+            if src.function_address in dirty_funcs:
+                continue
+            if data.get('jumpkind', None) == 'Ijk_FakeRet' and src in dirty_call_sites:
+                pending_returns.append((src, dst.addr, dirty_call_sites[src], data))
+            elif dst.function_address in dirty_funcs:
+                dangling_edges.append((src, dst.addr, data))
+            else:
+                clean_edges.append((src, dst, data))
+
+        clean_funcs = [ f for f in previous.kb.functions.values() if f.addr not in dirty_funcs ]
+        function_returns = [ fr for frs in previous._function_returns.values() for fr in frs
+                             if fr.caller_func_addr not in dirty_funcs ]
+
+        # data references of reused blocks are not collected again
+        clean_blocks = set(n.addr for n in clean_nodes)
+        clean_insns = set()
+        for n in clean_nodes:
+            clean_insns.update(n.instruction_addrs)
+        memory_data = { }
+        for data_addr, data in previous._memory_data.items():
+            if data.irsb_addr in clean_blocks:
+                data = data.copy()
+                data.refs = set(ref for ref in data.refs if ref[0] in clean_blocks)
+                memory_data[data_addr] = data
+        insn_memory_data = { insn_addr: data.address for insn_addr, data in previous.insn_addr_to_memory_data.items()
+                             if insn_addr in clean_insns and data.address in memory_data }
+
+        dirty_ranges = [ (self._real_address(self.project.arch, n.addr),
+                          self._real_address(self.project.arch, n.addr) + n.size)
+                         for n in previous.graph.nodes() if n.function_address in dirty_funcs
+                         ]
+        other_segments = [ seg.copy() for seg in previous._seg_list._list
+                           if seg.sort != 'code' and not any(start < seg.end and seg.start < end
+                                                             for start, end in dirty_ranges)
+                           ]
+
+        return {
+            'clean_nodes': clean_nodes,
+            'clean_edges': clean_edges,
+            'dangling_edges': dangling_edges,
+            'pending_returns': pending_returns,
+            'clean_funcs': clean_funcs,
+            'function_returns': function_returns,
+            'memory_data': memory_data,
+            'insn_memory_data': insn_memory_data,
+            'other_segments': other_segments,
+            'dirty_funcs': dirty_funcs,
+        }
+
+    def _restore_previous_cfg(self, clean_nodes, clean_edges, dangling_edges, pending_returns, clean_funcs,
+                              function_returns, memory_data, insn_memory_data, other_segments, dirty_funcs):
+        """
+        Add all reusable nodes, edges, functions, and data references from the previous CFG, and create jobs for all
+        functions that must be analyzed again.
+
+        :param list clean_nodes:        Nodes of the previous CFG that are reused.
+        :param list clean_edges:        Edges between reused nodes.
+        :param list dangling_edges:     Tuples of (node, destination address, data) of edges from reused nodes to nodes
+                                        that are analyzed again.
+        :param list pending_returns:    Tuples of (call node, return address, callee address, data) of calls from
+                                        reused nodes into functions that are analyzed again.
+        :param list clean_funcs:        Functions of the previous CFG that are reused.
+        :param list function_returns:   FunctionReturn instances of reused functions that are still unresolved.
+        :param dict memory_data:        MemoryData instances that are referenced by reused nodes.
+        :param dict insn_memory_data:   Addresses of reused instructions mapped to the addresses of their MemoryData.
+        :param list other_segments:     Non-code segments that are reused.
+        :param set dirty_funcs:         Addresses of functions to analyze again.
+        :return: None
+        """
+
+        previous = self._previous_cfg
+
+        node_map = { }
+        for node in clean_nodes:
+            new_node = node.copy()
+            new_node._cfg = self
+            node_map[node] = new_node
+
+            self._nodes[new_node.addr] = new_node
+            self._nodes_by_addr[new_node.addr].append(new_node)
+            self._graph.add_node(new_node)
+
+            real_addr = self._real_address(self.project.arch, new_node.addr)
+            # reused nodes are never scanned again
+            self._traced_addresses.add(real_addr)
+            if new_node.size > 0 and self._inside_regions(new_node.addr):
+                self._seg_list.occupy(real_addr, new_node.size, 'code')
+
+        for seg in other_segments:
+            self._seg_list.occupy(seg.start, seg.size, seg.sort)
+
+        self._memory_data.update(memory_data)
+        for insn_addr, data_addr in insn_memory_data.items():
+            self.insn_addr_to_memory_data[insn_addr] = memory_data[data_addr]
+
+        for src, dst, data in clean_edges:
+            self._graph.add_edge(node_map[src], node_map[dst], **data)
+        self._dangling_edges = [ (node_map[src], dst_addr, data) for src, dst_addr, data in dangling_edges ]
+
+        pending_call_sites = set(src.addr for src, _, _, _ in pending_returns)
+        for func in clean_funcs:
+            self._restore_function(func, dirty_funcs, pending_call_sites)
+        for new_node in node_map.values():
+            if new_node.function_address is not None:
+                self._function_add_node(new_node, new_node.function_address)
+
+        for fr in function_returns:
+            self._function_returns[fr.callee_func_addr].add(fr)
+        # calls into functions that are analyzed again are handled like calls into functions whose returning status is
+        # unknown
+        for src, return_site, callee_addr, data in pending_returns:
+            src_node = node_map[src]
+            func_addr = src_node.function_address
+            fr = FunctionReturn(callee_addr, func_addr, src_node.addr, return_site)
+            self._function_returns[callee_addr].add(fr)
+            fakeret_edge = FunctionFakeRetEdge(src_node, return_site, func_addr, confirmed=None)
+            job = CFGJob(return_site, func_addr, 'Ijk_FakeRet', last_addr=src_node.addr, src_node=src_node,
+                         src_stmt_idx=data.get('stmt_idx', None), src_ins_addr=data.get('ins_addr', None),
+                         returning_source=callee_addr, func_edges=[ fakeret_edge ])
+            self._pending_jobs.add_job(job)
+            self._register_analysis_job(func_addr, job)
+
+        for addr, jump in previous.indirect_jumps.items():
+            if addr in self._nodes:
+                self.indirect_jumps[addr] = jump
+        for addr, jump_table in previous.jump_tables.items():
+            if addr in self._nodes:
+                self.jump_tables[addr] = jump_table
+
+        for func_addr in sorted(a for a in dirty_funcs if a is not None):
+            if self._real_address(self.project.arch, func_addr) in self._traced_addresses:
+                continue
+            job = CFGJob(func_addr, func_addr, 'Ijk_Boring')
+            self._insert_job(job)
+            self._register_analysis_job(func_addr, job)
+
+    def _restore_function(self, func, dirty_funcs, pending_call_sites):
+        """
+        Add a function of the previous CFG, with all its nodes and edges, to the knowledge base. Edges that depend on
+        whether functions that are analyzed again return are left out.
+
+        :param Function func:           The function of the previous CFG.
+        :param set dirty_funcs:         Addresses of functions to analyze again.
+        :param set pending_call_sites:  Addresses of call sites whose return edges are left out.
+        :return: None
+        """
+
+        fm = self.kb.functions
+        new_func = fm.function(addr=func.addr, create=True, syscall=func.is_syscall)
+        new_func.info = func.info.copy()
+        if any(target in dirty_funcs for target, _ in func._call_sites.values()):
+            # the returning status of this function depends on functions that are analyzed again
+            self._updated_nonreturning_functions.add(func.addr)
+        else:
+            new_func.returning = func.returning
+
+        def _snippet(node):
+            cfg_node = self._nodes.get(node.addr, None)
+            if cfg_node is not None:
+                return self._to_snippet(cfg_node=cfg_node)
+            return self._to_snippet(addr=node.addr, base_state=self._base_state)
+
+        for node in func.graph.nodes():
+            fm._add_node(func.addr, _snippet(node))
+        for node in func.ret_sites:
+            fm._add_return_from(func.addr, _snippet(node))
+
+        for src, dst, data in func.transition_graph.edges(data=True):
+            edge_type = data.get('type', None)
+            try:
+                if edge_type in ('call', 'syscall'):
+                    fm._add_call_to(func.addr, _snippet(src), dst.addr, syscall=edge_type == 'syscall',
+                                    stmt_idx=data.get('stmt_idx', None), ins_addr=data.get('ins_addr', None))
+                elif edge_type == 'transition':
+                    if data.get('outside', False):
+                        to_func_addr = dst.addr if dst.addr in self._previous_cfg.kb.functions else None
+                        fm._add_outside_transition_to(func.addr, _snippet(src), _snippet(dst),
+                                                      to_function_addr=to_func_addr,
+                                                      ins_addr=data.get('ins_addr', None),
+                                                      stmt_idx=data.get('stmt_idx', None))
+                    else:
+                        fm._add_transition_to(func.addr, _snippet(src), _snippet(dst),
+                                              ins_addr=data.get('ins_addr', None), stmt_idx=data.get('stmt_idx', None))
+                elif edge_type == 'fake_return':
+                    if src.addr in pending_call_sites:
+                        continue
+                    fm._add_fakeret_to(func.addr, _snippet(src), _snippet(dst), confirmed=data.get('confirmed', None),
+                                       to_outside=data.get('outside', False))
+                elif edge_type == 'real_return':
+                    if src.addr in dirty_funcs:
+                        continue
+                    fm._add_return_from_call(func.addr, src.addr, _snippet(dst),
+                                             to_outside=data.get('to_outside', False))
+            except (SimMemoryError, SimEngineError):
+                # the destination does not exist in the current binary anymore
+                l.debug("Failed to restore an edge of function %#x.", func.addr, exc_info=True)
+
+    def _prelift_blocks(self):
+        """
+        Split all regions into chunks, and lift basic blocks inside each chunk in worker processes. Lifted blocks are
+        stored in self._prelifted_blocks, and will be consumed by _generate_cfgnode().
+
+        :return: None
+        """
+
+        chunk_count = self._parallel * 4
+        chunk_size = max(self._regions_size // chunk_count, VEX_IRSB_MAX_SIZE)
+
+        chunks = [ ]
+        for start, end in self._regions.items():
+            for chunk_start in range(start, end, chunk_size):
+                chunks.append((chunk_start, min(chunk_start + chunk_size, end)))
+
+        l.debug("Lifting blocks of %d chunks with %d worker processes.", len(chunks), self._parallel)
+
+        self._prelifted_stop_points = frozenset(self._known_thunks)
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=self._parallel,
+                                                    initializer=_prelift_worker_init,
+                                                    initargs=(self.project,)) as executor:
+            tasks = [ executor.submit(_prelift_region, start, end, self._iropt_level, self._known_thunks)
+                      for start, end in chunks ]
+            for task in concurrent.futures.as_completed(tasks):
+                self._prelifted_blocks.update(task.result())
+
+    def _pop_prelifted_block(self, addr, distance):
+        """
+        Get a block that was lifted by a worker process. The block is only used when lifting it now would yield the
+        same block, i.e., when it was lifted with the same size limit, or when it ended with a control flow transfer
+        within both size limits, and when it is not cut differently by the extra stop points that are used now.
+
+        :param int addr:        Address of the block.
+        :param int distance:    Maximum size of the block.
+        :return:                The lifted block, or None if there is no such block.
+        :rtype:                 angr.block.Block or None
+        """
+
+        if not self._parallel or self._parallel <= 1:
+            return None
+        prelifted = self._prelifted_blocks.pop(addr, None)
+        if prelifted is None:
+            self._prelifted_misses += 1
+            return None
+        size, byte_string, irsb = prelifted
+        end = addr + irsb.size
+        fallthrough = irsb.jumpkind == 'Ijk_Boring' and type(irsb.next) is pyvex.IRExpr.Const and \
+            irsb.next.con.value == end
+        if size != distance:
+            # a block that was cut by its size limit may be longer or shorter with another limit
+            if irsb.size > distance or fallthrough:
+                self._prelifted_misses += 1
+                return None
+        if any(addr < stop_point < end for stop_point in self._known_thunks) or \
+                (fallthrough and end in self._prelifted_stop_points and end not in self._known_thunks):
+            # the lifter would stop at a stop point inside the block, or would not stop at the end of the block
+            self._prelifted_misses += 1
+            return None
+
+        self._prelifted_hits += 1
+        return self.project.factory.block(addr, size=irsb.size, byte_string=byte_string[:irsb.size],
+                                          opt_level=self._iropt_level, collect_data_refs=True,
+                                          extra_stop_points=self._known_thunks, vex_nostmt=irsb)
+
     def _find_thunks(self):
         if self.project.arch.name not in self.SPECIAL_THUNKS:
             return {}
@@ -1,5 +1,7 @@
+import heapq
+import itertools
 import logging
-from collections import defaultdict
+from collections import defaultdict, deque
 
 import networkx
 import pyvex
@@ -92,6 +94,85 @@ class DDGJob(object):
         return "<DDGJob %s, call_depth %d>" % (self.cfg_node, self.call_depth)
 
 
+class DDGWorklist(object):
+    """
+    A work-list of DDGJobs, which pops jobs in the reverse post-order of their CFG nodes, so that definitions flow
+    through the CFG in as few passes as possible. Each CFG node is in the work-list at most once.
+    """
+    def __init__(self, graph, start_nodes):
+        """
+        :param networkx.DiGraph graph:  The CFG.
+        :param list start_nodes:        Nodes that the CFG is traversed from.
+        """
+
+        self._order = self._reverse_post_order(graph, start_nodes)
+        self._heap = [ ]
+        self._jobs = { }
+
+    @staticmethod
+    def _reverse_post_order(graph, start_nodes):
+        """
+        Number all nodes of a graph in reverse post-order of a depth-first traversal from the start nodes. Nodes that
+        are not reachable from any start node are numbered after them.
+
+        :return: A dict mapping each node to its index.
+        :rtype: dict
+        """
+
+        post_order = [ ]
+        visited = set()
+        for root in itertools.chain(start_nodes, graph.nodes()):
+            if root in visited:
+                continue
+            visited.add(root)
+            stack = [ (root, iter(graph.successors(root))) ]
+            while stack:
+                node, successors = stack[-1]
+                for succ in successors:
+                    if succ not in visited:
+                        visited.add(succ)
+                        stack.append((succ, iter(graph.successors(succ))))
+                        break
+                else:
+                    stack.pop()
+                    post_order.append(node)
+
+        return { n: i for i, n in enumerate(reversed(post_order)) }
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def __contains__(self, cfg_node):
+        return cfg_node in self._jobs
+
+    def add(self, job):
+        """
+        Add a job to the work-list, unless there is already a job for its CFG node.
+
+        :param DDGJob job:  The job.
+        :return:            True if the job is added, False otherwise.
+        :rtype:             bool
+        """
+
+        if job.cfg_node in self._jobs:
+            return False
+        self._jobs[job.cfg_node] = job
+        # nodes that were added to the CFG after the order was computed go last
+        heapq.heappush(self._heap, (self._order.get(job.cfg_node, len(self._order)), id(job.cfg_node), job.cfg_node))
+        return True
+
+    def pop(self):
+        """
+        Remove the job of the first CFG node in reverse post-order from the work-list.
+
+        :return: The job.
+        :rtype: DDGJob
+        """
+
+        _, _, cfg_node = heapq.heappop(self._heap)
+        return self._jobs.pop(cfg_node)
+
+
 class LiveDefinitions(object):
     """
     A collection of live definitions with some handy interfaces for definition killing and lookups.
@@ -488,6 +569,11 @@ class DDG(Analysis):
         self.view = DDGView(self._cfg, self, simplified=False)
         self.simple_view = DDGView(self._cfg, self, simplified=True)
 
+        # Live definitions at the beginning of each CFG node, and the call depth each CFG node was processed at.
+        # They are kept after the construction, so that the graph can be updated incrementally.
+        self._live_defs_per_node = None
+        self._call_depth_per_node = None
+
         # Local variables
         self._live_defs = None
         self._temp_variables = None
@@ -618,11 +704,10 @@ class DDG(Analysis):
             return result
 
         # traverse all edges and add them to the result graph if needed
-        queue = [ pv ]
+        queue = deque([ pv ])
         traversed = set()
         while queue:
-            elem = queue[0]
-            queue = queue[1:]
+            elem = queue.popleft()
             if elem in traversed:
                 continue
             traversed.add(elem)
@@ -646,6 +731,61 @@ class DDG(Analysis):
 
         return result
 
+    def update(self, cfg_nodes):
+        """
+        Update the dependence graph after some CFG nodes have changed, for example after their states are regenerated.
+        Only def-use chains that may be affected by the change, i.e. those whose uses are in the changed nodes or in
+        nodes reachable from them, are recomputed. Everything else is kept from the previous construction.
+
+        :param iterable cfg_nodes:  The changed CFG nodes. They must be in the CFG.
+        :return:                    None
+        """
+
+        graph = self._cfg.graph
+
+        # Statements are identified by block addresses, so all nodes sharing an address with an affected node (e.g.
+        # other contexts of the same block) are affected as well
+        affected = set()
+        pending = set(n for n in cfg_nodes if n in graph)
+        while pending:
+            for n in pending:
+                affected.add(n)
+                affected |= networkx.descendants(graph, n)
+            affected_addrs = set(n.addr for n in affected)
+            pending = set(n for n in graph.nodes() if n.addr in affected_addrs and n not in affected)
+
+        if not affected:
+            return
+
+        affected_addrs = set(n.addr for n in affected)
+
+        # Remove all dependencies into the affected blocks
+        self._stmt_graph.remove_nodes_from([ cl for cl in self._stmt_graph.nodes()
+                                             if cl.block_addr in affected_addrs ])
+        for g in (self._data_graph, self._ast_graph):
+            g.remove_nodes_from([ pv for pv in g.nodes()
+                                  if isinstance(pv, ProgramVariable)
+                                  and getattr(pv.location, 'block_addr', None) in affected_addrs ])
+        self._ast_graph.remove_nodes_from([ n for n in self._ast_graph.nodes() if self._ast_graph.degree(n) == 0 ])
+        self._simplified_data_graph = None
+        self._function_data_dependencies = None
+
+        for n in affected:
+            self._live_defs_per_node.pop(n, None)
+
+        # Live definitions flowing into the affected region are regenerated by re-processing its unaffected
+        # predecessors
+        worklist = DDGWorklist(graph, self._start_nodes())
+        for n in self._start_nodes():
+            if n in affected:
+                self._worklist_append(DDGJob(n, 0), worklist)
+        for n in affected:
+            for pred in graph.predecessors(n):
+                if pred not in affected and pred in self._call_depth_per_node:
+                    worklist.add(DDGJob(pred, self._call_depth_per_node[pred]))
+
+        self._process_worklist(worklist)
+
     #
     # Private methods
     #
@@ -672,33 +812,50 @@ class DDG(Analysis):
             Well, they cannot be tracked under fastpath mode (which is the mode we are generating the CTF) anyways.
         """
 
-        worklist = []
-        worklist_set = set()
+        start_nodes = self._start_nodes()
+        worklist = DDGWorklist(self._cfg.graph, start_nodes)
 
         # Initialize the worklist
+        for n in start_nodes:
+            job = DDGJob(n, 0)
+            self._worklist_append(job, worklist)
+
+        # A dict storing defs set
+        # CFGNode -> LiveDefinition
+        self._live_defs_per_node = {}
+        self._call_depth_per_node = {}
+
+        self._process_worklist(worklist)
+
+    def _start_nodes(self):
+        """
+        Get the CFG nodes that the construction starts from.
+
+        :return: A list of CFGNodes.
+        :rtype: list
+        """
+
         if self._start is None:
             # initial nodes are those nodes in CFG that has no in-degrees
-            for n in self._cfg.graph.nodes():
-                if self._cfg.graph.in_degree(n) == 0:
-                    # Put it into the worklist
-                    job = DDGJob(n, 0)
-                    self._worklist_append(job, worklist, worklist_set)
-        else:
-            for n in self._cfg.get_all_nodes(self._start):
-                job = DDGJob(n, 0)
-                self._worklist_append(job, worklist, worklist_set)
+            return [ n for n in self._cfg.graph.nodes() if self._cfg.graph.in_degree(n) == 0 ]
+        return self._cfg.get_all_nodes(self._start)
 
-        # A dict storing defs set
-        # DDGJob -> LiveDefinition
-        live_defs_per_node = {}
+    def _process_worklist(self, worklist):
+        """
+        Process jobs in the work-list until a fixed point of live definitions is reached.
+
+        :param DDGWorklist worklist:    The work-list.
+        :return:                        None
+        """
+
+        live_defs_per_node = self._live_defs_per_node
 
         while worklist:
             # Pop out a node
-            ddg_job = worklist[0]
+            ddg_job = worklist.pop()
             l.debug("Processing %s.", ddg_job)
             node, call_depth = ddg_job.cfg_node, ddg_job.call_depth
-            worklist = worklist[ 1 : ]
-            worklist_set.remove(node)
+            self._call_depth_per_node[node] = call_depth
 
             # Grab all final states. There are usually more than one (one state for each successor), and we gotta
             # process all of them
@@ -788,7 +945,7 @@ class DDG(Analysis):
                         # Put all reachable successors back to our work-list again
                         for successor in self._cfg.get_all_successors(node):
                             nw = DDGJob(successor, new_call_depth)
-                            self._worklist_append(nw, worklist, worklist_set)
+                            self._worklist_append(nw, worklist)
 
     def _track(self, state, live_defs, statements):
         """
@@ -1393,24 +1550,19 @@ class DDG(Analysis):
 
         return graph
 
-    def _worklist_append(self, node_wrapper, worklist, worklist_set):
+    def _worklist_append(self, node_wrapper, worklist):
         """
         Append a CFGNode and its successors into the work-list, and respect the call-depth limit
 
-        :param node_wrapper:    The NodeWrapper instance to insert.
-        :param worklist:        The work-list, which is a list.
-        :param worklist_set:    A set of all CFGNodes that are inside the work-list, just for the sake of fast look-up.
-                                It will be updated as well.
-        :returns:               A set of newly-inserted CFGNodes (not NodeWrapper instances).
+        :param node_wrapper:            The NodeWrapper instance to insert.
+        :param DDGWorklist worklist:    The work-list. It will be updated as well.
+        :returns:                       A set of newly-inserted CFGNodes (not NodeWrapper instances).
         """
 
-        if node_wrapper.cfg_node in worklist_set:
+        if not worklist.add(node_wrapper):
             # It's already in the work-list
             return
 
-        worklist.append(node_wrapper)
-        worklist_set.add(node_wrapper.cfg_node)
-
         stack = [ node_wrapper ]
         traversed_nodes = { node_wrapper.cfg_node }
         inserted = { node_wrapper.cfg_node }
@@ -1424,7 +1576,7 @@ class DDG(Analysis):
 
             for _, dst, data in edges:
                 if (dst not in traversed_nodes # which means we haven't touch this node in this appending procedure
-                        and dst not in worklist_set): # which means this node is not in the work-list
+                        and dst not in worklist): # which means this node is not in the work-list
                     # We see a new node!
                     traversed_nodes.add(dst)
 
@@ -1432,21 +1584,18 @@ class DDG(Analysis):
                         if self._call_depth is None or call_depth < self._call_depth:
                             inserted.add(dst)
                             new_nw = DDGJob(dst, call_depth + 1)
-                            worklist.append(new_nw)
-                            worklist_set.add(dst)
+                            worklist.add(new_nw)
                             stack.append(new_nw)
                     elif data['jumpkind'] == 'Ijk_Ret':
                         if call_depth > 0:
                             inserted.add(dst)
                             new_nw = DDGJob(dst, call_depth - 1)
-                            worklist.append(new_nw)
-                            worklist_set.add(dst)
+                            worklist.add(new_nw)
                             stack.append(new_nw)
                     else:
                         new_nw = DDGJob(dst, call_depth)
                         inserted.add(dst)
-                        worklist_set.add(dst)
-                        worklist.append(new_nw)
+                        worklist.add(new_nw)
                         stack.append(new_nw)
 
         return inserted
@@ -4,3 +4,4 @@ from .structured_codegen import StructuredCodeGenerator
 from .clinic import Clinic
 from .region_simplifier import RegionSimplifier
 from .decompiler import Decompiler
+from .batch_decompiler import BatchDecompiler, DecompilationResult
@@ -0,0 +1,281 @@
+import concurrent.futures
+import logging
+import os
+import signal
+import time
+import traceback
+from collections import deque
+
+from .. import Analysis, AnalysesHub
+from ..batch_utils import new_worker_pool, sort_functions, worker_context
+from ..calling_convention import CallingConventionAnalysis
+
+l = logging.getLogger(name=__name__)
+
+
+class DecompilationTimeout(Exception):
+    pass
+
+
+class DecompilationResult:
+    """
+    The outcome of decompiling a single function in a batch.
+
+    :ivar int addr:         Address of the function.
+    :ivar str name:         Name of the function.
+    :ivar str text:         The decompiled code, or None if decompilation failed, or if the code was written to a file.
+    :ivar str path:         Path of the file that the decompiled code was written to, or None.
+    :ivar dict timings:     Number of seconds spent in each stage of the decompiler, in the order of the stages.
+    :ivar str error:        Description of the error that the decompilation failed with, or None.
+    """
+
+    def __init__(self, addr, name, text=None, timings=None, error=None):
+        self.addr = addr
+        self.name = name
+        self.text = text
+        self.path = None
+        self.timings = timings if timings is not None else { }
+        self.error = error
+
+    def __repr__(self):
+        if self.error is not None:
+            return "<DecompilationResult %s (%#x): failed>" % (self.name, self.addr)
+        return "<DecompilationResult %s (%#x): %.2f seconds>" % (self.name, self.addr, sum(self.timings.values()))
+
+
+def _raise_timeout(signum, frame):  # pylint:disable=unused-argument
+    raise DecompilationTimeout()
+
+
+def _decompile_function(project, kb, cfg, func, optimization_passes, timeout):
+    """
+    Run all stages of the decompiler on a function, and catch all errors that occur.
+
+    :param angr.Project project:        The project.
+    :param KnowledgeBase kb:            The knowledge base that holds the functions.
+    :param cfg:                         The CFG, or None.
+    :param knowledge.Function func:     The function.
+    :param list optimization_passes:    Optimization passes to run, or None for the default passes.
+    :param float timeout:               Number of seconds after which decompiling the function is aborted, or None.
+    :return:                            A tuple of the decompiled code, the timing of each stage, and an error.
+    :rtype:                             tuple
+    """
+
+    timings = { }
+    stage = None
+    text, error = None, None
+
+    # timeouts are implemented with SIGALRM, which is only available on UNIX and in the main thread
+    use_alarm = timeout is not None and hasattr(signal, 'setitimer')
+    if use_alarm:
+        old_handler = signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+
+    try:
+        start = time.time()
+        stage = 'Clinic'
+        clinic = project.analyses.Clinic(func, kb=kb, optimization_passes=optimization_passes)
+        timings[stage], start = time.time() - start, time.time()
+
+        stage = 'RegionIdentifier'
+        ri = project.analyses.RegionIdentifier(func, graph=clinic.graph, kb=kb)
+        timings[stage], start = time.time() - start, time.time()
+
+        stage = 'RecursiveStructurer'
+        rs = project.analyses.RecursiveStructurer(ri.region, kb=kb)
+        timings[stage], start = time.time() - start, time.time()
+
+        stage = 'RegionSimplifier'
+        s = project.analyses.RegionSimplifier(rs.result, kb=kb)
+        timings[stage], start = time.time() - start, time.time()
+
+        stage = 'StructuredCodeGenerator'
+        codegen = project.analyses.StructuredCodeGenerator(func, s.result, cfg=cfg, kb=kb)
+        timings[stage] = time.time() - start
+
+        text = codegen.text
+    except DecompilationTimeout:
+        error = "%s: timed out after %s seconds" % (stage, timeout)
+    except Exception:  # pylint:disable=broad-except
+        error = "%s: %s" % (stage, traceback.format_exc())
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, old_handler)
+
+    return text, timings, error
+
+
+def _batch_worker_decompile(func_addr, optimization_passes, timeout):
+    """
+    Decompile a function. This function is executed inside worker processes.
+
+    :param int func_addr:               Address of the function.
+    :param list optimization_passes:    Optimization passes to run, or None for the default passes.
+    :param float timeout:               Number of seconds after which decompiling the function is aborted, or None.
+    :return:                            A tuple of the decompiled code, the timing of each stage, and an error.
+    :rtype:                             tuple
+    """
+
+    project, kb, (cfg, ) = worker_context()
+    func = kb.functions.function(addr=func_addr)
+    return _decompile_function(project, kb, cfg, func, optimization_passes, timeout)
+
+
+class BatchDecompiler(Analysis):
+    """
+    Decompile many functions (by default, all functions of the binary) in worker processes.
+
+    Functions are decompiled in call-graph order, callees first. Each function is decompiled independently, so a
+    function that raises an exception, runs for longer than the timeout, or crashes its worker process is recorded as
+    a failure without affecting the other functions.
+    """
+
+    def __init__(self, cfg=None, functions=None, workers=None, output_dir=None, timeout=None,
+                 optimization_passes=None, result_callback=None):
+        """
+        :param cfg:                         The CFG (e.g., a CFGFast result) that the functions were recovered with.
+        :param functions:                   An iterable of the functions or function addresses to decompile, or None to
+                                            decompile all functions in the knowledge base.
+        :param int workers:                 Number of worker processes. None uses one process per CPU, and 0 or 1
+                                            decompiles all functions in the current process.
+        :param str output_dir:              A directory that the code of each function is written to as soon as it is
+                                            decompiled. When it is set, the code is not kept in memory.
+        :param float timeout:               Number of seconds after which decompiling a function is aborted, or None.
+        :param list optimization_passes:    Optimization passes to run, or None for the default passes.
+        :param result_callback:             A function that is called with each DecompilationResult as soon as the
+                                            function is decompiled.
+        """
+
+        self._cfg = cfg
+        self._workers = os.cpu_count() if workers is None else workers
+        self._output_dir = output_dir
+        self._timeout = timeout
+        self._optimization_passes = optimization_passes
+        self._result_callback = result_callback
+
+        if functions is None:
+            self._func_addrs = [ f.addr for f in self.kb.functions.values() ]
+        else:
+            self._func_addrs = [ f if isinstance(f, int) else f.addr for f in functions ]
+
+        self.results = { }
+
+        self._analyze()
+
+    @property
+    def failures(self):
+        """
+        Results of all functions that could not be decompiled.
+        """
+        return [ r for r in self.results.values() if r.error is not None ]
+
+    #
+    # Private methods
+    #
+
+    def _analyze(self):
+
+        order = sort_functions(self.kb, self._func_addrs)
+        if self._output_dir is not None:
+            os.makedirs(self._output_dir, exist_ok=True)
+
+        if self._workers is None or self._workers <= 1:
+            for func_addr in order:
+                func = self.kb.functions.function(addr=func_addr)
+                self._finish(func_addr, _decompile_function(self.project, self.kb, self._cfg, func,
+                                                            self._optimization_passes, self._timeout), len(order))
+        else:
+            self._decompile_in_workers(order)
+
+        self._finish_progress()
+
+    def _decompile_in_workers(self, order):
+        """
+        Decompile functions in worker processes. When a worker process dies, all functions that were being decompiled
+        at the time are retried one at a time, so that only the function that kills its worker is recorded as a failure.
+
+        :param list order:  Addresses of the functions to decompile.
+        :return:            None
+        """
+
+        CallingConventionAnalysis.recover_calling_conventions(self.project, kb=self.kb)
+
+        pending = deque(order)
+        suspects = deque()
+        in_flight = { }
+        executor = self._new_executor()
+
+        try:
+            while pending or suspects or in_flight:
+                if suspects:
+                    if not in_flight:
+                        func_addr = suspects.popleft()
+                        in_flight[self._submit(executor, func_addr)] = (func_addr, True)
+                else:
+                    while pending and len(in_flight) < self._workers * 2:
+                        func_addr = pending.popleft()
+                        in_flight[self._submit(executor, func_addr)] = (func_addr, False)
+
+                done, _ = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+                broken = False
+                for task in done:
+                    func_addr, alone = in_flight.pop(task)
+                    try:
+                        outcome = task.result()
+                    except concurrent.futures.process.BrokenProcessPool:
+                        broken = True
+                        if alone:
+                            self._finish(func_addr, (None, { }, "The worker process died."), len(order))
+                        else:
+                            suspects.append(func_addr)
+                        continue
+                    except Exception:  # pylint:disable=broad-except
+                        outcome = (None, { }, traceback.format_exc())
+                    self._finish(func_addr, outcome, len(order))
+
+                if broken:
+                    l.warning("A worker process died. Retrying %d functions one at a time.",
+                              len(suspects) + len(in_flight))
+                    suspects.extend(func_addr for func_addr, _ in in_flight.values())
+                    in_flight.clear()
+                    executor.shutdown(wait=False)
+                    executor = self._new_executor()
+        finally:
+            executor.shutdown(wait=True)
+
+    def _new_executor(self):
+        return new_worker_pool(self._workers, self.project, self.kb, self._cfg)
+
+    def _submit(self, executor, func_addr):
+        return executor.submit(_batch_worker_decompile, func_addr, self._optimization_passes, self._timeout)
+
+    def _finish(self, func_addr, outcome, total):
+        """
+        Record the result of decompiling a function, and write its code to the output directory.
+
+        :param int func_addr:   Address of the function.
+        :param tuple outcome:   A tuple of the decompiled code, the timing of each stage, and an error.
+        :param int total:       Number of functions to decompile.
+        :return:                None
+        """
+
+        text, timings, error = outcome
+        func = self.kb.functions.function(addr=func_addr)
+        result = DecompilationResult(func_addr, func.name, text=text, timings=timings, error=error)
+
+        if error is not None:
+            l.warning("Failed to decompile %s (%#x). %s", func.name, func_addr, error)
+        elif self._output_dir is not None:
+            result.path = os.path.join(self._output_dir, "%#x.c" % func_addr)
+            with open(result.path, 'w') as f:
+                f.write(text)
+            result.text = None
+
+        self.results[func_addr] = result
+        if self._result_callback is not None:
+            self._result_callback(result)
+        self._update_progress(len(self.results) * 100.0 / max(total, 1))
+
+
+AnalysesHub.register_default('BatchDecompiler', BatchDecompiler)
@@ -1,3 +1,5 @@
 
 from .reaching_definitions import ReachingDefinitionAnalysis, LiveDefinitions
 from .constants import OP_AFTER, OP_BEFORE
+from .summary import FunctionSummary, SummaryFunctionHandler
+from .interprocedural import InterproceduralReachingDefinitions
@@ -0,0 +1,177 @@
+
+class DefinitionIndex:
+    """
+    Assigns each definition a dense index, so that sets of definitions can be stored as bitsets. One index is shared by
+    all states of an analysis.
+    """
+
+    __slots__ = ('_indices', '_definitions', )
+
+    def __init__(self):
+        self._indices = {}
+        self._definitions = []
+
+    def __len__(self):
+        return len(self._definitions)
+
+    def index(self, definition):
+        """
+        Get the index of a definition, and assign a new index to it if it does not have one yet.
+
+        :param Definition definition:   The definition.
+        :return:                        Its index.
+        :rtype:                         int
+        """
+
+        try:
+            return self._indices[definition]
+        except KeyError:
+            idx = len(self._definitions)
+            self._indices[definition] = idx
+            self._definitions.append(definition)
+            return idx
+
+    def definitions(self, mask):
+        """
+        Get all definitions in a bitset.
+
+        :param int mask:    The bitset.
+        :return:            A set of definitions.
+        :rtype:             set
+        """
+
+        defs = set()
+        while mask:
+            lowest = mask & -mask
+            defs.add(self._definitions[lowest.bit_length() - 1])
+            mask ^= lowest
+        return defs
+
+
+class BitsetRegion:
+    """
+    A drop-in replacement of KeyedRegion for storing definitions. It maps each byte offset to a bitset (a Python int)
+    of the definitions covering that byte. Copies share the mapping until either of them is written to.
+
+    A Python int is dense: a bitset that holds a definition with index N takes about N/8 bytes. Bytes with the same
+    definitions (e.g., all bytes of a register) share one int object, so the cost is paid once per written object
+    rather than once per byte.
+    """
+
+    __slots__ = ('_index', '_masks', '_shared', )
+
+    def __init__(self, index, masks=None):
+        """
+        :param DefinitionIndex index:   The index of definitions.
+        :param dict masks:              A mapping from byte offsets to bitsets.
+        """
+
+        self._index = index
+        self._masks = {} if masks is None else masks
+        self._shared = False
+
+    def __contains__(self, offset):
+        return offset in self._masks
+
+    def __len__(self):
+        return len(self._masks)
+
+    def __eq__(self, other):
+        return type(other) is BitsetRegion and self._masks == other._masks
+
+    def copy(self):
+        self._shared = True
+        br = BitsetRegion(self._index, masks=self._masks)
+        br._shared = True
+        return br
+
+    def merge(self, other):
+        """
+        Merge another BitsetRegion into this BitsetRegion.
+
+        :param BitsetRegion other: The other instance to merge with.
+        :return: self
+        """
+
+        if other._masks is self._masks:
+            return self
+
+        self._make_writable()
+        masks = self._masks
+        # adjacent bytes usually share their bitsets, and then they share the merged bitset as well
+        merged = { }
+        for offset, mask in other._masks.items():
+            ours = masks.get(offset, 0)
+            if ours is mask:
+                continue
+            key = (id(ours), id(mask))
+            entry = merged.get(key, None)
+            if entry is None:
+                # the entry keeps the operands alive, so that their IDs are not reused
+                entry = merged[key] = (ours, mask, ours | mask)
+            masks[offset] = entry[2]
+
+        return self
+
+    def add_object(self, start, obj, object_size):
+        """
+        Add a definition to all bytes between start and start + object_size.
+        """
+
+        self._make_writable()
+        bit = 1 << self._index.index(obj)
+        masks = self._masks
+        added = { }
+        for offset in range(start, start + object_size):
+            mask = masks.get(offset, 0)
+            entry = added.get(id(mask), None)
+            if entry is None:
+                entry = added[id(mask)] = (mask, mask | bit)
+            masks[offset] = entry[1]
+
+    def set_object(self, start, obj, object_size):
+        """
+        Replace all definitions of the bytes between start and start + object_size with a definition.
+        """
+
+        self._make_writable()
+        bit = 1 << self._index.index(obj)
+        masks = self._masks
+        for offset in range(start, start + object_size):
+            masks[offset] = bit
+
+    def get_objects_by_offset(self, start):
+        """
+        Find definitions covering the given offset.
+
+        :param int start:
+        :return: A set of definitions.
+        :rtype:  set
+        """
+
+        mask = self._masks.get(start, 0)
+        if not mask:
+            return set()
+        return self._index.definitions(mask)
+
+    def get_all_objects(self):
+        """
+        Get all definitions in this region.
+
+        :return: A set of definitions.
+        :rtype:  set
+        """
+
+        mask = 0
+        for m in self._masks.values():
+            mask |= m
+        return self._index.definitions(mask)
+
+    #
+    # Private methods
+    #
+
+    def _make_writable(self):
+        if self._shared:
+            self._masks = dict(self._masks)
+            self._shared = False
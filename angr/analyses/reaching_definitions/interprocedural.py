@@ -0,0 +1,377 @@
+import concurrent.futures
+import logging
+import os
+import traceback
+from collections import deque
+
+import networkx
+
+from ...calling_conventions import DEFAULT_CC, SimRegArg
+from ...engines.light import SpOffset
+from ...keyed_region import KeyedRegion
+from .. import register_analysis
+from ..analysis import Analysis
+from ..batch_utils import new_worker_pool, worker_context
+from .atoms import Register, MemoryLocation, Parameter
+from .bitset_region import DefinitionIndex
+from .constants import OP_AFTER
+from .dataset import DataSet
+from .definition import Definition
+from .reaching_definitions import LiveDefinitions
+from .summary import FunctionSummary, SummaryFunctionHandler
+
+l = logging.getLogger(name=__name__)
+
+
+def _all_definitions(region):
+    if isinstance(region, KeyedRegion):
+        defs = set()
+        for ro in region:
+            defs |= ro.internal_objects
+        return defs
+    return region.get_all_objects()
+
+
+def _summarize_function(project, kb, func, function_handler, max_iterations, use_bitsets, stack_args):
+    """
+    Run ReachingDefinitionAnalysis on a function, with the summaries of its callees applied at call sites, and
+    summarize the result.
+
+    :param angr.Project project:        The project.
+    :param KnowledgeBase kb:            The knowledge base that holds the function and the summaries of its callees.
+    :param knowledge.Function func:     The function.
+    :param function_handler:            The function handler for calls without a summary, or None.
+    :param int max_iterations:          The maximum number of iterations of each node.
+    :param bool use_bitsets:            Whether live definitions are stored as bitsets.
+    :param int stack_args:              Number of stack slots above the return address that are treated as inputs.
+    :return:                            The summary.
+    :rtype:                             FunctionSummary
+    """
+
+    arch = project.arch
+    cc = func.calling_convention
+    default_cc = DEFAULT_CC[arch.name](arch) if arch.name in DEFAULT_CC else None
+
+    state = LiveDefinitions(arch, project.loader, init_func=True, cc=cc, func_addr=func.addr,
+                            def_index=DefinitionIndex() if use_bitsets else None)
+
+    # every argument register and stack slot holds a parameter, so that reading it is recorded as a use
+    stack_base = None
+    if default_cc is not None:
+        for reg_name in default_cc.ARG_REGS or [ ]:
+            offset, size = arch.registers[reg_name]
+            if not state.register_definitions.get_objects_by_offset(offset):
+                reg = Register(offset, size)
+                state.register_definitions.set_object(offset, Definition(reg, None, DataSet(Parameter(reg), size * 8)),
+                                                      size)
+        stack_base = default_cc.STACKARG_SP_DIFF + default_cc.STACKARG_SP_BUFF
+        for i in range(stack_args):
+            offset = stack_base + i * arch.bytes
+            addr = arch.initial_sp + offset
+            if not state.memory_definitions.get_objects_by_offset(addr):
+                ml = MemoryLocation(addr, arch.bytes)
+                state.memory_definitions.set_object(addr, Definition(ml, None, DataSet(Parameter(
+                    SpOffset(arch.bits, offset)), arch.bits)), arch.bytes)
+    inputs = _all_definitions(state.register_definitions) | _all_definitions(state.memory_definitions)
+
+    ret_addrs = set(n.addr for n in func.ret_sites)
+    observation_points = [ ('node', addr, OP_AFTER) for addr in ret_addrs ]
+    rda = project.analyses.ReachingDefinitions(func=func, init_state=state, max_iterations=max_iterations,
+                                               observation_points=observation_points,
+                                               function_handler=SummaryFunctionHandler(kb.function_summaries,
+                                                                                       function_handler),
+                                               kb=kb)
+    exit_states = [ s for (_, addr, _), s in rda.observed_results.items() if addr in ret_addrs ]
+
+    return_register = None
+    ret_cc = cc if cc is not None else default_cc
+    ret_val = ret_cc.RETURN_VAL if ret_cc is not None else None
+    if isinstance(ret_val, SimRegArg):
+        return_register = Register(*arch.registers[ret_val.reg_name])
+
+    summary = FunctionSummary(func.addr, return_register=return_register)
+    for exit_state in exit_states:
+        for d in inputs:
+            if type(d.atom) is Register:
+                if d.atom.reg_offset != arch.sp_offset and exit_state.register_uses.get_uses(d):
+                    summary.used_registers.add(d.atom)
+            elif type(d.atom) is MemoryLocation and exit_state.memory_uses.get_uses(d):
+                summary.used_stack.add((d.atom.addr - arch.initial_sp, d.atom.size))
+
+        for d in _all_definitions(exit_state.register_definitions):
+            if d.codeloc is None or d.atom.reg_offset in (arch.sp_offset, arch.ip_offset):
+                continue
+            _add_data(summary.defined_registers, d.atom, d.data)
+
+        for d in _all_definitions(exit_state.memory_definitions):
+            if d.codeloc is None or type(d.atom.addr) is not int:
+                continue
+            offset = d.atom.addr - arch.initial_sp
+            # only slots in the frame of the caller outlive the function
+            if stack_base is not None and 0 <= offset - stack_base < stack_args * arch.bytes:
+                _add_data(summary.defined_stack, (offset, d.atom.size), d.data)
+
+    return summary
+
+
+def _add_data(values, key, data):
+    if key in values:
+        values[key] = DataSet(values[key].data | data.data, values[key].bits)
+    else:
+        values[key] = DataSet(set(data.data), data.bits)
+
+
+def _ipa_worker_summarize(func_addrs, callee_summaries, max_iterations, use_bitsets, stack_args, scc_iterations):
+    """
+    Summarize all functions of a strongly connected component of the call graph. This function is executed inside
+    worker processes.
+
+    :param list func_addrs:         Addresses of the functions in the component.
+    :param dict callee_summaries:   Summaries of the functions that the component calls.
+    :return:                        A dict of summaries of the functions in the component.
+    :rtype:                         dict
+    """
+
+    project, kb, (function_handler, ) = worker_context()
+    kb.function_summaries.update(callee_summaries)
+    return _summarize_component(project, kb, func_addrs, function_handler, max_iterations, use_bitsets, stack_args,
+                                scc_iterations)
+
+
+def _summarize_component(project, kb, func_addrs, function_handler, max_iterations, use_bitsets, stack_args,
+                         scc_iterations):
+    """
+    Summarize all functions of a strongly connected component of the call graph. Functions that call each other are
+    summarized repeatedly until their summaries do not change, or until scc_iterations rounds are done.
+
+    :return: A dict of summaries of the functions in the component.
+    :rtype: dict
+    """
+
+    summaries = { }
+    rounds = 1 if len(func_addrs) == 1 and func_addrs[0] not in kb.functions.callgraph[func_addrs[0]] \
+        else scc_iterations
+    for _ in range(rounds):
+        changed = False
+        for func_addr in func_addrs:
+            func = kb.functions.function(addr=func_addr)
+            summary = _summarize_function(project, kb, func, function_handler, max_iterations, use_bitsets,
+                                          stack_args)
+            if summaries.get(func_addr, None) != summary:
+                changed = True
+            summaries[func_addr] = summary
+            kb.function_summaries[func_addr] = summary
+        if not changed:
+            break
+
+    return summaries
+
+
+class InterproceduralReachingDefinitions(Analysis):
+    """
+    Compute a FunctionSummary for each function (by default, all functions of the binary) by running
+    ReachingDefinitionAnalysis on the call graph bottom-up. The summaries of callees are applied at call sites instead
+    of analyzing the callees again. Summaries are stored in kb.function_summaries, and functions that already have a
+    summary there are not analyzed again.
+
+    Strongly connected components of the call graph that do not depend on each other may be summarized in parallel in
+    worker processes. If summarizing a component fails or kills its worker process, the error is recorded in `failures`
+    for each of its functions, and its callers are summarized without its summaries.
+    """
+
+    def __init__(self, functions=None, workers=1, function_handler=None, max_iterations=3, use_bitsets=True,
+                 stack_args=8, scc_iterations=3, recompute=False):
+        """
+        :param functions:               An iterable of the functions or function addresses to summarize, or None to
+                                        summarize all functions in the knowledge base.
+        :param int workers:             Number of worker processes. None uses one process per CPU, and 0 or 1
+                                        summarizes all functions in the current process.
+        :param function_handler:        A function handler for calls to functions without a summary, e.g., external
+                                        functions. It must be picklable when workers are used.
+        :param int max_iterations:      The maximum number of iterations of each node in each function.
+        :param bool use_bitsets:        Whether live definitions are stored as bitsets.
+        :param int stack_args:          Number of stack slots above the return address that are treated as inputs.
+        :param int scc_iterations:      The maximum number of times the functions of a recursive component are
+                                        summarized.
+        :param bool recompute:          Summarize functions again even if they already have a summary.
+        """
+
+        self._workers = os.cpu_count() if workers is None else workers
+        self._function_handler = function_handler
+        self._max_iterations = max_iterations
+        self._use_bitsets = use_bitsets
+        self._stack_args = stack_args
+        self._scc_iterations = scc_iterations
+        self._recompute = recompute
+
+        if functions is None:
+            func_addrs = [ f.addr for f in self.kb.functions.values() ]
+        else:
+            func_addrs = [ f if isinstance(f, int) else f.addr for f in functions ]
+        self._func_addrs = [ addr for addr in func_addrs
+                             if not self.kb.functions.function(addr=addr).is_simprocedure ]
+
+        self.summaries = { }
+        self.failures = { }
+
+        self._analyze()
+
+    #
+    # Private methods
+    #
+
+    def _components(self):
+        """
+        Get the strongly connected components of the call graph, and find the ones that need summarizing. Summaries of
+        the other components are taken from the knowledge base.
+
+        :return: A tuple of the condensed call graph and a set of components that need summarizing.
+        :rtype: tuple
+        """
+
+        callgraph = self.kb.functions.callgraph.subgraph(self._func_addrs)
+        condensed = networkx.condensation(callgraph)
+        todo = set()
+        for c in condensed.nodes():
+            members = condensed.nodes[c]['members']
+            if self._recompute or any(addr not in self.kb.function_summaries for addr in members):
+                todo.add(c)
+            else:
+                for addr in members:
+                    self.summaries[addr] = self.kb.function_summaries[addr]
+
+        return condensed, todo
+
+    def _analyze(self):
+
+        condensed, todo = self._components()
+        total = len(todo)
+        # a component is ready when all components that it calls have been summarized
+        waiting = {c: set(s for s in condensed.successors(c) if s in todo) for c in todo}
+        ready = [ c for c, deps in waiting.items() if not deps ]
+
+        def _finish(c, summaries, error=None):
+            if error is not None:
+                members = condensed.nodes[c]['members']
+                l.warning("Failed to summarize functions %s. %s", ", ".join("%#x" % addr for addr in members), error)
+                for addr in members:
+                    self.failures[addr] = error
+            self.summaries.update(summaries)
+            self.kb.function_summaries.update(summaries)
+            todo.discard(c)
+            for pred in condensed.predecessors(c):
+                if pred in waiting:
+                    waiting[pred].discard(c)
+                    if not waiting[pred]:
+                        ready.append(pred)
+            self._update_progress((total - len(todo)) * 100.0 / max(total, 1))
+
+        if self._workers is None or self._workers <= 1:
+            while ready:
+                c = ready.pop()
+                members = self._sort_members(condensed, c)
+                try:
+                    summaries = _summarize_component(self.project, self.kb, members, self._function_handler,
+                                                     self._max_iterations, self._use_bitsets, self._stack_args,
+                                                     self._scc_iterations)
+                except Exception:  # pylint:disable=broad-except
+                    # summaries of functions in the component that were computed before the failure are dropped
+                    for addr in members:
+                        self.kb.function_summaries.pop(addr, None)
+                    _finish(c, { }, error=traceback.format_exc())
+                else:
+                    _finish(c, summaries)
+        else:
+            self._summarize_in_workers(condensed, ready, _finish)
+
+        self._finish_progress()
+
+    def _summarize_in_workers(self, condensed, ready, finish):
+        """
+        Summarize components in worker processes. When a worker process dies, all components that were being
+        summarized at the time are retried one at a time, so that only the component that kills its worker is recorded
+        as a failure.
+
+        :param condensed:   The condensed call graph.
+        :param list ready:  Components that are ready to be summarized. finish() appends the components that become
+                            ready.
+        :param finish:      A function that is called with each component, its summaries, and an error.
+        :return:            None
+        """
+
+        suspects = deque()
+        in_flight = { }
+        executor = self._new_executor()
+
+        try:
+            while ready or suspects or in_flight:
+                broken = False
+                try:
+                    if suspects:
+                        if not in_flight:
+                            c = suspects.popleft()
+                            in_flight[self._submit(executor, condensed, c)] = (c, True)
+                    else:
+                        while ready:
+                            c = ready.pop()
+                            in_flight[self._submit(executor, condensed, c)] = (c, False)
+                except concurrent.futures.process.BrokenProcessPool:
+                    # the pool broke before the component was submitted
+                    broken = True
+                    suspects.appendleft(c)
+
+                if in_flight and not broken:
+                    done, _ = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for task in done:
+                        c, alone = in_flight.pop(task)
+                        try:
+                            summaries = task.result()
+                        except concurrent.futures.process.BrokenProcessPool:
+                            broken = True
+                            if alone:
+                                finish(c, { }, error="The worker process died.")
+                            else:
+                                suspects.append(c)
+                            continue
+                        except Exception:  # pylint:disable=broad-except
+                            finish(c, { }, error=traceback.format_exc())
+                            continue
+                        finish(c, summaries)
+
+                if broken:
+                    l.warning("A worker process died. Retrying %d components one at a time.",
+                              len(suspects) + len(in_flight))
+                    suspects.extend(c for c, _ in in_flight.values())
+                    in_flight.clear()
+                    executor.shutdown(wait=False)
+                    executor = self._new_executor()
+        finally:
+            executor.shutdown(wait=True)
+
+    def _new_executor(self):
+        return new_worker_pool(self._workers, self.project, self.kb, self._function_handler)
+
+    def _submit(self, executor, condensed, c):
+        members = self._sort_members(condensed, c)
+        callees = set()
+        for addr in members:
+            callees.update(self.kb.functions.callgraph.successors(addr))
+        callee_summaries = {addr: self.kb.function_summaries[addr] for addr in callees
+                            if addr in self.kb.function_summaries}
+        return executor.submit(_ipa_worker_summarize, members, callee_summaries, self._max_iterations,
+                               self._use_bitsets, self._stack_args, self._scc_iterations)
+
+    def _sort_members(self, condensed, c):
+        """
+        Order the functions of a component, so that callees come before their callers as far as possible.
+        """
+
+        members = condensed.nodes[c]['members']
+        if len(members) == 1:
+            return list(members)
+        subgraph = self.kb.functions.callgraph.subgraph(members)
+        order = list(networkx.dfs_postorder_nodes(subgraph))
+        return order
+
+
+register_analysis(InterproceduralReachingDefinitions, "InterproceduralReachingDefinitions")
@@ -15,6 +15,7 @@ from ..analysis import Analysis
 from ..forward_analysis import ForwardAnalysis, FunctionGraphVisitor, SingleNodeGraphVisitor
 from ..code_location import CodeLocation
 from .atoms import Register, MemoryLocation, Tmp, Parameter
+from .bitset_region import BitsetRegion, DefinitionIndex
 from .constants import OP_BEFORE, OP_AFTER
 from .dataset import DataSet
 from .definition import Definition
@@ -28,17 +29,23 @@ l = logging.getLogger(name=__name__)
 
 
 class LiveDefinitions:
-    def __init__(self, arch, loader, track_tmps=False, analysis=None, init_func=False, cc=None, func_addr=None):
+    def __init__(self, arch, loader, track_tmps=False, analysis=None, init_func=False, cc=None, func_addr=None,
+                 def_index=None):
+        """
+        :param DefinitionIndex def_index:   When specified, definitions are stored in BitsetRegions that are indexed
+                                            by it instead of in KeyedRegions.
+        """
 
         # handy short-hands
         self.arch = arch
         self.loader = loader
         self._track_tmps = track_tmps
         self.analysis = analysis
+        self._def_index = def_index
 
-        self.register_definitions = KeyedRegion()  # register region
-        self.stack_definitions = KeyedRegion()  # stack region
-        self.memory_definitions = KeyedRegion()  # non-stack memory region
+        self.register_definitions = self._new_region()  # register region
+        self.stack_definitions = self._new_region()  # stack region
+        self.memory_definitions = self._new_region()  # non-stack memory region
         self.tmp_definitions = {}
 
         if init_func:
@@ -61,6 +68,11 @@ class LiveDefinitions:
             ctnt += ", %d tmpdefs" % len(self.tmp_definitions)
         return "<%s>" % ctnt
 
+    def _new_region(self):
+        if self._def_index is not None:
+            return BitsetRegion(self._def_index)
+        return KeyedRegion()
+
     def _init_func(self, cc, func_addr):
         # initialize stack pointer
         sp = Register(self.arch.sp_offset, self.arch.bytes)
@@ -112,6 +124,7 @@ class LiveDefinitions:
             track_tmps=self._track_tmps,
             analysis=self.analysis,
             init_func=False,
+            def_index=self._def_index,
         )
 
         rd.register_definitions = self.register_definitions.copy()
@@ -284,7 +297,7 @@ class ReachingDefinitionAnalysis(ForwardAnalysis, Analysis):  # pylint:disable=a
 
     def __init__(self, func=None, block=None, func_graph=None, max_iterations=3, track_tmps=False,
                  observation_points=None, init_state=None, init_func=False, cc=None, function_handler=None,
-                 current_local_call_depth=1, maximum_local_call_depth=5, observe_all=False):
+                 current_local_call_depth=1, maximum_local_call_depth=5, observe_all=False, use_bitsets=False):
         """
 
         :param angr.knowledge.Function func:    The function to run reaching definition analysis on.
@@ -306,6 +319,9 @@ class ReachingDefinitionAnalysis(ForwardAnalysis, Analysis):  # pylint:disable=a
         :param int current_local_call_depth:    Current local function recursion depth.
         :param int maximum_local_call_depth:    Maximum local function recursion depth.
         :param bool observa_all:                Observe every statement, both before and after.
+        :param bool use_bitsets:                Store live definitions as bitsets over a per-analysis index of
+                                                definitions, which makes copying and merging states cheaper. It has
+                                                no effect on `init_state`.
         """
 
         if func is not None:
@@ -347,6 +363,7 @@ class ReachingDefinitionAnalysis(ForwardAnalysis, Analysis):  # pylint:disable=a
             self._func_addr = None
 
         self._observe_all = observe_all
+        self._def_index = DefinitionIndex() if use_bitsets else None
 
         # sanity check
         if self._observation_points and any(not type(op) is tuple for op in self._observation_points):
@@ -439,7 +456,8 @@ class ReachingDefinitionAnalysis(ForwardAnalysis, Analysis):  # pylint:disable=a
             return self._init_state
         else:
             return LiveDefinitions(self.project.arch, self.project.loader, track_tmps=self._track_tmps,
-                                   analysis=self, init_func=self._init_func, cc=self._cc, func_addr=self._func_addr)
+                                   analysis=self, init_func=self._init_func, cc=self._cc, func_addr=self._func_addr,
+                                   def_index=self._def_index)
 
     def _merge_states(self, node, *states):
         return states[0].merge(*states[1:])
@@ -0,0 +1,193 @@
+import logging
+
+from ...engines.light import SpOffset
+from .atoms import Register, MemoryLocation, Parameter
+from .dataset import DataSet
+from .undefined import Undefined
+
+l = logging.getLogger(name=__name__)
+
+
+class FunctionSummary:
+    """
+    A compact summary of the reaching definitions of a function, which can be applied at its call sites instead of
+    analyzing the function again.
+
+    Stack slots are identified by their offsets from the stack pointer at the entry of the function. Values that the
+    function computes from its inputs are given as Parameter instances of the input registers or stack slots.
+
+    :ivar int func_addr:            Address of the function.
+    :ivar set used_registers:       Register atoms that are read before they are defined in the function.
+    :ivar dict defined_registers:   Register atoms that are defined in the function, mapped to a DataSet of their values
+                                    when the function returns.
+    :ivar set used_stack:           Tuples of (offset, size) of stack slots in the frame of the caller that are read
+                                    before they are defined in the function.
+    :ivar dict defined_stack:       Tuples of (offset, size) of stack slots in the frame of the caller that are defined
+                                    in the function, mapped to a DataSet of their values when the function returns.
+    :ivar Register return_register: The register that holds the return value, or None.
+    """
+
+    __slots__ = ('func_addr', 'used_registers', 'defined_registers', 'used_stack', 'defined_stack',
+                 'return_register', )
+
+    def __init__(self, func_addr, used_registers=None, defined_registers=None, used_stack=None, defined_stack=None,
+                 return_register=None):
+        self.func_addr = func_addr
+        self.used_registers = set() if used_registers is None else used_registers
+        self.defined_registers = {} if defined_registers is None else defined_registers
+        self.used_stack = set() if used_stack is None else used_stack
+        self.defined_stack = {} if defined_stack is None else defined_stack
+        self.return_register = return_register
+
+    def __repr__(self):
+        return "<FunctionSummary %#x: %d regs used, %d regs defined, %d stack slots used, %d stack slots defined>" % (
+            self.func_addr, len(self.used_registers), len(self.defined_registers), len(self.used_stack),
+            len(self.defined_stack))
+
+    def __eq__(self, other):
+        return type(other) is FunctionSummary and \
+               self.func_addr == other.func_addr and \
+               self.used_registers == other.used_registers and \
+               self.used_stack == other.used_stack and \
+               self.return_register == other.return_register and \
+               self._values_repr(self.defined_registers) == self._values_repr(other.defined_registers) and \
+               self._values_repr(self.defined_stack) == self._values_repr(other.defined_stack)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __getstate__(self):
+        return tuple(getattr(self, k) for k in self.__slots__)
+
+    def __setstate__(self, s):
+        for k, v in zip(self.__slots__, s):
+            setattr(self, k, v)
+
+    @property
+    def return_values(self):
+        """
+        The values that the function may return, or None if the return register is not defined in the function.
+
+        :rtype: DataSet
+        """
+
+        if self.return_register is None:
+            return None
+        return self.defined_registers.get(self.return_register, None)
+
+    @staticmethod
+    def _values_repr(values):
+        # DataSet and Undefined do not define equality
+        return {k: sorted(repr(d) for d in v.data) for k, v in values.items()}
+
+
+class SummaryFunctionHandler:
+    """
+    A function handler for ReachingDefinitionAnalysis that applies the summaries of local functions at their call
+    sites. Calls to functions without a summary, as well as all other handlers, are delegated to another function
+    handler.
+    """
+
+    def __init__(self, summaries, handler=None):
+        """
+        :param dict summaries:  Function summaries, keyed by function address.
+        :param handler:         The function handler to delegate to, or None.
+        """
+
+        self._summaries = summaries
+        self._handler = handler
+
+    def __getattr__(self, item):
+        if item.startswith('__') or item in ('_summaries', '_handler'):
+            raise AttributeError(item)
+        return getattr(self._handler, item)
+
+    def handle_local_function(self, state, func_addr, current_local_call_depth, maximum_local_call_depth,
+                              codeloc=None):
+        summary = self._summaries.get(func_addr, None)
+        if summary is None or codeloc is None:
+            if hasattr(self._handler, 'handle_local_function'):
+                if codeloc is None:
+                    return self._handler.handle_local_function(state, func_addr, current_local_call_depth,
+                                                               maximum_local_call_depth)
+                return self._handler.handle_local_function(state, func_addr, current_local_call_depth,
+                                                           maximum_local_call_depth, codeloc)
+            return False, state
+
+        self.apply(summary, state, codeloc)
+        # the summary does not cover the stack pointer, so the engine still pops the return address
+        return False, state
+
+    @staticmethod
+    def apply(summary, state, codeloc):
+        """
+        Apply a function summary to the state at a call site.
+
+        :param FunctionSummary summary:     The summary of the callee.
+        :param LiveDefinitions state:       The state right before the call, which is updated in place.
+        :param CodeLocation codeloc:        Location of the call.
+        :return:                            None
+        """
+
+        arch = state.arch
+        sp = SummaryFunctionHandler._stack_pointer(state)
+
+        # inputs are translated with the definitions before the call
+        defined_registers = {atom: SummaryFunctionHandler._translate(data, state, sp)
+                             for atom, data in summary.defined_registers.items()}
+        defined_stack = {slot: SummaryFunctionHandler._translate(data, state, sp)
+                         for slot, data in summary.defined_stack.items()}
+
+        for atom in summary.used_registers:
+            state.add_use(atom, codeloc)
+        if sp is not None:
+            for offset, size in summary.used_stack:
+                state.add_use(MemoryLocation(sp + offset, size), codeloc)
+        elif summary.used_stack or summary.defined_stack:
+            l.debug('Ignoring stack slots of the summary of %#x: unknown stack pointer.', summary.func_addr)
+
+        for atom, data in defined_registers.items():
+            if atom.reg_offset in (arch.sp_offset, arch.ip_offset):
+                continue
+            state.kill_and_add_definition(atom, codeloc, data)
+        if sp is not None:
+            for (offset, size), data in defined_stack.items():
+                state.kill_and_add_definition(MemoryLocation(sp + offset, size), codeloc, data)
+
+    #
+    # Private methods
+    #
+
+    @staticmethod
+    def _stack_pointer(state):
+        defs_sp = state.register_definitions.get_objects_by_offset(state.arch.sp_offset)
+        values = set()
+        for d in defs_sp:
+            values.update(d.data)
+        if len(values) != 1:
+            return None
+        sp = next(iter(values))
+        return sp if isinstance(sp, int) else None
+
+    @staticmethod
+    def _translate(data, state, sp):
+        """
+        Replace the parameters of the callee in a DataSet with the values that the caller passes.
+        """
+
+        values = set()
+        for v in data.data:
+            if type(v) is Parameter:
+                current_defs = set()
+                if type(v.value) is Register:
+                    current_defs = state.register_definitions.get_objects_by_offset(v.value.reg_offset)
+                elif type(v.value) is SpOffset and sp is not None and type(v.value.offset) is int:
+                    current_defs = state.memory_definitions.get_objects_by_offset(sp + v.value.offset)
+                for d in current_defs:
+                    values.update(d.data)
+                if not current_defs:
+                    values.add(Undefined(data.bits))
+            else:
+                values.add(v)
+
+        return DataSet(values, data.bits)
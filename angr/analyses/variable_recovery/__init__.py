@@ -2,3 +2,4 @@
 
 from .variable_recovery import VariableRecovery
 from .variable_recovery_fast import VariableRecoveryFast
+from .variable_recovery_batch import VariableRecoveryBatch, VariableRecoveryCache
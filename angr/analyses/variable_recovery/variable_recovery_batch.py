@@ -0,0 +1,274 @@
+import concurrent.futures
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+import traceback
+
+from ...errors import AngrVariableRecoveryError
+from .. import Analysis, AnalysesHub
+from ..batch_utils import new_worker_pool, sort_functions, worker_context
+from ..calling_convention import CallingConventionAnalysis
+
+l = logging.getLogger(name=__name__)
+
+
+class VariableRecoveryCache:
+    """
+    An on-disk cache of the variables that VariableRecoveryFast recovers, with one file per function in a directory.
+
+    Entries are keyed by a hash of the architecture, the addresses and bytes of all blocks of a function, its callees,
+    and the parameters of the analysis. Callees are identified by their own keys, or by their addresses and calling
+    conventions if they have no key, so a change to a function invalidates the entries of all its callers along the
+    call graph. Hence after a binary is updated, only functions whose code or callees changed miss the cache. Multiple
+    processes may use the same directory at the same time.
+    """
+
+    CACHE_VERSION = 2
+
+    def __init__(self, path):
+        """
+        :param str path:    Path to the cache directory. It will be created if it does not exist.
+        """
+
+        self.path = path
+
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(self.path, exist_ok=True)
+
+    def __repr__(self):
+        return "<VariableRecoveryCache %s: %d hits, %d misses>" % (self.path, self.hits, self.misses)
+
+    def key(self, project, func, max_iterations, callee_keys=None):
+        """
+        Compute the cache key of a function.
+
+        :param angr.Project project:        The project.
+        :param knowledge.Function func:     The function.
+        :param int max_iterations:          The maximum number of iterations of VariableRecoveryFast.
+        :param dict callee_keys:            Keys of callees that are computed already, keyed by function address.
+        :return:                            The key, or None if the bytes of the function cannot be loaded.
+        :rtype:                             str
+        """
+
+        h = hashlib.sha256()
+        h.update(("%d|%s|%#x|%d" % (self.CACHE_VERSION, project.arch.name, func.addr, max_iterations)).encode())
+        for block in sorted(func.blocks, key=lambda b: b.addr):
+            try:
+                data = project.loader.memory.load(block.addr, block.size)
+            except KeyError:
+                return None
+            h.update(("|%#x:%d|" % (block.addr, block.size)).encode())
+            h.update(data)
+
+        functions = func._function_manager
+        for callee_addr in sorted(set(functions.callgraph.successors(func.addr))):
+            callee_key = callee_keys.get(callee_addr, None) if callee_keys is not None else None
+            if callee_key is None:
+                # e.g., SimProcedures, and callees in the same strongly connected component
+                callee = functions.function(addr=callee_addr)
+                callee_key = "%#x:%s" % (callee_addr, self._cc_repr(callee.calling_convention if callee is not None
+                                                                    else None))
+            h.update(("|call %s|" % callee_key).encode())
+        return h.hexdigest()
+
+    def load(self, key):
+        """
+        Load the variables of a function.
+
+        :param str key: The cache key of the function.
+        :return:        The VariableManagerInternal object of the function, or None if it is not cached.
+        """
+
+        try:
+            with open(self._file(key), 'rb') as f:
+                manager = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return manager
+
+    def store(self, key, manager):
+        """
+        Store the variables of a function.
+
+        :param str key:                         The cache key of the function.
+        :param VariableManagerInternal manager: The VariableManagerInternal object of the function.
+        :return:                                None
+        """
+
+        # write to a temporary file first, so that other processes never see a partially written entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(manager, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._file(key))
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+    #
+    # Private methods
+    #
+
+    @staticmethod
+    def _cc_repr(cc):
+        if cc is None:
+            return "None"
+        return "%s(%s)->%s,%s" % (type(cc).__name__, cc.args, cc.ret_val, cc.func_ty)
+
+    def _file(self, key):
+        return os.path.join(self.path, key + '.pickle')
+
+
+def _recover_variables(project, kb, func, max_iterations):
+    """
+    Run VariableRecoveryFast on a function, and catch all errors that occur.
+
+    :return: A tuple of the VariableManagerInternal object of the function, and an error.
+    :rtype: tuple
+    """
+
+    try:
+        project.analyses.VariableRecoveryFast(func, kb=kb, max_iterations=max_iterations)
+    except AngrVariableRecoveryError as ex:
+        return None, str(ex)
+    except Exception:  # pylint:disable=broad-except
+        return None, traceback.format_exc()
+    return kb.variables[func.addr], None
+
+
+def _batch_worker_recover(func_addr, max_iterations):
+    """
+    Recover variables of a function. This function is executed inside worker processes.
+
+    :param int func_addr:       Address of the function.
+    :param int max_iterations:  The maximum number of iterations of VariableRecoveryFast.
+    :return:                    A tuple of the VariableManagerInternal object of the function, and an error.
+    :rtype:                     tuple
+    """
+
+    project, kb, _ = worker_context()
+    func = kb.functions.function(addr=func_addr)
+    outcome = _recover_variables(project, kb, func, max_iterations)
+    # the worker only needs the variables of a function once
+    kb.variables.function_managers.pop(func_addr, None)
+    return outcome
+
+
+class VariableRecoveryBatch(Analysis):
+    """
+    Run VariableRecoveryFast on many functions (by default, all functions of the binary) in worker processes, and
+    merge the recovered variables into kb.variables.
+
+    With a cache directory, the variables of each function are stored on disk, keyed by the bytes of the function.
+    Running the analysis again after the binary is updated only recovers variables of functions that changed.
+    """
+
+    def __init__(self, functions=None, workers=None, cache_dir=None, max_iterations=3):
+        """
+        :param functions:           An iterable of the functions or function addresses to analyze, or None to analyze
+                                    all functions in the knowledge base.
+        :param int workers:         Number of worker processes. None uses one process per CPU, and 0 or 1 analyzes all
+                                    functions in the current process.
+        :param str cache_dir:       A directory to cache recovered variables in, or None.
+        :param int max_iterations:  The maximum number of iterations of VariableRecoveryFast.
+        """
+
+        self._workers = os.cpu_count() if workers is None else workers
+        self._max_iterations = max_iterations
+        self.cache = VariableRecoveryCache(cache_dir) if cache_dir is not None else None
+
+        if functions is None:
+            func_addrs = [ f.addr for f in self.kb.functions.values() ]
+        else:
+            func_addrs = [ f if isinstance(f, int) else f.addr for f in functions ]
+        self._func_addrs = func_addrs
+
+        self.recovered = set()
+        self.cached = set()
+        self.failures = { }
+
+        self._analyze()
+
+    #
+    # Private methods
+    #
+
+    def _analyze(self):
+
+        order = sort_functions(self.kb, self._func_addrs)
+
+        keys = { }
+        todo = [ ]
+        for func_addr in order:
+            key = None
+            if self.cache is not None:
+                # callees come first, so callers include the keys of their callees
+                key = self.cache.key(self.project, self.kb.functions.function(addr=func_addr), self._max_iterations,
+                                     callee_keys=keys)
+            keys[func_addr] = key
+            manager = self.cache.load(key) if key is not None else None
+            if manager is not None:
+                self.kb.variables.set_function_manager(func_addr, manager)
+                self.cached.add(func_addr)
+            else:
+                todo.append(func_addr)
+
+        total = len(order)
+        done = len(self.cached)
+
+        # VariableRecoveryFast uses the calling conventions of callees
+        if todo:
+            CallingConventionAnalysis.recover_calling_conventions(self.project, kb=self.kb)
+
+        if self._workers is None or self._workers <= 1:
+            for func_addr in todo:
+                func = self.kb.functions.function(addr=func_addr)
+                self._finish(func_addr, keys[func_addr], _recover_variables(self.project, self.kb, func,
+                                                                            self._max_iterations))
+                done += 1
+                self._update_progress(done * 100.0 / max(total, 1))
+        else:
+            with new_worker_pool(self._workers, self.project, self.kb) as executor:
+                tasks = {executor.submit(_batch_worker_recover, func_addr, self._max_iterations): func_addr
+                         for func_addr in todo}
+                for task in concurrent.futures.as_completed(tasks):
+                    func_addr = tasks[task]
+                    try:
+                        outcome = task.result()
+                    except Exception:  # pylint:disable=broad-except
+                        outcome = (None, traceback.format_exc())
+                    self._finish(func_addr, keys[func_addr], outcome)
+                    done += 1
+                    self._update_progress(done * 100.0 / max(total, 1))
+
+        self._finish_progress()
+
+    def _finish(self, func_addr, key, outcome):
+        """
+        Merge the variables of a function into the knowledge base, and store them in the cache.
+
+        :param int func_addr:   Address of the function.
+        :param str key:         The cache key of the function, or None.
+        :param tuple outcome:   A tuple of the VariableManagerInternal object of the function, and an error.
+        :return:                None
+        """
+
+        manager, error = outcome
+        if error is not None:
+            l.warning("Failed to recover variables of function %#x. %s", func_addr, error)
+            self.failures[func_addr] = error
+            return
+
+        self.kb.variables.set_function_manager(func_addr, manager)
+        self.recovered.add(func_addr)
+        if key is not None:
+            self.cache.store(key, manager)
+
+
+AnalysesHub.register_default('VariableRecoveryBatch', VariableRecoveryBatch)
@@ -16,7 +16,8 @@ class Block(object):
                  ]
 
     def __init__(self, addr, project=None, arch=None, size=None, byte_string=None, vex=None, thumb=False, backup_state=None,
-                 extra_stop_points=None, opt_level=None, num_inst=None, traceflags=0, strict_block_end=None, collect_data_refs=False):
+                 extra_stop_points=None, opt_level=None, num_inst=None, traceflags=0, strict_block_end=None, collect_data_refs=False,
+                 vex_nostmt=None):
 
         # set up arch
         if project is not None:
@@ -48,6 +49,8 @@ class Block(object):
                 size = len(byte_string)
             elif vex is not None:
                 size = vex.size
+            elif vex_nostmt is not None:
+                size = vex_nostmt.size
             else:
                 vex = self._vex_engine.lift(
                         clemory=project.loader.memory,
@@ -65,7 +68,7 @@ class Block(object):
                 size = vex.size
 
         self._vex = vex
-        self._vex_nostmt = None
+        self._vex_nostmt = vex_nostmt
         self._capstone = None
         self.size = size
         self._collect_data_refs = collect_data_refs
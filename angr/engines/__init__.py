@@ -2,6 +2,7 @@ from .successors import SimSuccessors
 from .engine import SimEngine
 
 from .vex import SimEngineVEX
+from .vex.persistent_cache import PersistentBlockCache
 from .procedure import SimEngineProcedure
 from .unicorn import SimEngineUnicorn
 from .failure import SimEngineFailure
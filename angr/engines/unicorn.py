@@ -68,6 +68,22 @@ class SimEngineUnicorn(SimEngine):
         if state.regs.ip.symbolic:
             l.debug("symbolic IP!")
             return False
+
+        if o.UNICORN_ADAPTIVE_COOLDOWN in state.options:
+            decision = unicorn.stats.decide(state.addr)
+            if decision is False:
+                l.info("previous runs from %#x did not pay off", state.addr)
+                return False
+            if decision is True:
+                l.info("previous runs from %#x paid off, ignoring cooldowns", state.addr)
+                if o.UNICORN_SYM_REGS_SUPPORT not in state.options and not unicorn._check_registers():
+                    unicorn.countdown_symbolic_registers = unicorn.cooldown_symbolic_registers
+                    return False
+                if unicorn.countdown_symbolic_registers > 0 or unicorn.countdown_symbolic_memory > 0 or \
+                        unicorn.countdown_nonunicorn_blocks > 0:
+                    unicorn.stats.forced += 1
+                return True
+
         if unicorn.countdown_symbolic_registers > 0:
             l.debug("not enough blocks since symbolic registers (%d more)", unicorn.countdown_symbolic_registers)
             return False
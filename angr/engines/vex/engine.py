@@ -33,6 +33,7 @@ class SimEngineVEX(SimEngine):
             stop_points=None,
             use_cache=None,
             cache_size=50000,
+            persistent_cache=None,
             default_opt_level=1,
             support_selfmodifying_code=None,
             single_step=False,
@@ -46,6 +47,7 @@ class SimEngineVEX(SimEngine):
         self._support_selfmodifying_code = support_selfmodifying_code
         self._single_step = single_step
         self._cache_size = cache_size
+        self._persistent_cache = persistent_cache
         self.default_strict_block_end = default_strict_block_end
 
         if self._use_cache is None:
@@ -53,6 +55,8 @@ class SimEngineVEX(SimEngine):
                 self._use_cache = project._translation_cache
             else:
                 self._use_cache = False
+        if self._persistent_cache is None and project is not None:
+            self._persistent_cache = project._persistent_block_cache
         if self._support_selfmodifying_code is None:
             if project is not None:
                 self._support_selfmodifying_code = project._support_selfmodifying_code
@@ -567,7 +571,22 @@ class SimEngineVEX(SimEngine):
         if not buff or size == 0:
             raise SimEngineError("No bytes in memory for block starting at %#x." % addr)
 
-        # phase 5: call into pyvex
+        # phase 5: check the persistent cache
+        persistent_key = None
+        if self._persistent_cache is not None:
+            persistent_key = self._persistent_cache.make_key(arch, addr, buff, size, num_inst, thumb, opt_level,
+                                                             strict_block_end, skip_stmts, collect_data_refs)
+            irsb = self._persistent_cache.load(persistent_key)
+            if irsb is not None:
+                irsb.arch = arch
+                if irsb.statements is None or self._first_stoppoint(irsb, extra_stop_points) is None:
+                    if use_cache:
+                        self._block_cache[cache_key] = irsb
+                    return irsb
+                # there is a new stop point in this block. lift it again
+                persistent_key = None
+
+        # phase 6: call into pyvex
         # l.debug("Creating pyvex.IRSB of arch %s at %#x", arch.name, addr)
         try:
             for subphase in range(2):
@@ -588,10 +607,17 @@ class SimEngineVEX(SimEngine):
                     stop_point = self._first_stoppoint(irsb, extra_stop_points)
                     if stop_point is not None:
                         size = stop_point - addr
+                        if persistent_key is not None:
+                            # the truncated block must not be found by lifts without this stop point
+                            persistent_key = self._persistent_cache.make_key(arch, addr, buff, size, num_inst, thumb,
+                                                                             opt_level, strict_block_end, skip_stmts,
+                                                                             collect_data_refs)
                         continue
 
                 if use_cache:
                     self._block_cache[cache_key] = irsb
+                if persistent_key is not None:
+                    self._persistent_cache.store(persistent_key, irsb)
                 return irsb
 
         # phase x: error handling
@@ -712,6 +738,7 @@ class SimEngineVEX(SimEngine):
         self._support_selfmodifying_code = state['_support_selfmodifying_code']
         self._single_step = state['_single_step']
         self._cache_size = state['_cache_size']
+        self._persistent_cache = state['_persistent_cache']
         self.default_strict_block_end = state['default_strict_block_end']
 
         # rebuild block cache
@@ -726,6 +753,7 @@ class SimEngineVEX(SimEngine):
         s['_support_selfmodifying_code'] = self._support_selfmodifying_code
         s['_single_step'] = self._single_step
         s['_cache_size'] = self._cache_size
+        s['_persistent_cache'] = self._persistent_cache
         s['default_strict_block_end'] = self.default_strict_block_end
 
         return s
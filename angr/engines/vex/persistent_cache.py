@@ -0,0 +1,215 @@
+import os
+import pickle
+import sqlite3
+import hashlib
+import threading
+import logging
+
+import pyvex
+
+l = logging.getLogger(name=__name__)
+
+
+class PersistentBlockCache:
+    """
+    An on-disk cache of lifted IRSBs, backed by a sqlite database.
+
+    Entries are keyed by a hash of the bytes that are lifted, the architecture, and all lifting parameters. Hence the
+    cache can be shared between different runs and different binaries, and it stays correct even if the bytes at an
+    address change (e.g., when a binary is patched). Multiple processes on the same host may use the same database
+    file at the same time.
+
+    The database records the version of the cache format and the version of PyVEX that lifted its blocks. If either of
+    them differs when the database is opened, all blocks are removed.
+    """
+
+    CACHE_VERSION = 2
+
+    def __init__(self, path, timeout=60.0):
+        """
+        :param str path:        Path to the database file. It will be created if it does not exist.
+        :param float timeout:   Number of seconds to wait for the database lock held by other processes.
+        """
+
+        self.path = path
+        self.timeout = timeout
+
+        self.hits = 0
+        self.misses = 0
+
+        self._conn = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return self._connection().execute("SELECT COUNT(*) FROM blocks").fetchone()[0]
+
+    def __repr__(self):
+        return "<PersistentBlockCache %s: %d hits, %d misses>" % (self.path, self.hits, self.misses)
+
+    #
+    # Pickling
+    #
+
+    def __getstate__(self):
+        return {
+            'path': self.path,
+            'timeout': self.timeout,
+        }
+
+    def __setstate__(self, s):
+        self.__init__(s['path'], timeout=s['timeout'])
+
+    #
+    # Private methods
+    #
+
+    def _connection(self):
+        """
+        Get a connection to the database. sqlite connections must not be shared across processes, so a new connection
+        is created after a fork.
+
+        :return: The connection.
+        :rtype:  sqlite3.Connection
+        """
+
+        pid = os.getpid()
+        if self._conn is None or self._pid != pid:
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+            # write-ahead logging allows concurrent readers while one process is writing
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS blocks (key BLOB PRIMARY KEY, irsb BLOB NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            self._check_version(conn)
+            self._conn = conn
+            self._pid = pid
+        return self._conn
+
+    @classmethod
+    def _version(cls):
+        """
+        Get the version that blocks in the database must be created with.
+
+        :return: A string of the cache format version and the PyVEX version.
+        :rtype:  str
+        """
+
+        return "%d/%s" % (cls.CACHE_VERSION, pyvex.__version__)
+
+    def _check_version(self, conn):
+        """
+        Remove all blocks from the database if they were created by another version of the cache or of PyVEX.
+
+        :param sqlite3.Connection conn: The connection to the database.
+        :return:                        None
+        """
+
+        version = self._version()
+        # take the write lock first, so that no other process stores blocks between the check and the update
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT value FROM meta WHERE name = 'version'").fetchone()
+            if row is None or row[0] != version:
+                if row is not None:
+                    l.info("Block cache %s was created by version %s. Removing all blocks.", self.path, row[0])
+                conn.execute("DELETE FROM blocks")
+                conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('version', ?)", (version,))
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    #
+    # Public methods
+    #
+
+    @classmethod
+    def make_key(cls, arch, addr, insn_bytes, size, num_inst, thumb, opt_level, strict_block_end, skip_stmts,
+                 collect_data_refs):
+        """
+        Generate the key of a block.
+
+        :param archinfo.Arch arch:  The architecture.
+        :param int addr:            Address of the block.
+        :param insn_bytes:          Bytes to lift. Either a bytes object or a cffi pointer.
+        :param int size:            Number of bytes to lift.
+        :return:                    The key.
+        :rtype:                     bytes
+        """
+
+        if isinstance(insn_bytes, bytes):
+            data = insn_bytes[:size]
+        else:
+            data = pyvex.ffi.buffer(insn_bytes, size)[:]
+
+        h = hashlib.sha256(data)
+        h.update(repr((cls.CACHE_VERSION, arch.name, arch.memory_endness, addr, size, num_inst, thumb, opt_level,
+                       strict_block_end, skip_stmts, collect_data_refs)).encode())
+        return h.digest()
+
+    def load(self, key):
+        """
+        Load a block from the cache.
+
+        :param bytes key:   Key of the block.
+        :return:            The IRSB, or None if the block is not cached.
+        :rtype:             pyvex.IRSB or None
+        """
+
+        try:
+            with self._lock:
+                row = self._connection().execute("SELECT irsb FROM blocks WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error as ex:
+            l.warning("Failed to read from block cache %s: %s", self.path, ex)
+            row = None
+
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return pickle.loads(row[0])
+
+    def store(self, key, irsb):
+        """
+        Store a block in the cache. Existing entries are not overwritten.
+
+        :param bytes key:           Key of the block.
+        :param pyvex.IRSB irsb:     The IRSB to store.
+        :return:                    None
+        """
+
+        data = pickle.dumps(irsb, pickle.HIGHEST_PROTOCOL)
+        try:
+            with self._lock:
+                self._connection().execute("INSERT OR IGNORE INTO blocks (key, irsb) VALUES (?, ?)",
+                                           (key, sqlite3.Binary(data)))
+        except sqlite3.Error as ex:
+            l.warning("Failed to write to block cache %s: %s", self.path, ex)
+
+    def clear(self):
+        """
+        Remove all blocks from the cache, and reset hit/miss counters.
+
+        :return: None
+        """
+
+        with self._lock:
+            self._connection().execute("DELETE FROM blocks")
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        """
+        Close the connection to the database. The connection will be reopened on the next access.
+
+        :return: None
+        """
+
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+            self._pid = None
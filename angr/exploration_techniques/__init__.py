@@ -172,14 +172,17 @@ from .cacher import Cacher
 from .driller_core import DrillerCore
 from .loop_seer import LoopSeer
 from .tracer import Tracer
+from .trace_file import TraceFile, ArrayTrace
 from .explorer import Explorer
 from .threading import Threading
+from .process_pool import ProcessPool
+from .distributed import Distributed
 from .dfs import DFS
 from .lengthlimiter import LengthLimiter
 from .veritesting import Veritesting
 from .oppologist import Oppologist
 from .director import Director, ExecuteAddressGoal, CallFunctionGoal
-from .spiller import Spiller
+from .spiller import Spiller, BudgetSpiller
 from .manual_mergepoint import ManualMergepoint
 from .tech_builder import TechniqueBuilder
 from .stochastic import StochasticSearch
@@ -0,0 +1,559 @@
+import contextlib
+import multiprocessing
+import itertools
+import logging
+import pickle
+import pickletools
+import traceback
+import time
+import uuid
+import sys
+import os
+
+from . import ExplorationTechnique
+from ..vaults import VaultDir
+from ..errors import AngrError, AngrExplorationTechniqueError, AngrVaultError
+
+l = logging.getLogger(name=__name__)
+
+
+class SpoolVault(VaultDir):
+    """
+    A vault in the object directory of a spool. It is shared by the coordinator and all workers.
+
+    State histories are stored separately from the states, and a history that was loaded from the vault is never
+    stored again, so the history of a state is only transferred once no matter how many times its successors are sent
+    between processes.
+
+    Objects that are shared by several states (e.g., ASTs and histories) are not removed with the states. sweep()
+    removes all objects that are not reachable from a set of states and have not been used for a while.
+    """
+
+    def __init__(self, d, project):
+        super(SpoolVault, self).__init__(d)
+        self.uuid_dedup.add(SimStateHistory)
+        self.register_project(project)
+
+    @contextlib.contextmanager
+    def _write_context(self, i):
+        # objects are written to a temporary file first, because several processes may store the same object (e.g.,
+        # the same AST) at the same time, and others may load it while it is being written
+        path = os.path.join(self._dir, i)
+        tmp_path = '%s.%s.tmp' % (path, uuid.uuid4().hex)
+        try:
+            with open(tmp_path, "wb") as o:
+                yield o
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def remove(self, i):
+        """
+        Remove an object from the spool. It is stored again if it is referenced by an object that is stored later.
+
+        :param str i:   The ID of the object.
+        :return:        None
+        """
+        self.stored.discard(i)
+        self.storing.discard(i)
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(os.path.join(self._dir, i))
+
+    def is_stored(self, i):
+        if i in self.stored:
+            return True
+        try:
+            # reusing an object keeps sweep() from removing it
+            os.utime(os.path.join(self._dir, i))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def references(self, i):
+        """
+        Get the IDs of the objects that an object refers to, without loading it.
+
+        :param str i:   The ID of the object.
+        :return:        A set of IDs.
+        :rtype:         set
+        """
+        with self._read_context(i) as f:
+            data = f.read()
+
+        refs = set()
+        memo = { }
+        top = None
+        for op, arg, _ in pickletools.genops(data):
+            if op.name == 'PERSID':
+                refs.add(arg)
+            elif op.name == 'BINPERSID':
+                if type(top) is str:
+                    refs.add(top)
+                top = None
+            elif op.name in ('PUT', 'BINPUT', 'LONG_BINPUT'):
+                memo[arg] = top
+            elif op.name == 'MEMOIZE':
+                memo[len(memo)] = top
+            elif op.name in ('GET', 'BINGET', 'LONG_BINGET'):
+                top = memo.get(arg, None)
+            elif op.name in ('SHORT_BINUNICODE', 'BINUNICODE', 'BINUNICODE8', 'UNICODE'):
+                top = arg
+            elif op.name not in ('PROTO', 'FRAME'):
+                top = None
+        return refs
+
+    def sweep(self, roots, grace):
+        """
+        Remove all objects that are not reachable from the given objects, and that have not been stored or reused for
+        some time. Objects that workers are storing for results that have not been collected yet are recent, so they
+        are kept.
+
+        :param roots:       IDs of the objects that are still needed.
+        :param float grace: Number of seconds for which stored or reused objects are kept.
+        :return:            Number of removed objects.
+        :rtype:             int
+        """
+        reachable = set()
+        todo = list(roots)
+        while todo:
+            i = todo.pop()
+            if i in reachable:
+                continue
+            reachable.add(i)
+            with contextlib.suppress(AngrVaultError, FileNotFoundError):
+                todo.extend(self.references(i))
+
+        removed = 0
+        now = time.time()
+        for name in os.listdir(self._dir):
+            if name in reachable:
+                continue
+            path = os.path.join(self._dir, name)
+            trash_path = path + '.trash'
+            try:
+                if now - os.path.getmtime(path) <= grace:
+                    continue
+                # a worker may reuse the object at any time. once it is renamed, reusing it fails, and the worker
+                # stores it again.
+                os.rename(path, trash_path)
+                if now - os.path.getmtime(trash_path) <= grace:
+                    # it was reused before it was renamed
+                    os.replace(trash_path, path)
+                    continue
+                os.remove(trash_path)
+            except FileNotFoundError:
+                continue
+            self.stored.discard(name)
+            self.storing.discard(name)
+            removed += 1
+        return removed
+
+    def load(self, id): #pylint:disable=redefined-builtin
+        o = super(SpoolVault, self).load(id)
+        if type(o) is SimStateHistory:
+            self._object_cache[id] = o
+            self._uuid_cache[o] = id
+        return o
+
+
+class Spool:
+    """
+    A work queue in a directory, which may be shared by several hosts through a network file system. Jobs are claimed
+    by renaming them, which is atomic, so every job is processed by exactly one worker.
+
+    The directory contains the following entries:
+
+    - project:  The pickled project.
+    - objects/: The SpoolVault that holds all states.
+    - queue/:   Jobs that have not been claimed yet. Jobs are processed in the order of their names.
+    - claimed/: Jobs that are being processed. Claiming a job sets its modification time, and jobs that have been
+                claimed for longer than a lease are put back into the queue.
+    - results/: Results of jobs that have not been collected yet.
+    - stop:     If this file exists, all workers exit.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        for d in ('objects', 'queue', 'claimed', 'results'):
+            os.makedirs(os.path.join(path, d), exist_ok=True)
+
+    def _write(self, path, obj):
+        tmp_path = '%s.%s.tmp' % (path, uuid.uuid4().hex)
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(obj, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _read(path):
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+    @property
+    def stopped(self):
+        return os.path.exists(os.path.join(self.path, 'stop'))
+
+    def stop(self):
+        with open(os.path.join(self.path, 'stop'), 'wb'):
+            pass
+
+    def store_project(self, project):
+        self._write(os.path.join(self.path, 'project'), project)
+
+    def load_project(self):
+        return self._read(os.path.join(self.path, 'project'))
+
+    def has_project(self):
+        return os.path.exists(os.path.join(self.path, 'project'))
+
+    def push_job(self, name, job):
+        self._write(os.path.join(self.path, 'queue', name), job)
+
+    def claim_job(self):
+        """
+        Claim the job with the highest priority.
+
+        :return: A tuple of the name of the job and the job, or None if the queue is empty.
+        """
+        for name in sorted(os.listdir(os.path.join(self.path, 'queue'))):
+            if name.endswith('.tmp'):
+                continue
+            claimed_path = os.path.join(self.path, 'claimed', name)
+            try:
+                os.rename(os.path.join(self.path, 'queue', name), claimed_path)
+                # the lease starts now
+                os.utime(claimed_path)
+                return name, self._read(claimed_path)
+            except FileNotFoundError:
+                # another worker was faster, or the lease expired already
+                continue
+        return None
+
+    def requeue_expired(self, lease):
+        """
+        Put jobs that have been claimed for longer than the lease back into the queue, e.g. because their worker died.
+
+        :param float lease: Number of seconds.
+        :return:            Names of the jobs that are put back.
+        :rtype:             list
+        """
+        requeued = [ ]
+        now = time.time()
+        for name in os.listdir(os.path.join(self.path, 'claimed')):
+            claimed_path = os.path.join(self.path, 'claimed', name)
+            try:
+                if now - os.path.getmtime(claimed_path) <= lease:
+                    continue
+                os.rename(claimed_path, os.path.join(self.path, 'queue', name))
+            except FileNotFoundError:
+                # the job is finished
+                continue
+            requeued.append(name)
+        return requeued
+
+    def push_result(self, name, result):
+        self._write(os.path.join(self.path, 'results', name), result)
+        with contextlib.suppress(FileNotFoundError):
+            # the job may have been put back into the queue if its lease expired
+            os.remove(os.path.join(self.path, 'claimed', name))
+
+    def pop_results(self):
+        """
+        Collect the results of all finished jobs.
+
+        :return: A list of tuples of the name of the job and the result.
+        """
+        results = [ ]
+        for name in sorted(os.listdir(os.path.join(self.path, 'results'))):
+            if name.endswith('.tmp'):
+                continue
+            path = os.path.join(self.path, 'results', name)
+            results.append((name, self._read(path)))
+            os.remove(path)
+        return results
+
+
+def run_worker(path, poll_interval=0.1, idle_timeout=None):
+    """
+    Process jobs of a spool until the coordinator stops the spool.
+
+    :param str path:            Path to the spool directory.
+    :param float poll_interval: Number of seconds to wait when there is no job.
+    :param float idle_timeout:  Exit after waiting for jobs for that many seconds. None means no timeout.
+    :return:                    Number of processed jobs.
+    """
+
+    spool = Spool(path)
+    while not spool.has_project():
+        if spool.stopped:
+            return 0
+        time.sleep(poll_interval)
+
+    project = spool.load_project()
+    vault = SpoolVault(os.path.join(path, 'objects'), project)
+
+    processed = 0
+    idle_since = time.time()
+    while not spool.stopped:
+        claimed = spool.claim_job()
+        if claimed is None:
+            if idle_timeout is not None and time.time() - idle_since > idle_timeout:
+                break
+            time.sleep(poll_interval)
+            continue
+
+        name, job = claimed
+        # objects that are stored again must be reused explicitly, so that the coordinator does not remove them
+        vault.stored.clear()
+        vault.storing.clear()
+        try:
+            result = _process_job(project, vault, job)
+        except Exception:  # pylint:disable=broad-except
+            l.error("Job %s failed.", name, exc_info=True)
+            result = { 'stashes': { }, 'errored': [ ], 'failure': traceback.format_exc() }
+        spool.push_result(name, result)
+        processed += 1
+        idle_since = time.time()
+
+    return processed
+
+
+def _process_job(project, vault, job):
+    state = vault.load(job['state'])
+    simgr = project.factory.simulation_manager(state, save_unsat=job['save_unsat'])
+    simgr.run(n=job['steps'], **job['run_args'])
+
+    errored = [ ]
+    for record in simgr.errored:
+        try:
+            pickle.dumps(record.error)
+            error = record.error
+        except Exception:  # pylint:disable=broad-except
+            error = AngrError(repr(record.error))
+        errored.append((vault.store(record.state), error))
+
+    return {
+        'stashes': { stash: [ vault.store(s) for s in states ] for stash, states in simgr.stashes.items() if states },
+        'errored': errored,
+    }
+
+
+class Distributed(ExplorationTechnique):
+    """
+    Step states in worker processes that pull them from a spool directory, which may be shared between several hosts.
+
+    The simulation manager acts as the coordinator: it sends the states in the stash to the spool in order of their
+    priority, and puts the successors that the workers return back into stashes. Successors that are still active are
+    filtered as usual (e.g., by Explorer), so found and avoided states end up in the right stashes. At most `max_queued`
+    states are in the spool at any time, and all other states wait in the stash.
+
+    Workers are started with spawn_workers() on the local host, or with
+
+        python -m angr.exploration_techniques.distributed <spool directory>
+
+    on any host that has access to the spool directory and to the binaries of the project.
+
+    Jobs whose workers do not return a result within `lease` seconds are put back into the queue. If no result arrives
+    for `timeout` seconds while states are in the spool, step() raises an AngrExplorationTechniqueError.
+
+    States are removed from the spool once their results are collected. Objects that states share (e.g., ASTs and
+    histories) are removed every `gc_interval` seconds if no state in the spool refers to them, and if they have not
+    been used for `lease` seconds. collect_garbage() removes them right away.
+    """
+
+    def __init__(self, spool_dir, steps=1, max_queued=64, priority_key=None, poll_interval=0.05, lease=600.0,
+                 timeout=3600.0, gc_interval=60.0):
+        """
+        :param str spool_dir:       Path to the spool directory. It will be created if it does not exist.
+        :param int steps:           Number of times the workers step each state before returning its successors.
+        :param int max_queued:      Maximum number of states that are in the spool at the same time.
+        :param priority_key:        A function that takes a state and returns its priority as a non-negative integer.
+                                    States with lower values are stepped first. By default, states with fewer blocks in
+                                    their history are stepped first.
+        :param float poll_interval: Number of seconds to wait for results.
+        :param float lease:         Number of seconds after which a claimed job is given to another worker.
+        :param float timeout:       Number of seconds to wait for any result before giving up, or None to wait
+                                    forever.
+        :param float gc_interval:   Number of seconds between removals of unused objects from the spool, or None to
+                                    never remove them automatically.
+        """
+        super(Distributed, self).__init__()
+        self.spool = Spool(spool_dir)
+        self.steps = steps
+        self.max_queued = max_queued
+        self.priority_key = priority_key
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.timeout = timeout
+        self.gc_interval = gc_interval
+
+        self._vault = None
+        self._last_gc = time.time()
+        # names of the jobs in the spool, mapped to the IDs of their states
+        self._pending = { }
+        self._job_counter = itertools.count()
+        self._workers = [ ]
+
+    def setup(self, simgr):
+        self.spool.store_project(self.project)
+        self._vault = SpoolVault(os.path.join(self.spool.path, 'objects'), self.project)
+
+    def spawn_workers(self, n):
+        """
+        Start worker processes on the local host.
+
+        :param int n:   Number of workers.
+        :return:        None
+        """
+        for _ in range(n):
+            p = multiprocessing.Process(target=run_worker, args=(self.spool.path,))
+            p.daemon = True
+            p.start()
+            self._workers.append(p)
+
+    def shutdown(self):
+        """
+        Stop all workers, and wait for the local ones to exit. Jobs that are still in the spool are discarded.
+
+        :return: None
+        """
+        self.spool.stop()
+        for p in self._workers:
+            p.join()
+        self._workers = [ ]
+        # nothing in the spool is needed anymore
+        for name in self._pending.values():
+            self._vault.remove(name)
+        self._pending.clear()
+
+    def collect_garbage(self, grace=None):
+        """
+        Remove all objects from the spool that no state in the spool refers to.
+
+        :param float grace: Objects that were stored or reused within this many seconds are kept, since workers may
+                            still return states that refer to them. By default, the lease is used. When no worker is
+                            running, 0 removes all unused objects.
+        :return:            Number of removed objects.
+        :rtype:             int
+        """
+        self._last_gc = time.time()
+        removed = self._vault.sweep(self._pending.values(), self.lease if grace is None else grace)
+        l.debug("Removed %d unused objects from the spool.", removed)
+        return removed
+
+    @staticmethod
+    def state_priority(state):
+        return state.history.depth
+
+    def step(self, simgr, stash='active', **kwargs):
+        if kwargs.get('successor_func', None) is not None or kwargs.get('selector_func', None) is not None:
+            # these functions cannot be sent to the workers
+            return simgr.step(stash=stash, **kwargs)
+
+        filter_func = kwargs.get('filter_func', None)
+        if self.steps > 1 and (filter_func is not None or
+                               any(type(t).filter is not ExplorationTechnique.filter
+                                   for t in simgr._techniques if t is not self)):
+            # workers step states without the filters of the coordinator, so intermediate states would not be filtered
+            raise AngrExplorationTechniqueError("Distributed does not support steps > 1 with filtering techniques or "
+                                                "filter_func.")
+
+        run_args = { k: v for k, v in kwargs.items()
+                     if k not in ('selector_func', 'step_func', 'successor_func', 'filter_func', 'until', 'n') }
+
+        states = simgr.stashes[stash]
+        states.sort(key=self.priority_key or self.state_priority)
+        n = max(0, self.max_queued - len(self._pending))
+        for state in states[:n]:
+            self._submit(simgr, state, run_args)
+        del states[:n]
+
+        self._collect(simgr, stash, filter_func)
+        # only return once there is something to step, or run() would stop while states are in the spool
+        last_result = time.time()
+        workers_alive = True
+        while self._pending and not simgr.stashes[stash]:
+            time.sleep(self.poll_interval)
+            if self._collect(simgr, stash, filter_func):
+                last_result = time.time()
+                continue
+            for name in self.spool.requeue_expired(self.lease):
+                l.warning("The lease of job %s expired. It is put back into the queue.", name)
+            if workers_alive and self._workers and not any(p.is_alive() for p in self._workers):
+                # workers on other hosts may still be running
+                l.warning("All local workers exited.")
+                workers_alive = False
+            if self.timeout is not None and time.time() - last_result > self.timeout:
+                raise AngrExplorationTechniqueError("No result from any worker for %d seconds, while %d jobs are in "
+                                                    "the spool." % (self.timeout, len(self._pending)))
+
+        if self.gc_interval is not None and time.time() - self._last_gc > self.gc_interval:
+            self.collect_garbage()
+
+        step_func = kwargs.get('step_func', None)
+        if step_func is not None:
+            return step_func(simgr)
+        return simgr
+
+    def _submit(self, simgr, state, run_args):
+        name = '%020d-%010d' % (max(0, (self.priority_key or self.state_priority)(state)), next(self._job_counter))
+        state_id = self._vault.store(state)
+        self.spool.push_job(name, {
+            'state': state_id,
+            'steps': self.steps,
+            'run_args': run_args,
+            'save_unsat': simgr._save_unsat,
+        })
+        self._pending[name] = state_id
+
+    def _collect(self, simgr, stash, filter_func):
+        """
+        Put the successors of all finished jobs into stashes, and remove the finished jobs from the spool.
+
+        :return: Number of collected results.
+        :rtype: int
+        """
+        results = self.spool.pop_results()
+        for name, result in results:
+            if name not in self._pending:
+                # a job whose lease expired may be finished twice
+                for state_ids in result['stashes'].values():
+                    for sid in state_ids:
+                        self._vault.remove(sid)
+                for sid, _ in result['errored']:
+                    self._vault.remove(sid)
+                continue
+            state_id = self._pending.pop(name)
+
+            if 'failure' in result:
+                l.warning("Job %s failed in its worker.", name)
+                simgr.errored.append(ErrorRecord(self._vault.load(state_id), AngrError(result['failure']), None))
+                self._vault.remove(state_id)
+                continue
+            self._vault.remove(state_id)
+
+            for to_stash, state_ids in result['stashes'].items():
+                for sid in state_ids:
+                    state = self._vault.load(sid)
+                    self._vault.remove(sid)
+                    goto = to_stash
+                    if to_stash == 'active':
+                        goto = simgr.filter(state, filter_func=filter_func)
+                        if isinstance(goto, tuple):
+                            goto, state = goto
+                        goto = goto or stash
+                    simgr.populate(goto, [ state ])
+
+            for sid, error in result['errored']:
+                simgr.errored.append(ErrorRecord(self._vault.load(sid), error, None))
+                self._vault.remove(sid)
+
+        return len(results)
+
+
+from ..state_plugins.history import SimStateHistory
+from ..sim_manager import ErrorRecord
+
+
+if __name__ == '__main__':
+    run_worker(sys.argv[1])
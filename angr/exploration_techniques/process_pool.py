@@ -0,0 +1,195 @@
+import concurrent.futures
+import logging
+import weakref
+
+from . import ExplorationTechnique
+from ..vaults import VaultDict
+
+l = logging.getLogger(name=__name__)
+
+
+def _process_pool_vault(project):
+    """
+    Create an in-memory vault for transferring states between processes. The project and its engines exist on both
+    sides, so they are referenced by their IDs instead of being serialized.
+    """
+    vault = VaultDict()
+    vault.register_project(project)
+    return vault
+
+
+_process_pool_project = None
+
+
+def _process_pool_init(project):
+    global _process_pool_project  # pylint:disable=global-statement
+    _process_pool_project = project
+
+
+def _process_pool_successors(project, state, depth, run_args):
+    """
+    Step a state for up to `depth` blocks. This function is executed inside worker processes.
+
+    :return: A tuple of the SimSuccessors of the state and the list of trees of its flat successors, or None if the
+             state should be stepped by the simulation manager itself.
+    """
+
+    try:
+        successors = project.factory.successors(state, **run_args)
+    except Exception:  # pylint:disable=broad-except
+        # let the simulation manager step this state again, so that errors are handled the same way as always
+        l.debug("Failed to step state %s in a worker process.", state, exc_info=True)
+        return None
+
+    if depth > 1:
+        children = [ _process_pool_successors(project, s, depth - 1, run_args) for s in successors.flat_successors ]
+    else:
+        children = [ None ] * len(successors.flat_successors)
+    return successors, children
+
+
+def _process_pool_step(data, depth, run_args):
+    """
+    Step a batch of states. This function is executed inside worker processes.
+
+    :param bytes data:      The states, serialized with Vault.dumps_batch().
+    :param int depth:       Number of blocks to step.
+    :param dict run_args:   Keyword arguments for project.factory.successors().
+    :return:                The list of successor trees, serialized with Vault.dumps_batch().
+    """
+
+    project = _process_pool_project
+    vault = _process_pool_vault(project)
+    states = vault.loads_batch(data)
+
+    for i, state in enumerate(states):
+        vault.register('state-%d' % i, state)
+        vault.register('history-%d' % i, state.history)
+
+    results = [ _process_pool_successors(project, state, depth, run_args) for state in states ]
+    return vault.dumps_batch(results)
+
+
+class ProcessPool(ExplorationTechnique):
+    """
+    Step states in worker processes.
+
+    Unlike the Threading technique, this also speeds up the Python parts of symbolic execution. Before each step, the
+    states in the stash are sent to the worker processes in batches, and their successors are computed there. The
+    simulation manager then steps the stash as usual, using the successors that were computed by the workers, so all
+    stashes are populated the same way as SimulationManager.step() populates them.
+
+    The states of a batch are serialized together, and claripy ASTs are written to a table that is shared by the whole
+    batch, so ASTs that are shared between the states are only transferred once, and are shared again after they are
+    transferred.
+
+    If `depth` is larger than 1, the workers also compute the successors of the successors, and so on, which are used
+    in subsequent steps. States must not be modified between steps in this case, or stale successors will be used.
+    States that are stepped with a custom successor_func are always stepped in the current process.
+
+    The worker processes are terminated when shutdown() is called, or when the technique is garbage collected.
+    """
+
+    def __init__(self, workers=None, depth=1, min_batch=1):
+        """
+        :param int workers:     Number of worker processes. Defaults to the number of processors.
+        :param int depth:       Number of blocks to step each state for in the workers.
+        :param int min_batch:   Minimum number of states in a batch.
+        """
+        super(ProcessPool, self).__init__()
+        self.workers = workers
+        self.depth = depth
+        self.min_batch = min_batch
+
+        self._executor = None
+        self._finalizer = None
+        # id of state -> (state, run_args, successors, list of trees of flat successors)
+        self._prefetched = { }
+
+    def setup(self, simgr):
+        self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers,
+                                                                initializer=_process_pool_init,
+                                                                initargs=(self.project,))
+        self.workers = self._executor._max_workers
+        # the finalizer must not refer to the technique itself, or the technique would never be collected
+        self._finalizer = weakref.finalize(self, self._executor.shutdown)
+
+    def shutdown(self):
+        """
+        Terminate all worker processes.
+
+        :return: None
+        """
+        if self._finalizer is not None:
+            self._finalizer()
+            self._finalizer = None
+        self._executor = None
+        self._prefetched = { }
+
+    def step(self, simgr, stash='active', **kwargs):
+        states = simgr.stashes[stash]
+
+        if kwargs.get('successor_func', None) is None and self._executor is not None:
+            run_args = { k: v for k, v in kwargs.items()
+                         if k not in ('selector_func', 'step_func', 'successor_func', 'filter_func', 'until', 'n') }
+
+            # drop successors of states that are not going to be stepped anymore
+            alive = { id(s) for s in states }
+            self._prefetched = { k: v for k, v in self._prefetched.items() if k in alive }
+
+            # only states that are going to be stepped are sent to the workers
+            selector_func = kwargs.get('selector_func', None)
+            todo = [ s for s in states
+                     if not self._is_prefetched(s, run_args) and simgr.selector(s, selector_func=selector_func) ]
+            if todo:
+                self._prefetch(todo, run_args)
+
+        return simgr.step(stash=stash, **kwargs)
+
+    def successors(self, simgr, state, successor_func=None, **run_args):
+        if successor_func is None and self._is_prefetched(state, run_args):
+            _, _, successors, children = self._prefetched.pop(id(state))
+            for s, child in zip(successors.flat_successors, children):
+                if child is not None:
+                    self._prefetched[id(s)] = (s, run_args) + child
+            return successors
+
+        return simgr.successors(state, successor_func=successor_func, **run_args)
+
+    def _is_prefetched(self, state, run_args):
+        entry = self._prefetched.get(id(state), None)
+        return entry is not None and entry[0] is state and entry[1] == run_args
+
+    def _prefetch(self, states, run_args):
+        """
+        Compute the successors of states in the worker processes.
+
+        :param list states:     The states.
+        :param dict run_args:   Keyword arguments for project.factory.successors().
+        :return:                None
+        """
+
+        batch_size = max(self.min_batch, -(-len(states) // self.workers))
+        tasks = { }
+        for start in range(0, len(states), batch_size):
+            batch = states[start:start + batch_size]
+            data = _process_pool_vault(self.project).dumps_batch(batch)
+            task = self._executor.submit(_process_pool_step, data, self.depth, run_args)
+            tasks[task] = batch
+
+        for task in concurrent.futures.as_completed(tasks):
+            batch = tasks[task]
+            try:
+                results = task.result()
+            except Exception:  # pylint:disable=broad-except
+                l.warning("Failed to step %d states in a worker process.", len(batch), exc_info=True)
+                continue
+
+            vault = _process_pool_vault(self.project)
+            for i, state in enumerate(batch):
+                vault.register('state-%d' % i, state)
+                vault.register('history-%d' % i, state.history)
+
+            for state, result in zip(batch, vault.loads_batch(results)):
+                if result is not None:
+                    self._prefetched[id(state)] = (state, run_args) + result
@@ -1,4 +1,16 @@
+import itertools
 import logging
+import heapq
+import io
+import math
+import random
+import zlib
+import os
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
 
 l = logging.getLogger(name=__name__)
 
@@ -116,4 +128,177 @@ class Spiller(ExplorationTechnique):
     def state_priority(state):
         return id(state)
 
+
+def _resident_set_size():
+    """
+    Get the resident set size of the current process in bytes, or None if it cannot be determined.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    return None
+
+
+class BudgetSpiller(ExplorationTechnique):
+    """
+    Spill states out to a vault when the memory usage exceeds a budget, and restore them when it falls below the budget
+    again. Unlike Spiller, the number of states that are kept in memory is not fixed, so a few huge states or many small
+    ones can be explored with the same budget.
+
+    States with the lowest priority (i.e., the highest value of `priority_key`) are spilled first, and states with the
+    highest priority are restored first. Spilled states are pickled to the vault and compressed, and their priorities
+    are kept in a heap, so restoring states never requires loading or sorting all spilled states.
+    """
+
+    def __init__(self, budget, src_stash='active', usage='rss', low_water=0.75, min_states=1, restore_batch=4,
+                 priority_key=None, compress_level=6, vault=None, pickle_callback=None, unpickle_callback=None,
+                 estimate_sample=16):
+        """
+        :param int budget:          The memory budget in bytes.
+        :param str src_stash:       The stash from which to spill states.
+        :param usage:               How memory usage is measured: 'rss' for the resident set size of the process,
+                                    'estimate' for the estimated footprint of the states in the stash (see
+                                    SimState.footprint()), or a function that takes the simulation manager and returns
+                                    the number of bytes in use.
+        :param float low_water:     Spilled states are restored when the usage is below this fraction of the budget,
+                                    and enough states are spilled to get below it when the budget is exceeded.
+        :param int min_states:      Never spill states if there are at most this many states in the stash. At least
+                                    one state is always kept.
+        :param int restore_batch:   Maximum number of states that are restored at once. Fewer states are restored if
+                                    states of the average size would exceed the low water mark.
+        :param priority_key:        A function that takes a state and returns its priority. States with lower values
+                                    are kept in memory. By default, states with fewer blocks in their history are kept.
+        :param int compress_level:  The zlib compression level for spilled states. 0 disables compression.
+        :param vault:               An angr.vaults.Vault object to store states in. By default, a VaultShelf in a
+                                    temporary file is used.
+        :param pickle_callback:     A function that is called with each state that is spilled.
+        :param unpickle_callback:   A function that is called with each state that is restored.
+        :param int estimate_sample: With usage='estimate', the footprint of at most this many randomly chosen states is
+                                    measured on each step, and scaled up to the whole stash.
+        """
+        super(BudgetSpiller, self).__init__()
+        self.budget = budget
+        self.src_stash = src_stash
+        self.usage = usage
+        self.low_water = low_water
+        self.min_states = min_states
+        self.restore_batch = restore_batch
+        self.priority_key = priority_key
+        self.compress_level = compress_level
+        self.pickle_callback = pickle_callback
+        self.unpickle_callback = unpickle_callback
+        self.estimate_sample = estimate_sample
+
+        self._vault = vaults.VaultShelf() if vault is None else vault
+        # heap of (priority, counter, state ID) of spilled states
+        self._spilled = [ ]
+        self._counter = itertools.count()
+        # usage after the last time states were spilled
+        self._last_usage = None
+
+        self.ever_spilled = 0
+        self.ever_restored = 0
+
+    @property
+    def spilled(self):
+        """
+        Number of states that are currently spilled.
+        """
+        return len(self._spilled)
+
+    @staticmethod
+    def state_priority(state):
+        return state.history.depth
+
+    def _get_priority(self, state):
+        return (self.priority_key or self.state_priority)(state)
+
+    def _measure(self, simgr):
+        if callable(self.usage):
+            return self.usage(simgr)
+        if self.usage == 'rss':
+            rss = _resident_set_size()
+            if rss is not None:
+                return rss
+            l.warning("Cannot determine the resident set size of the process, estimating state sizes instead.")
+            self.usage = 'estimate'
+        return self._estimate(simgr.stashes.get(self.src_stash, [ ]))
+
+    def _estimate(self, states):
+        """
+        Estimate the footprint of states from a sample of them. Data that is shared by the sampled states is counted
+        once per state of the stash, so the estimate is an upper bound rather than a lower one.
+        """
+        if len(states) <= self.estimate_sample:
+            sample = states
+        else:
+            sample = random.sample(states, self.estimate_sample)
+        fp = Footprint(top=0)
+        for state in sample:
+            fp.add_state(state)
+        return fp.total * len(states) // max(len(sample), 1)
+
+    def _spill(self, states):
+        for state in states:
+            if self.pickle_callback:
+                self.pickle_callback(state)
+            # pickle the state itself, rather than a reference to a separate record of it in the vault
+            f = io.BytesIO()
+            vaults.VaultPickler(self._vault, f, assigned_objects=(state,)).dump(state)
+            data = f.getvalue()
+            if self.compress_level:
+                data = zlib.compress(data, self.compress_level)
+            sid = self._vault.store(data)
+            heapq.heappush(self._spilled, (self._get_priority(state), next(self._counter), sid))
+        self.ever_spilled += len(states)
+
+    def _restore(self, n):
+        restored = [ ]
+        while self._spilled and len(restored) < n:
+            _, _, sid = heapq.heappop(self._spilled)
+            data = self._vault.load(sid)
+            if self.compress_level:
+                data = zlib.decompress(data)
+            state = self._vault.loads(data)
+            if self.unpickle_callback:
+                self.unpickle_callback(state)
+            restored.append(state)
+        self.ever_restored += len(restored)
+        return restored
+
+    def step(self, simgr, stash='active', **kwargs):
+        simgr = simgr.step(stash=stash, **kwargs)
+        states = simgr.stashes.setdefault(self.src_stash, [ ])
+        usage = self._measure(simgr)
+        target = self.budget * self.low_water
+
+        # the resident set size rarely shrinks after spilling, so only spill more states if it has grown since
+        grown = self._last_usage is None or usage > self._last_usage or self.usage != 'rss'
+        keep = max(self.min_states, 1)
+        if usage > self.budget and grown and len(states) > keep:
+            n = min(len(states) - keep, max(1, math.ceil(len(states) * (usage - target) / usage)))
+            l.debug("Memory usage %d exceeds the budget %d, spilling %d of %d states", usage, self.budget, n,
+                    len(states))
+            states.sort(key=self._get_priority)
+            self._spill(states[-n:])
+            del states[-n:]
+            # only the resident set size is compared with the usage after spilling, estimates are not measured again
+            self._last_usage = self._measure(simgr) if self.usage != 'estimate' else None
+
+        elif self._spilled and (not states or usage < target):
+            n = self.restore_batch
+            if states:
+                # assume that restored states are as large as the states in memory on average
+                n = min(n, max(1, int((target - usage) * len(states) // usage)))
+            l.debug("Memory usage %d is below %d, restoring %d states", usage, target, n)
+            states.extend(self._restore(n))
+            self._last_usage = None
+
+        return simgr
+
 from .. import vaults
+from ..misc.footprint import Footprint
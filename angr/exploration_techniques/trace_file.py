@@ -0,0 +1,259 @@
+import itertools
+import struct
+import array
+import mmap
+import sys
+from collections.abc import Sequence
+
+from ..errors import AngrTracerError
+
+_MAGIC = b'ANGRTRC1'
+# magic, number of addresses, number of addresses per chunk, reserved, offset of the chunk table
+_HEADER = struct.Struct('<8sQIIQ')
+# first address of the chunk, type code of the deltas
+_CHUNK_HEADER = struct.Struct('<Qc')
+
+_MASK = (1 << 64) - 1
+
+
+def _little_endian(a):
+    """
+    Convert an array from or to the byte order of trace files.
+    """
+    if sys.byteorder != 'little':
+        a.byteswap()
+    return a
+
+
+def _decode(first, deltas):
+    try:
+        return array.array('Q', itertools.accumulate(itertools.chain((first, ), deltas)))
+    except OverflowError:
+        # the trace wraps around the address space
+        return array.array('Q', (a & _MASK for a in itertools.accumulate(itertools.chain((first, ), deltas))))
+
+
+class Trace(Sequence):
+    """
+    Base class of compact basic block traces. Addresses are read in chunks, and the last chunk that was read is cached,
+    so that accessing a trace in order is cheap.
+    """
+
+    def __init__(self, chunk_size):
+        self._chunk_size = chunk_size
+        self._cached_chunk = None
+        self._cached_addrs = None
+
+    def _load_chunk(self, n):
+        raise NotImplementedError()
+
+    def _chunk(self, n):
+        if self._cached_chunk != n:
+            self._cached_addrs = self._load_chunk(n)
+            self._cached_chunk = n
+        return self._cached_addrs
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(len(self))
+            if step != 1:
+                return [ self[j] for j in range(start, stop, step) ]
+            result = [ ]
+            while start < stop:
+                c = start // self._chunk_size
+                base = c * self._chunk_size
+                result.extend(self._chunk(c)[start - base:stop - base])
+                start = base + self._chunk_size
+            return result
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("trace index out of range")
+        return self._chunk(i // self._chunk_size)[i % self._chunk_size]
+
+    def __iter__(self):
+        for n in range(-(-len(self) // self._chunk_size)):
+            # do not touch the cache, which is probably used by someone who is accessing the trace by index
+            yield from self._load_chunk(n)
+
+    def index(self, value, start=0, stop=None):
+        """
+        Find the first occurrence of an address in the trace.
+
+        :param int value:   The address.
+        :param int start:   The index to start searching at.
+        :param int stop:    The index to stop searching at (non-inclusive).
+        :return:            The index of the address.
+        :raises ValueError: If the address is not in the range.
+        """
+        n = len(self)
+        if start < 0:
+            start = max(start + n, 0)
+        if stop is None or stop > n:
+            stop = n
+        elif stop < 0:
+            stop += n
+
+        i = start
+        while i < stop:
+            c = i // self._chunk_size
+            base = c * self._chunk_size
+            addrs = self._chunk(c)
+            try:
+                return base + (i - base) + addrs[i - base:stop - base].index(value)
+            except ValueError:
+                i = base + self._chunk_size
+        raise ValueError("%#x is not in the trace" % value)
+
+
+class ArrayTrace(Trace):
+    """
+    A trace in an array of unsigned 64-bit integers, which takes 8 bytes per basic block instead of the more than 30
+    bytes that a list of Python integers takes.
+    """
+
+    def __init__(self, addrs, chunk_size=0x10000):
+        """
+        :param array.array addrs:   The addresses.
+        :param int chunk_size:      Number of addresses that are searched at a time.
+        """
+        super(ArrayTrace, self).__init__(chunk_size)
+        self._addrs = addrs
+
+    def __len__(self):
+        return len(self._addrs)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return self._addrs[i].tolist()
+        return self._addrs[i]
+
+    def __iter__(self):
+        return iter(self._addrs)
+
+    def _load_chunk(self, n):
+        return self._addrs[n * self._chunk_size:(n + 1) * self._chunk_size]
+
+
+class TraceFile(Trace):
+    """
+    A memory-mapped, delta-encoded trace file. Only the chunks that are accessed are decoded, so traces of any length
+    can be followed with constant memory.
+
+    The file starts with a header, followed by the chunks and a table of the offsets of all chunks. Each chunk holds
+    `chunk_size` addresses: the first address, followed by the differences between consecutive addresses, which are
+    stored as the smallest signed integer type that fits all differences in the chunk. All values are little-endian.
+    """
+
+    def __init__(self, path):
+        """
+        :param str path:    Path to the trace file.
+        """
+        self.path = path
+        self._file = open(path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self._len, chunk_size, _, table_offset = _HEADER.unpack_from(self._mmap, 0)
+        if magic != _MAGIC:
+            self.close()
+            raise AngrTracerError("%s is not a trace file" % path)
+        super(TraceFile, self).__init__(chunk_size)
+
+        num_chunks = -(-self._len // chunk_size)
+        self._offsets = array.array('Q')
+        self._offsets.frombytes(self._mmap[table_offset:table_offset + num_chunks * self._offsets.itemsize])
+        _little_endian(self._offsets)
+
+    def __len__(self):
+        return self._len
+
+    def __repr__(self):
+        return "<TraceFile %s: %d blocks>" % (self.path, self._len)
+
+    def __getstate__(self):
+        return { 'path': self.path }
+
+    def __setstate__(self, s):
+        self.__init__(s['path'])
+
+    def _load_chunk(self, n):
+        offset = self._offsets[n]
+        count = min(self._chunk_size, self._len - n * self._chunk_size)
+        first, code = _CHUNK_HEADER.unpack_from(self._mmap, offset)
+        deltas = array.array(code.decode())
+        offset += _CHUNK_HEADER.size
+        deltas.frombytes(self._mmap[offset:offset + (count - 1) * deltas.itemsize])
+        return _decode(first, _little_endian(deltas))
+
+    def close(self):
+        """
+        Unmap and close the trace file.
+
+        :return: None
+        """
+        self._mmap.close()
+        self._file.close()
+
+    @staticmethod
+    def _encode_chunk(addrs):
+        deltas = [ ]
+        for a, b in zip(addrs, itertools.islice(addrs, 1, None)):
+            d = (b - a) & _MASK
+            deltas.append(d - (1 << 64) if d >> 63 else d)
+
+        lo = min(deltas, default=0)
+        hi = max(deltas, default=0)
+        for code in 'bhiq':
+            bits = array.array(code).itemsize * 8
+            if -(1 << (bits - 1)) <= lo and hi < (1 << (bits - 1)):
+                break
+
+        return _CHUNK_HEADER.pack(addrs[0], code.encode()) + _little_endian(array.array(code, deltas)).tobytes()
+
+    @staticmethod
+    def write(path, addrs, chunk_size=4096):
+        """
+        Write a trace file. The addresses are consumed one chunk at a time, so they may come from a generator that
+        produces more addresses than fit into memory.
+
+        :param str path:        Path to the trace file.
+        :param addrs:           An iterable of the addresses of the basic blocks in the trace.
+        :param int chunk_size:  Number of addresses in each chunk.
+        :return:                Number of addresses in the trace.
+        :rtype:                 int
+        """
+        count = 0
+        offsets = array.array('Q')
+        it = iter(addrs)
+        with open(path, 'wb') as f:
+            f.write(b'\0' * _HEADER.size)
+            while True:
+                chunk = array.array('Q', itertools.islice(it, chunk_size))
+                if not chunk:
+                    break
+                offsets.append(f.tell())
+                f.write(TraceFile._encode_chunk(chunk))
+                count += len(chunk)
+
+            table_offset = f.tell()
+            f.write(_little_endian(offsets).tobytes())
+            f.seek(0)
+            f.write(_HEADER.pack(_MAGIC, count, chunk_size, 0, table_offset))
+        return count
+
+
+def load_trace(trace):
+    """
+    Turn a trace that is passed to the Tracer into a sequence of addresses.
+
+    :param trace:   A list or tuple of addresses, which is used as is, a Trace, the path to a trace file, an array, or
+                    any other iterable of addresses, which is consumed into an ArrayTrace.
+    :return:        The trace.
+    """
+    if trace is None or isinstance(trace, (list, tuple, Trace)):
+        return trace
+    if isinstance(trace, str):
+        return TraceFile(trace)
+    if isinstance(trace, array.array) and trace.typecode in ('Q', 'L') and trace.itemsize == 8:
+        return ArrayTrace(trace)
+    return ArrayTrace(array.array('Q', trace))
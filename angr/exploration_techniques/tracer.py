@@ -5,6 +5,7 @@ import logging
 from . import ExplorationTechnique
 from .. import BP_BEFORE, BP_AFTER, sim_options
 from ..errors import AngrTracerError
+from .trace_file import load_trace
 
 l = logging.getLogger(name=__name__)
 
@@ -18,7 +19,10 @@ class Tracer(ExplorationTechnique):
     If the given concrete input makes the program crash, you should provide crash_addr, and the
     crashing state will be found in the 'crashed' stash.
 
-    :param trace:               The basic block trace.
+    :param trace:               The basic block trace. It may be a list of addresses, the path to a
+                                trace file that was written with TraceFile.write(), which is read
+                                lazily, or any other iterable of addresses, which is stored in a
+                                compact array.
     :param resiliency:          Should we continue to step forward even if qemu and angr disagree?
     :param keep_predecessors:   Number of states before the final state we should log.
     :param crash_addr:          If the trace resulted in a crash, provide the crashing instruction
@@ -30,6 +34,11 @@ class Tracer(ExplorationTechnique):
                                 the missed states. It will be re-added for the last 2% of the trace
                                 in order to set the predecessors list correctly. If you turn this
                                 on you may want to enable the LAZY_SOLVES option.
+    :param fast_forward:        Execute the concrete parts of the trace natively in unicorn, and only
+                                step blocks that touch symbolic data symbolically. Unicorn is tried
+                                again right after each symbolic block instead of waiting for the
+                                usual cooldowns, and addresses where it repeatedly stops early are
+                                backed off by the adaptive cooldown.
 
     :ivar predecessors:         A list of states in the history before the final state.
     """
@@ -39,12 +48,14 @@ class Tracer(ExplorationTechnique):
             resiliency=False,
             keep_predecessors=1,
             crash_addr=None,
-            copy_states=False):
+            copy_states=False,
+            fast_forward=False):
         super(Tracer, self).__init__()
-        self._trace = trace
+        self._trace = load_trace(trace)
         self._resiliency = resiliency
         self._crash_addr = crash_addr
         self._copy_states = copy_states
+        self._fast_forward_mode = fast_forward
 
         self._aslr_slides = {}
         self._current_slide = None
@@ -96,6 +107,17 @@ class Tracer(ExplorationTechnique):
             simgr.active[0] = simgr.active[0].copy()
             simgr.active[0].options.remove(sim_options.COPY_STATES)
 
+        if self._fast_forward_mode:
+            state = simgr.one_active
+            state.options.add(sim_options.UNICORN)
+            state.options.add(sim_options.UNICORN_TRACK_BBL_ADDRS)
+            state.options.add(sim_options.UNICORN_ADAPTIVE_COOLDOWN)
+            # step the block that touched symbolic data symbolically, and then go back to unicorn.
+            # the symbolic memory countdown is decremented twice per block.
+            state.unicorn.cooldown_symbolic_registers = 2
+            state.unicorn.cooldown_symbolic_memory = 4
+            state.unicorn.cooldown_nonunicorn_blocks = 2
+
     def complete(self, simgr):
         return bool(simgr.traced)
 
@@ -179,15 +201,7 @@ class Tracer(ExplorationTechnique):
             if sync is not None:
                 raise Exception("TODO")
 
-            for addr in state.history.recent_bbl_addrs:
-                if addr == state.unicorn.transmit_addr:
-                    continue
-
-                if self._compare_addr(self._trace[idx], addr):
-                    idx += 1
-                else:
-                    raise Exception('BUG! Please investigate the claim in the comment above me')
-
+            idx = self._sync_blocks(state, idx)
             idx -= 1 # use normal code to do the last synchronization
 
         if sync is not None:
@@ -245,6 +259,32 @@ class Tracer(ExplorationTechnique):
         else:
             l.debug("Trace: %d/%d", state.globals['trace_idx'], len(self._trace))
 
+    def _sync_blocks(self, state, idx):
+        """
+        Check that the blocks that were executed in the last step follow the trace, starting at index `idx`.
+
+        :return: The index in the trace after the last block.
+        """
+        addrs = state.history.recent_bbl_addrs
+        if state.unicorn.transmit_addr is not None:
+            addrs = [ addr for addr in addrs if addr != state.unicorn.transmit_addr ]
+
+        # compare all blocks at once as long as they are in the same object
+        expected = self._trace[idx:idx + len(addrs)]
+        slide = self._current_slide
+        synced = 0
+        if slide is not None:
+            translated = [ addr + slide for addr in addrs ]
+            if translated == expected:
+                return idx + len(addrs)
+            while synced < len(expected) and translated[synced] == expected[synced]:
+                synced += 1
+
+        for i in range(synced, len(addrs)):
+            if i >= len(expected) or not self._compare_addr(expected[i], addrs[i]):
+                raise Exception('BUG! Blocks executed in unicorn do not follow the trace (see _update_state_tracking)')
+        return idx + len(addrs)
+
     def _translate_state_addr(self, state_addr, obj=None):
         if obj is None:
             obj = self.project.loader.find_object_containing(state_addr)
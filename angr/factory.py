@@ -268,7 +268,7 @@ class AngrObjectFactory(object):
     def block(self, addr, size=None, max_size=None, byte_string=None, vex=None, thumb=False, backup_state=None,
               extra_stop_points=None, opt_level=None, num_inst=None, traceflags=0,
               insn_bytes=None, insn_text=None,  # backward compatibility
-              strict_block_end=None, collect_data_refs=False,
+              strict_block_end=None, collect_data_refs=False, vex_nostmt=None,
               ):
 
         if insn_bytes is not None and insn_text is not None:
@@ -291,6 +291,7 @@ class AngrObjectFactory(object):
                      extra_stop_points=extra_stop_points, thumb=thumb, backup_state=backup_state,
                      opt_level=opt_level, num_inst=num_inst, traceflags=traceflags,
                      strict_block_end=strict_block_end, collect_data_refs=collect_data_refs,
+                     vex_nostmt=vex_nostmt,
          )
 
     def fresh_block(self, addr, size, backup_state=None):
@@ -5,4 +5,5 @@ from .comments import Comments
 from .data import Data
 from .indirect_jumps import IndirectJumps
 from .labels import Labels
+from .function_summaries import FunctionSummaries
 from .plugin import KnowledgeBasePlugin
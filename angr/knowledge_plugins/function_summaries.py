@@ -0,0 +1,19 @@
+from .plugin import KnowledgeBasePlugin
+
+
+class FunctionSummaries(KnowledgeBasePlugin, dict):
+    """
+    Reaching definition summaries of functions, keyed by function address.
+    """
+
+    def __init__(self, kb):
+        super(FunctionSummaries, self).__init__()
+        self._kb = kb
+
+    def copy(self):
+        o = FunctionSummaries(self._kb)
+        o.update(self)
+        return o
+
+
+KnowledgeBasePlugin.register_default('function_summaries', FunctionSummaries)
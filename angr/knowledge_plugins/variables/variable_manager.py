@@ -59,6 +59,35 @@ class VariableManagerInternal:
         self._phi_variables = { }
         self._phi_variables_by_block = defaultdict(set)
 
+    #
+    # Pickling
+    #
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # the manager refers to the knowledge base, and it is restored when the object is added to another manager
+        state['manager'] = None
+        # itertools.count cannot be pickled
+        counters = { }
+        for sort, counter in self._variable_counters.items():
+            n = next(counter)
+            self._variable_counters[sort] = count(n)
+            counters[sort] = n
+        state['_variable_counters'] = counters
+        # KeyedRegions of live variables refer to the analysis that created them through phi_node_contains
+        live_variables = { }
+        for addr, lv in self._live_variables.items():
+            register_region, stack_region = lv.register_region.copy(), lv.stack_region.copy()
+            register_region._phi_node_contains = None
+            stack_region._phi_node_contains = None
+            live_variables[addr] = LiveVariables(register_region, stack_region)
+        state['_live_variables'] = live_variables
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._variable_counters = {sort: count(n) for sort, n in self._variable_counters.items()}
+
     #
     # Public methods
     #
@@ -397,6 +426,19 @@ class VariableManager(KnowledgeBasePlugin):
 
         return self.function_managers[func_addr]
 
+    def set_function_manager(self, func_addr, manager):
+        """
+        Replace the VariableManagerInternal object of a function, e.g. with one that was recovered in another process.
+
+        :param int func_addr:                       Address of the function.
+        :param VariableManagerInternal manager:     The new VariableManagerInternal object.
+        :return:                                    None
+        """
+
+        manager.manager = self
+        manager.func_addr = func_addr
+        self.function_managers[func_addr] = manager
+
     def initialize_variable_names(self):
         self.global_manager.assign_variable_names()
         for manager in self.function_managers.values():
@@ -0,0 +1,177 @@
+import heapq
+import sys
+import types
+import weakref
+from collections import defaultdict
+
+import claripy
+
+# objects of these modules belong to the project or to native libraries, and are not retained by states
+_SHARED_MODULES = ('angr.project', 'angr.engines', 'angr.simos', 'angr.procedures', 'angr.sim_procedure',
+                   'angr.sim_type', 'angr.calling_conventions', 'angr.knowledge_base', 'angr.knowledge_plugins',
+                   'angr.analyses', 'claripy.backends', 'archinfo', 'cle', 'pyvex', 'unicorn', 'z3', )
+
+_ATOMIC_TYPES = (int, float, complex, bool, str, bytes, bytearray, type(None), )
+_SKIPPED_TYPES = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType,
+                  weakref.ReferenceType, weakref.ProxyType, weakref.CallableProxyType, )
+
+
+class Footprint:
+    """
+    Approximate memory footprint of a set of states.
+
+    Every object is only counted once, no matter how many states share it, and is attributed to the first plugin that
+    is found to reference it. Copy-on-write pages and ASTs that are shared between states are therefore only counted
+    for the first state that is added, and the footprint of each state that is added after that is the memory that it
+    retains in addition to the states before it.
+
+    Sizes are estimated with sys.getsizeof(), so memory that is allocated by native libraries (e.g., z3) is not
+    included.
+    """
+
+    def __init__(self, top=10):
+        """
+        :param int top: Number of the largest pages and ASTs to keep track of.
+        """
+        self.top = top
+        self.total = 0
+        self.states = 0
+        self.plugins = defaultdict(int)
+        self.groups = defaultdict(int)
+
+        self._seen = set()
+        self._top_pages = [ ]
+        self._top_asts = [ ]
+        self._counter = 0
+
+    def add_state(self, state, group=None):
+        """
+        Account for the memory of a state.
+
+        :param SimState state:  The state.
+        :param str group:       Name of a group of states (e.g., a stash) that the state is accounted to.
+        :return:                A dict of the number of bytes newly accounted for each plugin of the state.
+        :rtype:                 dict
+        """
+        self.states += 1
+        self._seen.add(id(state))
+        self._seen.add(id(state.__dict__))
+
+        sizes = { }
+        for name, plugin in sorted(state.plugins.items()):
+            sizes[name] = self._walk(plugin, name)
+        sizes['<state>'] = sys.getsizeof(state) + sys.getsizeof(state.__dict__) + \
+                           sum(self._walk(v, '<state>') for k, v in state.__dict__.items() if k != '_active_plugins')
+
+        for name, size in sizes.items():
+            self.plugins[name] += size
+            self.total += size
+        if group is not None:
+            self.groups[group] += sum(sizes.values())
+        return sizes
+
+    @property
+    def top_pages(self):
+        """
+        The largest memory pages, as a list of tuples of size, plugin name, and page address.
+        """
+        return [ (size, name, addr) for size, _, name, addr in sorted(self._top_pages, reverse=True) ]
+
+    @property
+    def top_asts(self):
+        """
+        The largest ASTs, as a list of tuples of size, plugin name, and AST.
+        """
+        return [ (size, name, ast) for size, _, name, ast in sorted(self._top_asts, reverse=True) ]
+
+    def report(self):
+        """
+        Describe the footprint in a human-readable way.
+
+        :return: The description.
+        :rtype: str
+        """
+        lines = [ "%d bytes in %d states" % (self.total, self.states) ]
+        for name, size in sorted(self.plugins.items(), key=lambda kv: kv[1], reverse=True):
+            lines.append("    %-16s %12d bytes" % (name, size))
+        if self.groups:
+            lines.append("By group:")
+            for name, size in sorted(self.groups.items(), key=lambda kv: kv[1], reverse=True):
+                lines.append("    %-16s %12d bytes" % (name, size))
+        if self._top_pages:
+            lines.append("Largest pages:")
+            for size, name, addr in self.top_pages:
+                lines.append("    %-16s %#14x %12d bytes" % (name, addr, size))
+        if self._top_asts:
+            lines.append("Largest ASTs:")
+            for size, name, ast in self.top_asts:
+                lines.append("    %-16s %12d bytes  %s" % (name, size, ast.shallow_repr(max_depth=2)))
+        return "\n".join(lines)
+
+    def _record(self, heap, size, name, obj):
+        # the counter breaks ties, so that the objects themselves are never compared
+        self._counter += 1
+        item = (size, self._counter, name, obj)
+        if len(heap) < self.top:
+            heapq.heappush(heap, item)
+        elif self.top:
+            heapq.heappushpop(heap, item)
+
+    def _walk(self, root, name, nested=False):
+        """
+        Count the bytes of all objects that are reachable from an object and have not been counted before.
+
+        :param root:        The object.
+        :param str name:    Name of the plugin that the object belongs to.
+        :param bool nested: Whether the object is part of a page or an AST that is already being measured.
+        :return:            The number of bytes.
+        """
+        total = 0
+        stack = [ root ]
+        while stack:
+            obj = stack.pop()
+            if id(obj) in self._seen:
+                continue
+            t = type(obj)
+            if t in _SKIPPED_TYPES or (t.__module__ or '').startswith(_SHARED_MODULES) or isinstance(obj, SimState):
+                continue
+
+            if not nested and obj is not root:
+                # measure pages and ASTs separately, so that the largest ones can be reported
+                if isinstance(obj, BasePage):
+                    size = self._walk(obj, name, nested=True)
+                    self._record(self._top_pages, size, name, obj._page_addr)
+                    total += size
+                    continue
+                if isinstance(obj, claripy.ast.Base):
+                    size = self._walk(obj, name, nested=True)
+                    self._record(self._top_asts, size, name, obj)
+                    total += size
+                    continue
+
+            self._seen.add(id(obj))
+            total += sys.getsizeof(obj)
+            if t in _ATOMIC_TYPES:
+                continue
+
+            if isinstance(obj, dict):
+                stack.extend(obj.keys())
+                stack.extend(obj.values())
+            elif isinstance(obj, (list, tuple, set, frozenset)):
+                stack.extend(obj)
+            d = getattr(obj, '__dict__', None)
+            if type(d) is dict:
+                stack.append(d)
+            for cls in t.__mro__:
+                slots = cls.__dict__.get('__slots__', ())
+                for slot in (slots, ) if isinstance(slots, str) else slots:
+                    if slot not in ('__dict__', '__weakref__'):
+                        v = getattr(obj, slot, None)
+                        if v is not None:
+                            stack.append(v)
+
+        return total
+
+
+from ..sim_state import SimState
+from ..storage.paged_memory import BasePage
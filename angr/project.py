@@ -54,6 +54,9 @@ class Project:
     :param arch:                        The target architecture (auto-detected otherwise).
     :param simos:                       a SimOS class to use for this project.
     :param bool translation_cache:      If True, cache translated basic blocks rather than re-translating them.
+    :param persistent_block_cache:      Path to an on-disk cache of translated basic blocks, or a
+                                        PersistentBlockCache instance. The cache is shared across projects, runs, and
+                                        processes.
     :param support_selfmodifying_code:  Whether we aggressively support self-modifying code. When enabled, emulation
                                         will try to read code from the current state instead of the original memory,
                                         regardless of the current memory protections.
@@ -88,6 +91,7 @@ class Project:
                  arch=None, simos=None,
                  load_options=None,
                  translation_cache=True,
+                 persistent_block_cache=None,
                  support_selfmodifying_code=False,
                  store_function=None,
                  load_function=None,
@@ -162,6 +166,10 @@ class Project:
         self._ignore_functions = ignore_functions
         self._support_selfmodifying_code = support_selfmodifying_code
         self._translation_cache = translation_cache
+        if isinstance(persistent_block_cache, str):
+            persistent_block_cache = PersistentBlockCache(persistent_block_cache)
+        self._persistent_block_cache = persistent_block_cache
+        self._solver_query_cache = SolverQueryCache()
         self._executing = False # this is a flag for the convenience API, exec() and terminate_execution() below
 
         if self._support_selfmodifying_code:
@@ -689,3 +697,5 @@ from .analyses.analysis import AnalysesHub
 from .knowledge_base import KnowledgeBase
 from .engines import EngineHub
 from .procedures import SIM_PROCEDURES, SIM_LIBRARIES
+from .engines.vex.persistent_cache import PersistentBlockCache
+from .state_plugins.solver import SolverQueryCache
@@ -601,6 +601,23 @@ class SimulationManager:
         self._store_states(to_stash, split)
         return self
 
+    def footprint(self, stash=None, top=10):
+        """
+        Estimate how much memory the states in the simulation manager retain, per plugin and per stash. Pages and ASTs
+        that are shared between states are only counted once, for the first state that holds them.
+
+        :param str stash:   Only count the states in this stash. By default, all stashes are counted.
+        :param int top:     Number of the largest pages and ASTs to report.
+        :return:            The footprint of the states. Use its report() method for a summary.
+        :rtype:             angr.misc.footprint.Footprint
+        """
+        fp = Footprint(top=top)
+        for name, states in self._stashes.items():
+            if stash is None or name == stash:
+                for state in states:
+                    fp.add_state(state, group=name)
+        return fp
+
     @staticmethod
     def _merge_key(state):
         return (state.addr if not state.regs._ip.symbolic else 'SYMBOLIC',
@@ -806,5 +823,6 @@ class ErrorRecord:
 from .errors import SimError, SimMergeError
 from .sim_state import SimState
 from .state_hierarchy import StateHierarchy
+from .misc.footprint import Footprint
 from .errors import AngrError, SimUnsatError, SimulationManagerError
 from .exploration_techniques import ExplorationTechnique, Veritesting, Threading, Explorer
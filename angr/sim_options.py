@@ -178,6 +178,13 @@ FAST_MEMORY = "FAST_MEMORY"
 # use FastMemory for registers
 FAST_REGISTERS = "FAST_REGISTERS"
 
+# use array-backed pages in SimPagedMemory, which store concrete bytes in a bytearray instead of memory objects
+ARRAY_PAGES = "ARRAY_PAGES"
+
+# keep block addresses, jumpkinds, and jump guards of the whole history in chunked logs that are shared between
+# histories, so that they can be indexed in constant time
+CHUNKED_HISTORY = "CHUNKED_HISTORY"
+
 # Under-constrained symbolic execution
 UNDER_CONSTRAINED_SYMEXEC = "UNDER_CONSTRAINED_SYMEXEC"
 
@@ -196,6 +203,9 @@ UNICORN_AGGRESSIVE_CONCRETIZATION = "UNICORN_AGGRESSIVE_CONCRETIZATION"
 
 UNICORN_HANDLE_TRANSMIT_SYSCALL = "UNICORN_HANDLE_TRANSMIT_SYSCALL"
 
+# decide whether to enter unicorn based on how many blocks previous runs from the same address managed to execute
+UNICORN_ADAPTIVE_COOLDOWN = "UNICORN_ADAPTIVE_COOLDOWN"
+
 # floating point support
 SUPPORT_FLOATING_POINT = "SUPPORT_FLOATING_POINT"
 
@@ -229,6 +239,13 @@ REPLACEMENT_SOLVER = "REPLACEMENT_SOLVER"
 # use a cache-less solver in claripy
 CACHELESS_SOLVER = "CACHELESS_SOLVER"
 
+# share the results of solver queries between all states of a project
+SOLVER_QUERY_CACHE = "SOLVER_QUERY_CACHE"
+
+# keep the constraints of each state partitioned into independent groups, and only pass the groups that are relevant to
+# a query to the solver
+CONSTRAINT_SLICING = "CONSTRAINT_SLICING"
+
 # IR optimization
 OPTIMIZE_IR = "OPTIMIZE_IR"
 
@@ -399,6 +399,19 @@ class SimState(PluginHub):
         if 'solver' in self.plugins:
             self.solver.downsize()
 
+    def footprint(self, top=10):
+        """
+        Estimate how much memory this state retains, per plugin. Objects that are shared between plugins are only
+        counted once.
+
+        :param int top: Number of the largest pages and ASTs to report.
+        :return:        The footprint of the state. Use its report() method for a summary.
+        :rtype:         angr.misc.footprint.Footprint
+        """
+        fp = Footprint(top=top)
+        fp.add_state(self)
+        return fp
+
     #
     # State branching operations
     #
@@ -792,6 +805,7 @@ SimState.register_preset('default', default_state_plugin_preset)
 from .state_plugins.history import SimStateHistory
 from .state_plugins.inspect import BP_AFTER, BP_BEFORE
 from .state_plugins.sim_action import SimActionConstraint
+from .misc.footprint import Footprint
 
 from . import sim_options as o
 from .errors import SimMergeError, SimValueError, SimStateError, SimSolverModeError
@@ -13,7 +13,7 @@ from .scratch import *
 from .cgc import *
 from .gdb import *
 from .uc_manager import *
-from .unicorn_engine import Unicorn
+from .unicorn_engine import Unicorn, UnicornStats
 from .sim_action import *
 from .sim_action_object import *
 from .sim_event import *
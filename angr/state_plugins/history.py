@@ -1,6 +1,7 @@
 import operator
 import logging
 import itertools
+from collections.abc import Sequence
 
 import claripy
 
@@ -59,6 +60,9 @@ class SimStateHistory(SimStatePlugin):
 
         self.strongref_state = None if clone is None else clone.strongref_state
 
+        # HistoryLogs of the ancestors of this history (see CHUNKED_HISTORY), which are built on demand
+        self._ancestor_logs = None if clone is None else clone._ancestor_logs
+
     def init_state(self):
         self.successor_ip = self.state._ip
 
@@ -74,6 +78,7 @@ class SimStateHistory(SimStatePlugin):
 
         d = super(SimStateHistory, self).__getstate__()
         d['strongref_state'] = None
+        d['_ancestor_logs'] = None
         d['ancestry'] = ancestry
         d['successor_ip'] = self.successor_ip
         return d
@@ -116,6 +121,7 @@ class SimStateHistory(SimStatePlugin):
         # we must fix this in order to get
         # correct results when using constraints_since()
         self.parent = common_ancestor if common_ancestor is not None else self.parent
+        self._ancestor_logs = None
 
         self.recent_events = [e.recent_events for e in itertools.chain([self], others)
                               if not isinstance(e, SimActionConstraint)
@@ -149,8 +155,22 @@ class SimStateHistory(SimStatePlugin):
         """
         new_hist = self.copy({})
         new_hist.parent = None
+        new_hist._ancestor_logs = None
         self.state.register_plugin('history', new_hist)
 
+    def trim_events(self, keep_constraints=True):
+        """
+        Discard the events and actions of this history and all of its ancestors. Ancestors are shared with other states,
+        which lose their events as well.
+
+        :param keep_constraints:    Keep the constraint actions, which are needed to merge states.
+        """
+        for hist in HistoryIter(self)._iter_nodes():
+            if keep_constraints:
+                hist.recent_events = [ ev for ev in hist.recent_events if isinstance(ev, SimActionConstraint) ]
+            else:
+                hist.recent_events = [ ]
+
     def filter_actions(self, block_addr=None, block_stmt=None, insn_addr=None, read_from=None, write_to=None):
         """
         Filter self.actions based on some common parameters.
@@ -347,9 +367,13 @@ class SimStateHistory(SimStatePlugin):
         return LambdaIterIter(self, operator.attrgetter('recent_actions'))
     @property
     def jumpkinds(self):
+        if self._use_logs:
+            return HistoryLogView(self._logs()[1], [ ] if self.jumpkind is None else [ self.jumpkind ])
         return LambdaAttrIter(self, operator.attrgetter('jumpkind'))
     @property
     def jump_guards(self):
+        if self._use_logs:
+            return HistoryLogView(self._logs()[2], [ ] if self.jump_guard is None else [ self.jump_guard ])
         return LambdaAttrIter(self, operator.attrgetter('jump_guard'))
     @property
     def jump_targets(self):
@@ -359,6 +383,8 @@ class SimStateHistory(SimStatePlugin):
         return LambdaAttrIter(self, operator.attrgetter('recent_description'))
     @property
     def bbl_addrs(self):
+        if self._use_logs:
+            return HistoryLogView(self._logs()[0], self.recent_bbl_addrs)
         return LambdaIterIter(self, operator.attrgetter('recent_bbl_addrs'))
     @property
     def ins_addrs(self):
@@ -426,7 +452,150 @@ class SimStateHistory(SimStatePlugin):
         return constraints
 
     def make_child(self):
-        return SimStateHistory(parent=self)
+        child = SimStateHistory(parent=self)
+        if self._use_logs:
+            child._ancestor_logs = self._child_logs()
+        return child
+
+    #
+    # Chunked logs
+    #
+
+    @property
+    def _use_logs(self):
+        return self._ancestor_logs is not None or \
+               (self.state is not None and sim_options.CHUNKED_HISTORY in self.state.options)
+
+    def _logs(self):
+        """
+        Get the logs of the block addresses, jumpkinds, and jump guards of all ancestors of this history.
+        """
+        if self._ancestor_logs is None:
+            # build the missing logs from the closest ancestor that has them
+            missing = [ ]
+            hist = self.parent
+            while hist is not None and hist._ancestor_logs is None:
+                missing.append(hist)
+                hist = hist.parent
+            logs = (HistoryLog(), HistoryLog(), HistoryLog()) if hist is None else hist._child_logs()
+            for hist in reversed(missing):
+                hist._ancestor_logs = logs
+                logs = hist._child_logs()
+            self._ancestor_logs = logs
+        return self._ancestor_logs
+
+    def _child_logs(self):
+        """
+        Get the logs of all ancestors of a child of this history, i.e., the logs of this history including itself.
+        """
+        bbl_addrs, jumpkinds, jump_guards = self._logs()
+        return (
+            bbl_addrs.extend(self.recent_bbl_addrs),
+            jumpkinds if self.jumpkind is None else jumpkinds.extend((self.jumpkind, )),
+            jump_guards if self.jump_guard is None else jump_guards.extend((self.jump_guard, )),
+        )
+
+class HistoryLog(object):
+    """
+    An immutable sequence of values from a lineage of histories, which shares its storage with the logs of the
+    descendants of the histories.
+
+    Values are stored in chunks. Full chunks are never modified, so they are shared by all logs that contain them. The
+    last, partial chunk is extended in place by the first log that is extended, and only copied when another log
+    extends the same prefix, i.e., when the state has forked.
+    """
+
+    __slots__ = ('_chunks', '_tail', '_len')
+
+    CHUNK_SIZE = 1024
+
+    def __init__(self, chunks=(), tail=None, length=0):
+        self._chunks = chunks
+        # only the first (length - len(chunks) * CHUNK_SIZE) values of the tail belong to this log
+        self._tail = [ ] if tail is None else tail
+        self._len = length
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self._len
+        if not 0 <= i < self._len:
+            raise IndexError(i)
+        c, i = divmod(i, self.CHUNK_SIZE)
+        if c < len(self._chunks):
+            return self._chunks[c][i]
+        return self._tail[i]
+
+    def __iter__(self):
+        for chunk in self._chunks:
+            yield from chunk
+        yield from itertools.islice(self._tail, self._len - len(self._chunks) * self.CHUNK_SIZE)
+
+    def __reversed__(self):
+        for i in range(self._len - 1, -1, -1):
+            yield self[i]
+
+    def extend(self, values):
+        """
+        Create a log with some more values.
+
+        :param values:  The values.
+        :return:        The new log.
+        :rtype:         HistoryLog
+        """
+        if not values:
+            return self
+
+        chunks, tail, length = self._chunks, self._tail, self._len
+        if len(tail) != length - len(chunks) * self.CHUNK_SIZE:
+            # another log has already extended the tail
+            tail = tail[:length - len(chunks) * self.CHUNK_SIZE]
+
+        for v in values:
+            tail.append(v)
+            length += 1
+            if len(tail) == self.CHUNK_SIZE:
+                chunks += (tail, )
+                tail = [ ]
+
+        return HistoryLog(chunks, tail, length)
+
+
+class HistoryLogView(Sequence):
+    """
+    The values in the log of the ancestors of a history, followed by the values of the history itself.
+    """
+
+    def __init__(self, log, recent):
+        self._log = log
+        self._recent = recent
+
+    def __len__(self):
+        return len(self._log) + len(self._recent)
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            return [ self[i] for i in range(*k.indices(len(self))) ]
+        if k < 0:
+            k += len(self)
+        if k < len(self._log):
+            return self._log[k]
+        return self._recent[k - len(self._log)]
+
+    def __iter__(self):
+        yield from self._log
+        yield from self._recent
+
+    def __reversed__(self):
+        yield from reversed(self._recent)
+        yield from reversed(self._log)
+
+    @property
+    def hardcopy(self):
+        return list(self)
+
 
 class TreeIter(object):
     def __init__(self, start, end=None):
@@ -3,6 +3,8 @@ import functools
 import time
 import logging
 
+from cachetools import LRUCache
+
 from .plugin import SimStatePlugin
 from .sim_action_object import ast_stripping_decorator, SimActionObject
 
@@ -25,6 +27,7 @@ def timed_function(f):
             the_solver = args[0] if the_solver is None else the_solver
             s = the_solver.state
 
+            the_solver._query_cache_hit = False
             start = time.time()
             r = f(*args, **kwargs)
             end = time.time()
@@ -44,7 +47,11 @@ def timed_function(f):
             except Exception: #pylint:disable=broad-except
                 l.error("Got exception while generating timer message:", exc_info=True)
                 location = "unknown"
-            lt.log(int((end-start)*10), '%s took %s seconds at %s', f.__name__, round(duration, 2), location)
+            if the_solver._query_cache_hit:
+                lt.log(int((end-start)*10), '%s hit the query cache in %s seconds at %s', f.__name__,
+                       round(duration, 2), location)
+            else:
+                lt.log(int((end-start)*10), '%s took %s seconds at %s', f.__name__, round(duration, 2), location)
 
             if break_time >= 0 and duration > break_time:
                 import ipdb; ipdb.set_trace()
@@ -89,6 +96,216 @@ def error_converter(f):
             raise SimSolverModeError("Claripy threw an error") from e
     return wrapped_f
 
+#
+# Query caching
+#
+
+class SolverQueryCache:
+    """
+    A cache of solver query results, shared between all states of a project.
+
+    Results are keyed by the set of constraints of the solver (regardless of their order), the query, and its
+    arguments, including the extra constraints. ASTs are identified by their structural hashes, so states that
+    independently built the same constraints share cache entries. The replacements of replacement frontends are part
+    of the key as well, since they change the answers of the solver.
+    """
+
+    def __init__(self, maxsize=65536, max_solvers=1024):
+        """
+        :param int maxsize:     Maximum number of results to keep. The least recently used ones are evicted first.
+        :param int max_solvers: Maximum number of solvers for constraint slices to keep.
+        """
+        self.maxsize = maxsize
+        self.max_solvers = max_solvers
+        self.hits = 0
+        self.misses = 0
+        self._cache = LRUCache(maxsize=maxsize)
+        self._solvers = LRUCache(maxsize=max_solvers)
+
+    def __len__(self):
+        return len(self._cache)
+
+    def __repr__(self):
+        return "<SolverQueryCache: %d entries, %d hits, %d misses>" % (len(self._cache), self.hits, self.misses)
+
+    def __getstate__(self):
+        # cached results are cheap to recompute, and not worth persisting
+        return { 'maxsize': self.maxsize, 'max_solvers': self.max_solvers }
+
+    def __setstate__(self, s):
+        self.__init__(maxsize=s['maxsize'], max_solvers=s.get('max_solvers', 1024))
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return float(self.hits) / total if total else 0.
+
+    @staticmethod
+    def _arg_key(arg):
+        if isinstance(arg, claripy.ast.Base):
+            return hash(arg)
+        elif isinstance(arg, (tuple, list, set, frozenset)):
+            # extra constraints
+            return frozenset(SolverQueryCache._arg_key(a) for a in arg)
+        return arg
+
+    def make_key(self, query, solver, global_condition, args, kwargs):
+        """
+        Generate the key of a query.
+
+        :param str query:           Name of the query.
+        :param solver:              The claripy frontend that answers the query.
+        :param global_condition:    The global condition of the state, or None.
+        :param tuple args:          Positional arguments of the query.
+        :param dict kwargs:         Keyword arguments of the query.
+        :return:                    The key.
+        """
+        replacements = getattr(solver, '_replacements', None)
+        return (
+            query,
+            type(solver).__name__,
+            frozenset(hash(c) for c in solver.constraints),
+            None if replacements is None else frozenset((hash(k), hash(v)) for k, v in replacements.items()),
+            None if global_condition is None else hash(global_condition),
+            tuple(self._arg_key(a) for a in args),
+            tuple(sorted((k, self._arg_key(v)) for k, v in kwargs.items())),
+        )
+
+    def lookup(self, key):
+        """
+        :return: A tuple of whether the result is cached, and the result.
+        """
+        try:
+            r = self._cache[key]
+        except KeyError:
+            self.misses += 1
+            return False, None
+        self.hits += 1
+        return True, r
+
+    def store(self, key, result):
+        self._cache[key] = result
+
+    def solver_for(self, constraints):
+        """
+        Get a solver that holds exactly the given constraints. Solvers are shared between all states, so states that
+        have the same slice of constraints also share the models that the solver has cached.
+
+        :param constraints: The constraints.
+        :return:            A claripy frontend.
+        """
+        key = frozenset(hash(c) for c in constraints)
+        try:
+            return self._solvers[key]
+        except KeyError:
+            solver = claripy.Solver()
+            solver.add(constraints)
+            self._solvers[key] = solver
+            return solver
+
+    def clear(self):
+        """
+        Remove all results and solvers, and reset hit/miss counters.
+        """
+        self._cache.clear()
+        self._solvers.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+class ConstraintPartitions:
+    """
+    The constraints of a state, partitioned into groups that do not share any variables. Groups are merged
+    incrementally as constraints are added, in the manner of union-find.
+    """
+
+    __slots__ = ('_groups', '_var_group', )
+
+    def __init__(self, groups=None, var_group=None):
+        # frozenset of the variables of a group -> tuple of its constraints. Constraints without variables are in the
+        # group of the empty set.
+        self._groups = { } if groups is None else groups
+        # variable -> frozenset of the variables of its group
+        self._var_group = { } if var_group is None else var_group
+
+    def __len__(self):
+        return len(self._groups)
+
+    def copy(self):
+        return ConstraintPartitions(groups=dict(self._groups), var_group=dict(self._var_group))
+
+    def add(self, constraint):
+        """
+        Add a constraint, merging all groups that share variables with it.
+
+        :param constraint: The constraint.
+        """
+        if constraint.op == 'BoolV' and constraint.args[0] is True:
+            return
+
+        variables = set(constraint.variables)
+        if not variables:
+            self._groups[frozenset()] = self._groups.get(frozenset(), ()) + (constraint, )
+            return
+
+        constraints = ( )
+        for key in { self._var_group[v] for v in variables if v in self._var_group }:
+            variables |= key
+            constraints += self._groups.pop(key)
+
+        key = frozenset(variables)
+        self._groups[key] = constraints + (constraint, )
+        for v in key:
+            self._var_group[v] = key
+
+    def groups(self):
+        """
+        :return: The tuples of constraints of all groups.
+        """
+        return list(self._groups.values())
+
+    def slice(self, variables):
+        """
+        Get the constraints of all groups that share variables with the given ones, as well as all constraints without
+        variables.
+
+        :param variables:   The variables.
+        :return:            A tuple of constraints.
+        """
+        constraints = self._groups.get(frozenset(), ())
+        for key in { self._var_group[v] for v in variables if v in self._var_group }:
+            constraints += self._groups[key]
+        return constraints
+
+
+_default_query_cache = SolverQueryCache()
+
+def cached_query(f):
+    """
+    Answer a query from the query cache of the project if SOLVER_QUERY_CACHE is enabled.
+    """
+    @functools.wraps(f)
+    def cached_f(self, *args, **kwargs):
+        if o.SOLVER_QUERY_CACHE not in self.state.options:
+            return f(self, *args, **kwargs)
+
+        cache = self._query_cache
+        if f.__name__ == 'satisfiable':
+            solver = self._solver
+        else:
+            # with CONSTRAINT_SLICING, the result of the query only depends on the relevant slice of the constraints
+            solver = self._query_solver(args[0], kwargs.get('extra_constraints', ()))
+        key = cache.make_key(f.__name__, solver, self.state._global_condition, args, kwargs)
+        cached, r = cache.lookup(key)
+        if cached:
+            self._query_cache_hit = True
+            return r
+
+        r = f(self, *args, **kwargs)
+        cache.store(key, r)
+        return r
+    return cached_f
+
 #
 # Premature optimizations
 #
@@ -176,13 +393,17 @@ class SimSolver(SimStatePlugin):
 
     Any top-level variable of the claripy module can be accessed as a property of this object.
     """
-    def __init__(self, solver=None, all_variables=None, temporal_tracked_variables=None, eternal_tracked_variables=None): #pylint:disable=redefined-outer-name
+    def __init__(self, solver=None, all_variables=None, temporal_tracked_variables=None, eternal_tracked_variables=None,
+                 partitions=None): #pylint:disable=redefined-outer-name
         l.debug("Creating SimSolverClaripy.")
         SimStatePlugin.__init__(self)
         self._stored_solver = solver
         self.all_variables = [] if all_variables is None else all_variables
         self.temporal_tracked_variables = {} if temporal_tracked_variables is None else temporal_tracked_variables
         self.eternal_tracked_variables = {} if eternal_tracked_variables is None else eternal_tracked_variables
+        self._query_cache_hit = False
+        # independent groups of constraints, for CONSTRAINT_SLICING. None if they have to be recomputed.
+        self._partitions = partitions
 
     def reload_solver(self, constraints=None):
         """
@@ -194,6 +415,7 @@ class SimSolver(SimStatePlugin):
         if constraints is None:
             constraints = self._solver.constraints
         self._stored_solver = None
+        self._partitions = None
         self._solver.add(constraints)
 
     def get_variables(self, *keys):
@@ -255,6 +477,15 @@ class SimSolver(SimStatePlugin):
             if var in reverse_mapping:
                 yield reverse_mapping[var]
 
+    @property
+    def _query_cache(self):
+        """
+        The query cache of the project, or a global query cache for states without a project.
+        """
+        if self.state.project is not None:
+            return self.state.project._solver_query_cache
+        return _default_query_cache
+
     @property
     def _solver(self):
         """
@@ -285,6 +516,61 @@ class SimSolver(SimStatePlugin):
 
         return self._stored_solver
 
+    #
+    # Constraint slicing
+    #
+
+    def _slicing_enabled(self):
+        return o.CONSTRAINT_SLICING in self.state.options and type(self._solver) in (claripy.Solver,
+                                                                                    claripy.SolverComposite)
+
+    def _get_partitions(self):
+        if self._partitions is None:
+            self._partitions = ConstraintPartitions()
+            for c in self._solver.constraints:
+                self._partitions.add(c)
+        return self._partitions
+
+    def _query_solver(self, e, extra_constraints=()):
+        """
+        Get the frontend that should answer a query about an expression. With CONSTRAINT_SLICING, this is a frontend
+        that only holds the groups of constraints that share variables with the expression or the extra constraints.
+        Like any independence optimization, this assumes that the remaining constraints are satisfiable.
+
+        :param e:                   The expression, or None.
+        :param extra_constraints:   The extra constraints of the query.
+        :return:                    A claripy frontend.
+        """
+        if not self._slicing_enabled():
+            return self._solver
+
+        variables = set(e.variables) if isinstance(e, claripy.ast.Base) else set()
+        for c in self._adjust_constraint_list(extra_constraints):
+            variables |= c.variables
+        return self._query_cache.solver_for(self._get_partitions().slice(variables))
+
+    def _sliced_satisfiable(self, extra_constraints=(), exact=None):
+        """
+        Check the satisfiability of all groups of constraints separately, using the shared solvers of the groups.
+        """
+        extra_constraints = self._adjust_constraint_list(extra_constraints)
+        partitions = self._get_partitions()
+
+        variables = set()
+        for c in extra_constraints:
+            variables |= c.variables
+        relevant = partitions.slice(variables)
+        if not self._query_cache.solver_for(relevant).satisfiable(extra_constraints=extra_constraints, exact=exact):
+            return False
+
+        relevant = { id(c) for c in relevant }
+        for group in partitions.groups():
+            if id(group[0]) in relevant:
+                continue
+            if not self._query_cache.solver_for(group).satisfiable(exact=exact):
+                return False
+        return True
+
     #
     # Get unconstrained stuff
     #
@@ -398,7 +684,8 @@ class SimSolver(SimStatePlugin):
 
     @SimStatePlugin.memo
     def copy(self, memo): # pylint: disable=unused-argument
-        return SimSolver(solver=self._solver.branch(), all_variables=self.all_variables, temporal_tracked_variables=self.temporal_tracked_variables, eternal_tracked_variables=self.eternal_tracked_variables)
+        return SimSolver(solver=self._solver.branch(), all_variables=self.all_variables, temporal_tracked_variables=self.temporal_tracked_variables, eternal_tracked_variables=self.eternal_tracked_variables,
+                         partitions=None if self._partitions is None else self._partitions.copy())
 
     @error_converter
     def merge(self, others, merge_conditions, common_ancestor=None): # pylint: disable=W0613
@@ -406,6 +693,7 @@ class SimSolver(SimStatePlugin):
             [ oc._solver for oc in others ], merge_conditions,
             common_ancestor=common_ancestor._solver if common_ancestor is not None else None
         )
+        self._partitions = None
         return merging_occurred
 
     @error_converter
@@ -470,6 +758,7 @@ class SimSolver(SimStatePlugin):
     @timed_function
     @ast_stripping_decorator
     @error_converter
+    @cached_query
     def _eval(self, e, n, extra_constraints=(), exact=None):
         """
         Evaluate an expression, using the solver if necessary. Returns primitives.
@@ -481,12 +770,14 @@ class SimSolver(SimStatePlugin):
         :return: a tuple of the solutions, in the form of Python primitives
         :rtype: tuple
         """
-        return self._solver.eval(e, n, extra_constraints=self._adjust_constraint_list(extra_constraints), exact=exact)
+        solver = self._query_solver(e, extra_constraints)
+        return solver.eval(e, n, extra_constraints=self._adjust_constraint_list(extra_constraints), exact=exact)
 
     @concrete_path_scalar
     @timed_function
     @ast_stripping_decorator
     @error_converter
+    @cached_query
     def max(self, e, extra_constraints=(), exact=None):
         """
         Return the maximum value of expression `e`.
@@ -496,17 +787,19 @@ class SimSolver(SimStatePlugin):
         :param exact            : if False, return approximate solutions.
         :return: the maximum possible value of e (backend object)
         """
+        solver = self._query_solver(e, extra_constraints)
         if exact is False and o.VALIDATE_APPROXIMATIONS in self.state.options:
-            ar = self._solver.max(e, extra_constraints=self._adjust_constraint_list(extra_constraints), exact=False)
-            er = self._solver.max(e, extra_constraints=self._adjust_constraint_list(extra_constraints))
+            ar = solver.max(e, extra_constraints=self._adjust_constraint_list(extra_constraints), exact=False)
+            er = solver.max(e, extra_constraints=self._adjust_constraint_list(extra_constraints))
             assert er <= ar
             return ar
-        return self._solver.max(e, extra_constraints=self._adjust_constraint_list(extra_constraints), exact=exact)
+        return solver.max(e, extra_constraints=self._adjust_constraint_list(extra_constraints), exact=exact)
 
     @concrete_path_scalar
     @timed_function
     @ast_stripping_decorator
     @error_converter
+    @cached_query
     def min(self, e, extra_constraints=(), exact=None):
         """
         Return the minimum value of expression `e`.
@@ -516,12 +809,13 @@ class SimSolver(SimStatePlugin):
         :param exact            : if False, return approximate solutions.
         :return: the minimum possible value of e (backend object)
         """
+        solver = self._query_solver(e, extra_constraints)
         if exact is False and o.VALIDATE_APPROXIMATIONS in self.state.options:
-            ar = self._solver.min(e, extra_constraints=self._adjust_constraint_list(extra_constraints), exact=False)
-            er = self._solver.min(e, extra_constraints=self._adjust_constraint_list(extra_constraints))
+            ar = solver.min(e, extra_constraints=self._adjust_constraint_list(extra_constraints), exact=False)
+            er = solver.min(e, extra_constraints=self._adjust_constraint_list(extra_constraints))
             assert ar <= er
             return ar
-        return self._solver.min(e, extra_constraints=self._adjust_constraint_list(extra_constraints), exact=exact)
+        return solver.min(e, extra_constraints=self._adjust_constraint_list(extra_constraints), exact=exact)
 
     @timed_function
     @ast_stripping_decorator
@@ -607,6 +901,7 @@ class SimSolver(SimStatePlugin):
     @timed_function
     @ast_stripping_decorator
     @error_converter
+    @cached_query
     def satisfiable(self, extra_constraints=(), exact=None):
         """
         This function does a constraint check and checks if the solver is in a sat state.
@@ -622,6 +917,8 @@ class SimSolver(SimStatePlugin):
             if er is True:
                 assert ar is True
             return ar
+        if self._slicing_enabled():
+            return self._sliced_satisfiable(extra_constraints=extra_constraints, exact=exact)
         return self._solver.satisfiable(extra_constraints=self._adjust_constraint_list(extra_constraints), exact=exact)
 
     @timed_function
@@ -634,6 +931,14 @@ class SimSolver(SimStatePlugin):
         :param constraints:     Pass any constraints that you want to add (ASTs) as varargs.
         """
         cc = self._adjust_constraint_list(constraints)
+        if self._partitions is not None:
+            for c in cc:
+                if isinstance(c, claripy.ast.Base):
+                    self._partitions.add(c)
+                else:
+                    # let the partitions be recomputed from the constraints of the frontend
+                    self._partitions = None
+                    break
         return self._solver.add(cc)
 
     #
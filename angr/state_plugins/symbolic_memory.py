@@ -799,6 +799,9 @@ class SimSymbolicMemory(SimMemory): #pylint:disable=abstract-method
     def _insert_memory_object(self, value, address, size):
         if self.category == 'mem':
             self.state.scratch.dirty_addrs.update(range(address, address+size))
+            if self.state.has_plugin('unicorn'):
+                # this state must not use the copies of these pages that unicorn shares with other states
+                self.state.unicorn.uncache_region(address, size)
         mo = SimMemoryObject(value, address, length=size, byte_width=self.state.arch.byte_width)
         self.mem.store_memory_object(mo)
 
@@ -1245,6 +1248,15 @@ class SimSymbolicMemory(SimMemory): #pylint:disable=abstract-method
         """
         return self.mem.unmap_region(addr, length)
 
+    def page_stats(self):
+        """
+        Get statistics of pages in this memory, including how many of them are shared with other states. See
+        SimPagedMemory.page_stats() for details.
+
+        :return: A dict of statistics.
+        """
+        return self.mem.page_stats()
+
 
 # Register state options
 SimStateOptions.register_option("symbolic_ip_max_targets", int,
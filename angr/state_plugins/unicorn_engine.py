@@ -4,6 +4,7 @@ import copy
 import ctypes
 import threading
 import itertools
+import weakref
 import pkg_resources
 import logging
 import pyvex
@@ -30,6 +31,7 @@ class MEM_PATCH(ctypes.Structure): # mem_update_t
 MEM_PATCH._fields_ = [
         ('address', ctypes.c_uint64),
         ('length', ctypes.c_uint64),
+        ('data', ctypes.c_void_p),
         ('next', ctypes.POINTER(MEM_PATCH))
     ]
 
@@ -153,6 +155,42 @@ class Uniwrapper(unicorn.Uc if unicorn is not None else object):
 _unicorn_tls = threading.local()
 _unicorn_tls.uc = None
 
+#
+# The native page cache is shared by all states with the same cache key. By default, all states of a project whose
+# memory is backed by the loader share one cache, which holds the read-only pages of the loaded binaries.
+#
+
+_cache_key_counter = itertools.count(1)
+# project -> { whether NX is enabled: cache key }
+_project_cache_keys = weakref.WeakKeyDictionary()
+# cache key -> set of addresses of pages that may be cached for all states of a project
+_shareable_pages = { }
+# cache key -> list of (address, length, ctypes buffer, offset into the buffer, permissions) of pages that are put into
+# the cache without copying them, when the cache is used for the first time
+_unregistered_pages = { }
+# cache key -> ctypes buffers that are referenced by the cache. They are kept alive as long as the cache exists.
+_shared_buffers = { }
+# cache key -> set of addresses of pages that were put into the cache by states that do not share it with the project
+_cached_pages = { }
+
+
+def _free_cache(cache_key):
+    """
+    Free the native page cache of a cache key and everything that is kept for it. This is called when the project that
+    the cache belongs to is garbage collected, so no state uses the cache anymore.
+    """
+    _shareable_pages.pop(cache_key, None)
+    _unregistered_pages.pop(cache_key, None)
+    _cached_pages.pop(cache_key, None)
+    uc = getattr(_unicorn_tls, 'uc', None)
+    if uc is not None and uc.cache_key == cache_key:
+        # the engine may still map pages of the cache
+        _unicorn_tls.uc = None
+    if _UC_NATIVE is not None:
+        _UC_NATIVE.free_cache(cache_key)
+    # the buffers must outlive the native cache, which refers to them
+    _shared_buffers.pop(cache_key, None)
+
 class _VexCacheInfo(ctypes.Structure):
     _fields_ = [
         ("num_levels", ctypes.c_uint),
@@ -220,6 +258,9 @@ def _load_native():
         _setup_prototype(h, 'set_stops', None, state_t, ctypes.c_uint64, ctypes.POINTER(ctypes.c_uint64))
         _setup_prototype(h, 'cache_page', ctypes.c_bool, state_t, ctypes.c_uint64, ctypes.c_uint64, ctypes.c_char_p, ctypes.c_uint64)
         _setup_prototype(h, 'uncache_page', None, state_t, ctypes.c_uint64)
+        _setup_prototype(h, 'free_cache', None, ctypes.c_uint64)
+        _setup_prototype(h, 'uncache_pages', None, state_t, ctypes.c_uint64, ctypes.POINTER(ctypes.c_uint64))
+        _setup_prototype(h, 'share_page', None, state_t, ctypes.c_uint64, ctypes.c_uint64, ctypes.c_void_p, ctypes.c_uint64)
         _setup_prototype(h, 'enable_symbolic_reg_tracking', None, state_t, VexArch, _VexArchInfo)
         _setup_prototype(h, 'disable_symbolic_reg_tracking', None, state_t)
         _setup_prototype(h, 'symbolic_register_data', None, state_t, ctypes.c_uint64, ctypes.POINTER(ctypes.c_uint64))
@@ -231,6 +272,9 @@ def _load_native():
         _setup_prototype(h, 'process_transmit', ctypes.POINTER(TRANSMIT_RECORD), state_t, ctypes.c_uint32)
         _setup_prototype(h, 'set_tracking', None, state_t, ctypes.c_bool, ctypes.c_bool)
         _setup_prototype(h, 'executed_pages', ctypes.c_uint64, state_t)
+        _setup_prototype(h, 'map_page', uc_err, state_t, ctypes.c_uint64, ctypes.c_uint64, ctypes.c_char_p, ctypes.c_uint64, ctypes.c_char_p)
+        _setup_prototype(h, 'set_regs', uc_err, uc_engine_t, ctypes.c_uint64, ctypes.POINTER(ctypes.c_int), ctypes.POINTER(ctypes.c_uint64))
+        _setup_prototype(h, 'get_regs', uc_err, uc_engine_t, ctypes.c_uint64, ctypes.POINTER(ctypes.c_int), ctypes.POINTER(ctypes.c_uint64))
 
         l.info('native plugin is enabled')
 
@@ -246,6 +290,148 @@ except ImportError:
     _UC_NATIVE = None
 
 
+class UnicornAddrStats:
+    """
+    How well unicorn performed when it was started at a specific address.
+    """
+
+    __slots__ = ('runs', 'steps', 'time', 'avg_steps', 'backoff', 'skips', )
+
+    def __init__(self):
+        self.runs = 0
+        self.steps = 0
+        self.time = 0.
+        # exponential moving average of the number of blocks per run
+        self.avg_steps = 0.
+        # number of times unicorn is skipped at this address before it is tried again
+        self.backoff = 0
+        # number of times unicorn was skipped since it was tried last
+        self.skips = 0
+
+    def __getstate__(self):
+        return { k: getattr(self, k) for k in self.__slots__ }
+
+    def __setstate__(self, s):
+        for k, v in s.items():
+            setattr(self, k, v)
+
+    def __repr__(self):
+        return "<UnicornAddrStats: %d runs, %.1f blocks/run, %fsec>" % (self.runs, self.avg_steps, self.time)
+
+
+class UnicornStats:
+    """
+    Statistics of the unicorn runs of a state, and the adaptive scheduler that uses them.
+
+    The counters belong to a single state. The statistics by start address are shared by the state and all states that
+    are copied from it, so that every state benefits from what its ancestors and siblings learned about an address.
+
+    When UNICORN_ADAPTIVE_COOLDOWN is enabled, unicorn is skipped at addresses where previous runs stopped after less
+    than `min_payoff` blocks on average (retrying with an exponential backoff), and it is entered at addresses where
+    previous runs executed at least `hot_payoff` blocks on average even if a cooldown is active.
+    """
+
+    def __init__(self, min_payoff=4, hot_payoff=64, min_samples=2, max_backoff=64, smoothing=0.5, addrs=None):
+        """
+        :param float min_payoff:    Average number of blocks per run below which unicorn is skipped at an address.
+        :param float hot_payoff:    Average number of blocks per run above which unicorn is always entered.
+        :param int min_samples:     Number of runs from an address before decisions are made for it.
+        :param int max_backoff:     Maximum number of times unicorn is skipped at an address before it is tried again.
+        :param float smoothing:     Weight of the latest run in the average number of blocks per run.
+        :param dict addrs:          Statistics by start address, shared with other states.
+        """
+        self.min_payoff = min_payoff
+        self.hot_payoff = hot_payoff
+        self.min_samples = min_samples
+        self.max_backoff = max_backoff
+        self.smoothing = smoothing
+
+        self.runs = 0
+        self.steps = 0
+        self.time = 0.
+        # name of the stop reason -> number of runs
+        self.stop_reasons = { }
+        # number of times unicorn was skipped because of poor payoff
+        self.skipped = 0
+        # number of times unicorn was entered in spite of an active cooldown
+        self.forced = 0
+
+        self.addrs = { } if addrs is None else addrs
+
+    def __repr__(self):
+        return "<UnicornStats: %d runs, %d blocks, %fsec, %d skipped, %d forced>" % (
+            self.runs, self.steps, self.time, self.skipped, self.forced)
+
+    def copy(self):
+        o = UnicornStats(min_payoff=self.min_payoff, hot_payoff=self.hot_payoff, min_samples=self.min_samples,
+                         max_backoff=self.max_backoff, smoothing=self.smoothing, addrs=self.addrs)
+        o.runs = self.runs
+        o.steps = self.steps
+        o.time = self.time
+        o.stop_reasons = dict(self.stop_reasons)
+        o.skipped = self.skipped
+        o.forced = self.forced
+        return o
+
+    def record(self, addr, steps, elapsed, stop_reason):
+        """
+        Record a unicorn run.
+
+        :param int addr:            The address that unicorn was started at.
+        :param int steps:           The number of blocks that were executed.
+        :param float elapsed:       The number of seconds the run took.
+        :param int stop_reason:     Why unicorn stopped (see STOP).
+        :return:                    None
+        """
+        self.runs += 1
+        self.steps += steps
+        self.time += elapsed
+        name = STOP.name_stop(stop_reason)
+        self.stop_reasons[name] = self.stop_reasons.get(name, 0) + 1
+
+        a = self.addrs.get(addr, None)
+        if a is None:
+            a = self.addrs[addr] = UnicornAddrStats()
+            a.avg_steps = steps
+        else:
+            a.avg_steps += (steps - a.avg_steps) * self.smoothing
+        a.runs += 1
+        a.steps += steps
+        a.time += elapsed
+
+        if steps < self.min_payoff and stop_reason not in (STOP.STOP_NORMAL, STOP.STOP_STOPPOINT):
+            # bailed out early. back off further
+            a.backoff = min(max(1, a.backoff * 2), self.max_backoff)
+        else:
+            a.backoff = 0
+        a.skips = 0
+
+    def decide(self, addr):
+        """
+        Decide whether unicorn should be started at an address.
+
+        :param int addr:    The address.
+        :return:            False if unicorn should be skipped, True if unicorn should be entered even if a cooldown is
+                            active, or None if the usual cooldowns should decide.
+        """
+        a = self.addrs.get(addr, None)
+        if a is None or a.runs < self.min_samples:
+            return None
+
+        if a.avg_steps < self.min_payoff and a.backoff:
+            if a.skips < a.backoff:
+                a.skips += 1
+                self.skipped += 1
+                return False
+            # try again
+            return None
+
+        if a.avg_steps >= self.hot_payoff:
+            return True
+
+        return None
+
+
 class Unicorn(SimStatePlugin):
     '''
     setup the unicorn engine for a state
@@ -272,6 +458,7 @@ class Unicorn(SimStatePlugin):
         cooldown_nonunicorn_blocks=100,
         cooldown_stop_point=1,
         max_steps=1000000,
+        stats=None,
     ):
         """
         Initializes the Unicorn plugin for angr. This plugin handles communication with
@@ -286,7 +473,7 @@ class Unicorn(SimStatePlugin):
         self.errno = 0
         self.trap_ip = None
 
-        self.cache_key = hash(self) if cache_key is None else cache_key
+        self._cache_key = cache_key
 
         # cooldowns to avoid thrashing in and out of unicorn
         # the countdown vars are the CURRENT counter that is counting down
@@ -307,7 +494,10 @@ class Unicorn(SimStatePlugin):
 
         self.steps = 0
         self._mapped = 0
-        self._uncache_pages = []
+        # pages of the native page cache that this state has its own copy of
+        self._uncached_pages = set()
+        # whether pages that were modified before this plugin was created have been uncached
+        self._uncached_modified = False
 
         # following variables are used in python level hook
         # we cannot see native hooks from python
@@ -350,6 +540,10 @@ class Unicorn(SimStatePlugin):
 
         self.time = None
 
+        # statistics of unicorn runs, used for adaptive cooldowns
+        self.stats = UnicornStats() if stats is None else stats
+        self._start_addr = None
+
     @SimStatePlugin.memo
     def copy(self, _memo):
         u = Unicorn(
@@ -369,13 +563,15 @@ class Unicorn(SimStatePlugin):
             cooldown_symbolic_registers=self.cooldown_symbolic_registers,
             cooldown_symbolic_memory=self.cooldown_symbolic_memory,
             max_steps=self.max_steps,
+            stats=self.stats.copy(),
         )
         u.countdown_nonunicorn_blocks = self.countdown_nonunicorn_blocks
         u.countdown_symbolic_registers = self.countdown_symbolic_registers
         u.countdown_symbolic_memory = self.countdown_symbolic_memory
         u.countdown_stop_point = self.countdown_stop_point
         u.transmit_addr = self.transmit_addr
-        u._uncache_pages = list(self._uncache_pages)
+        u._uncached_pages = set(self._uncached_pages)
+        u._uncached_modified = self._uncached_modified
         return u
 
     def merge(self, others, merge_conditions, common_ancestor=None): # pylint: disable=unused-argument
@@ -411,6 +607,9 @@ class Unicorn(SimStatePlugin):
         # get a fresh unicount, just in case
         self._unicount = next(_unicounter)
 
+        # pages that were modified in any of the states must not be taken from the cache
+        self._uncached_pages.update(*[o._uncached_pages for o in others])
+
         # keep these guys, since merging them sounds like a pain
         #self.symbolic_var_counts
         #self.symbolic_inst_counts
@@ -448,7 +647,7 @@ class Unicorn(SimStatePlugin):
     def __getstate__(self):
         d = dict(self.__dict__)
         del d['_uc_state']
-        del d['cache_key']
+        del d['_cache_key']
         del d['_unicount']
         return d
 
@@ -456,7 +655,7 @@ class Unicorn(SimStatePlugin):
         self.__dict__.update(s)
         self._unicount = next(_unicounter)
         self._uc_state = None
-        self.cache_key = hash(self)
+        self._cache_key = None
         _unicorn_tls.uc = None
 
     def set_state(self, state):
@@ -464,6 +663,98 @@ class Unicorn(SimStatePlugin):
         if state.arch.name == "MIPS32":
             self._unicount = next(_unicounter)
 
+    @property
+    def cache_key(self):
+        """
+        The key of the native page and block caches of this state. States that are copied from each other share the
+        cache. States of the same project whose memory is backed by the loader share the cache as well.
+        """
+        if self._cache_key is None:
+            self._cache_key = self._project_cache_key()
+            if self._cache_key is None:
+                self._cache_key = hash(self)
+                if self.state.project is not None:
+                    # copies of this state keep the project alive as long as they use the cache
+                    weakref.finalize(self.state.project, _free_cache, self._cache_key)
+        return self._cache_key
+
+    def _project_cache_key(self):
+        """
+        Get the cache key that is shared by all states of the project, or None if the cache cannot be shared.
+        """
+        project = self.state.project
+        mem = getattr(self.state.memory, 'mem', None)
+        if project is None or mem is None or mem._memory_backer is not project.loader.memory or mem.byte_width != 8:
+            return None
+
+        nx = options.ENABLE_NX in self.state.options
+        keys = _project_cache_keys.setdefault(project, { })
+        if nx not in keys:
+            key = next(_cache_key_counter)
+            _shareable_pages[key], _unregistered_pages[key] = self._readonly_backer_pages(nx)
+            keys[nx] = key
+            weakref.finalize(project, _free_cache, key)
+        return keys[nx]
+
+    def _readonly_backer_pages(self, nx):
+        """
+        Find the read-only pages of the loaded binaries.
+
+        :param bool nx: Whether NX is enabled.
+        :return:        A tuple of the set of addresses of all pages that overlap with read-only segments, and a list of
+                        ranges of pages that are entirely inside a read-only segment and a single writable backer, as
+                        tuples of (address, length, ctypes buffer, offset into the buffer, permissions). The latter
+                        can be mapped into unicorn without copying them.
+        """
+        PAGE_SIZE = 0x1000
+
+        readonly = [ (start, end + 1, flags) for (start, end), flags in self.state.memory.mem._permission_map.items()
+                     if not flags & 2 ]
+
+        pages = set()
+        for start, end, _ in readonly:
+            pages.update(range(start & ~(PAGE_SIZE - 1), end, PAGE_SIZE))
+
+        ranges = [ ]
+        for backer_addr, backer in self.state.project.loader.memory.backers():
+            try:
+                buf = (ctypes.c_char * len(backer)).from_buffer(backer)
+            except TypeError:
+                # the backer is not a writable buffer. its pages are copied into the cache on demand
+                continue
+            backer_end = backer_addr + len(backer)
+            for start, end, flags in readonly:
+                a = (max(start, backer_addr) + PAGE_SIZE - 1) & ~(PAGE_SIZE - 1)
+                b = min(end, backer_end) & ~(PAGE_SIZE - 1)
+                if a < b:
+                    ranges.append((a, b - a, buf, a - backer_addr, flags if nx else flags | 4))
+
+        return pages, ranges
+
+    def _share_backer_pages(self):
+        """
+        Put the read-only pages of the loaded binaries into the native page cache, if this has not been done yet.
+        """
+        key = self.cache_key
+        ranges = _unregistered_pages.pop(key, None)
+        if not ranges:
+            return
+
+        l.debug('sharing %d ranges of read-only pages', len(ranges))
+        for addr, length, buf, offset, perm in ranges:
+            _UC_NATIVE.share_page(self._uc_state, addr, length, ctypes.addressof(buf) + offset, perm)
+        _shared_buffers[key] = [ buf for _, _, buf, _, _ in ranges ]
+
+    def _cacheable(self, start, length):
+        """
+        Check if a range of non-writable pages may be put into the native page cache.
+        """
+        pages = range(start, start + length, 0x1000)
+        if any(p in self._uncached_pages for p in pages):
+            return False
+        shareable = _shareable_pages.get(self.cache_key, None)
+        return shareable is None or all(p in shareable for p in pages)
+
     @property
     def _reuse_unicorn(self):
         return self.state.arch.name != "MIPS32"
@@ -509,6 +800,43 @@ class Unicorn(SimStatePlugin):
     def _uc_const(self):
         return self.state.arch.uc_const
 
+    @property
+    def _uc_reg_batch(self):
+        """
+        The registers that are synchronized with unicorn, split by whether they can be transferred in bulk. The result
+        is cached for each architecture.
+
+        :return: A tuple of the names of registers of up to 64 bits, a ctypes array of their unicorn IDs, and a list of
+                 tuples of the names and unicorn IDs of all wider registers.
+        """
+        try:
+            return self.UC_CONFIG[self.state.arch.name]
+        except KeyError:
+            pass
+
+        names, ids, wide_regs = [ ], [ ], [ ]
+        for r, c in self._uc_regs.items():
+            if r in self.reg_blacklist:
+                continue
+            if r in self.state.arch.registers and self.state.arch.registers[r][1] <= 8:
+                names.append(r)
+                ids.append(c)
+            else:
+                wide_regs.append((r, c))
+
+        config = (names, (ctypes.c_int * len(ids))(*ids), wide_regs)
+        self.UC_CONFIG[self.state.arch.name] = config
+        return config
+
+    def _concrete_reg_value(self, r):
+        v = self._process_value(getattr(self.state.regs, r), 'reg')
+        if v is None:
+            raise SimValueError('setting a symbolic register')
+        if v.op == 'BVV':
+            # skip the solver for the common case
+            return v.args[0]
+        return self.state.solver.eval(v)
+
     def _setup_unicorn(self):
         if self.state.arch.uc_mode is None:
             raise SimUnicornUnsupport("unsupported architecture %r" % self.state.arch)
@@ -798,6 +1126,41 @@ class Unicorn(SimStatePlugin):
             # give up
             raise MixedPermissonsError()
 
+        data = self.state.memory.mem.load_concrete_bytes(start, length)
+        if data is not None:
+            # all bytes are concrete. no need to look at the memory objects
+            taint = None
+        else:
+            data, taint = self._load_page_data(access, start, length, best_effort_read=best_effort_read)
+
+        # do the mapping
+        l.info('mmap [%#x, %#x], %d%s (because %d)', start, start + length - 1, perm, ' (symbolic)' if taint is not None else '', access)
+        if taint is None and not perm & 2 and self._cacheable(start, length):
+            # page is non-writable, handle it with native code
+            l.debug('caching non-writable page')
+            out = _UC_NATIVE.cache_page(self._uc_state, start, length, bytes(data), perm)
+            if self.cache_key not in _shareable_pages:
+                _cached_pages.setdefault(self.cache_key, set()).update(range(start, start + length, 0x1000))
+            return out
+        else:
+            # map the pages, write their content, and activate them in one native call.
+            # if the memory range has already been mapped, or it somehow fails sanity checks, a unicorn.UcError is
+            # raised. The exception will be caught outside.
+            err = _UC_NATIVE.map_page(self._uc_state, start, length, bytes(data), perm, taint)
+            if err != unicorn.UC_ERR_OK:
+                raise unicorn.UcError(err)
+            uc.wrapped_mapped.add((start, length))
+            self._mapped += 1
+            return True
+
+    def _load_page_data(self, access, start, length, best_effort_read=True):
+        """
+        Get the content of a memory range that is about to be mapped into unicorn.
+
+        :return: A tuple of the concrete content of the range, and a ctypes buffer that marks the symbolic bytes
+                 with TAINT_SYMBOLIC, or None if there is no symbolic byte.
+        """
+
         try:
             ret_on_segv = True if best_effort_read else False
             items = self.state.memory.mem.load_objects(start, length, ret_on_segv=ret_on_segv)
@@ -848,30 +1211,50 @@ class Unicorn(SimStatePlugin):
             #print "MISSING START: %x, %d" % (start, last_missing - start + 1)
             _missing(start, last_missing - start + 1)
 
-        # do the mapping
-        l.info('mmap [%#x, %#x], %d%s (because %d)', start, start + length - 1, perm, ' (symbolic)' if taint else '', access)
-        if not taint and not perm & 2:
-            # page is non-writable, handle it with native code
-            l.debug('caching non-writable page')
-            out = _UC_NATIVE.cache_page(self._uc_state, start, length, bytes(data), perm)
-            return out
-        else:
-            # if the memory range has already been mapped, or it somehow fails sanity checks, mem_map() may fail with
-            # a unicorn.UcError raised. THe exception will be caught outside.
-            uc.mem_map(start, length, perm)
-            uc.mem_write(start, bytes(data))
-            self._mapped += 1
-            _UC_NATIVE.activate(self._uc_state, start, length, taint[0] if taint else None)
-            return True
+        return data, taint[0] if taint else None
 
     def uncache_page(self, addr):
-        self._uncache_pages.append(addr & ~0xfff)
+        self._uncached_pages.add(addr & ~0xfff)
+
+    def uncache_region(self, addr, length):
+        """
+        Stop using cached pages in a range of memory, because the state has modified it.
+
+        :param int addr:    The start address.
+        :param int length:  The length of the range.
+        """
+        cached = _shareable_pages.get(self.cache_key, None)
+        if cached is None:
+            cached = _cached_pages.get(self.cache_key, None)
+            if cached is None:
+                return
+        for page in range(addr & ~0xfff, addr + length, 0x1000):
+            if page in cached:
+                self._uncached_pages.add(page)
+
+    def _uncache_modified_pages(self):
+        """
+        Uncache the shared pages that the state may have modified before this plugin was created, since memory only
+        reports modifications to the plugin once it exists. Pages that the state has only read are uncached as well.
+        """
+        self._uncached_modified = True
+        shareable = _shareable_pages.get(self.cache_key, None)
+        mem = getattr(self.state.memory, 'mem', None)
+        if shareable is None or mem is None:
+            # other caches are filled from the memory of the state itself
+            return
+        page_size = mem._page_size
+        for page_num in mem._pages:
+            self.uncache_region(page_num * page_size, page_size)
 
     def setup(self):
+        if not self._uncached_modified:
+            self._uncache_modified_pages()
         self._setup_unicorn()
         self.set_regs()
         # tricky: using unicorn handle form unicorn.Uc object
         self._uc_state = _UC_NATIVE.alloc(self.uc._uch, self.cache_key)
+        self._share_backer_pages()
         if UNICORN_HANDLE_TRANSMIT_SYSCALL in self.state.options and self.state.has_plugin('cgc'):
             if self.transmit_addr is None:
                 l.error("You haven't set the address for concrete transmits!!!!!!!!!!!")
@@ -885,10 +1268,10 @@ class Unicorn(SimStatePlugin):
         self.jumpkind = 'Ijk_Boring'
         self.countdown_nonunicorn_blocks = self.cooldown_nonunicorn_blocks
 
-        for addr in self._uncache_pages:
-            l.info("Un-caching writable page %#x", addr)
-            _UC_NATIVE.uncache_page(self._uc_state, addr)
-        self._uncache_pages = []
+        if self._uncached_pages:
+            l.info("Un-caching %d modified or writable pages", len(self._uncached_pages))
+            pages = sorted(self._uncached_pages)
+            _UC_NATIVE.uncache_pages(self._uc_state, len(pages), (ctypes.c_uint64 * len(pages))(*pages))
 
         # should this be in setup?
         if options.UNICORN_SYM_REGS_SUPPORT in self.state.options and \
@@ -932,6 +1315,7 @@ class Unicorn(SimStatePlugin):
                 _UC_NATIVE.symbolic_register_data(self._uc_state, 0, None)
 
         addr = self.state.solver.eval(self.state.ip)
+        self._start_addr = addr
         l.info('started emulation at %#x (%d steps)', addr, self.max_steps if step is None else step)
         self.time = time.time()
         self.errno = _UC_NATIVE.start(self._uc_state, addr, self.max_steps if step is None else step)
@@ -956,6 +1340,7 @@ class Unicorn(SimStatePlugin):
 
         addr = self.state.solver.eval(self.state.ip)
         l.info('finished emulation at %#x after %d steps: %s', addr, self.steps, STOP.name_stop(self.stop_reason))
+        self.stats.record(self._start_addr, self.steps, self.time, self.stop_reason)
 
         # should this be in destroy?
         _UC_NATIVE.disable_symbolic_reg_tracking(self._uc_state)
@@ -969,7 +1354,8 @@ class Unicorn(SimStatePlugin):
             if 0x1000 <= address < 0x2000:
                 l.warning("Emulation touched fake GDT at 0x1000, discarding changes")
             else:
-                s = bytes(self.uc.mem_read(address, int(length)))
+                # the native side has already read the content of the range
+                s = ctypes.string_at(update.data, length)
                 l.debug('...changed memory: [%#x, %#x] = %s', address, address + length, binascii.hexlify(s))
                 self.state.memory.store(address, s)
 
@@ -1091,14 +1477,17 @@ class Unicorn(SimStatePlugin):
             self.setup_gdt(gdt)
 
 
-        for r, c in self._uc_regs.items():
-            if r in self.reg_blacklist:
-                continue
-            v = self._process_value(getattr(self.state.regs, r), 'reg')
-            if v is None:
-                    raise SimValueError('setting a symbolic register')
-            # l.debug('setting $%s = %#x', r, self.state.solver.eval(v))
-            uc.reg_write(c, self.state.solver.eval(v))
+        # registers of up to 64 bits are written in one native call
+        names, ids, wide_regs = self._uc_reg_batch
+        values = (ctypes.c_uint64 * len(names))()
+        for i, r in enumerate(names):
+            values[i] = self._concrete_reg_value(r)
+        err = _UC_NATIVE.set_regs(uc._uch, len(names), ids, values)
+        if err != unicorn.UC_ERR_OK:
+            raise unicorn.UcError(err)
+
+        for r, c in wide_regs:
+            uc.reg_write(c, self._concrete_reg_value(r))
 
         if self.state.arch.name in ('X86', 'AMD64'):
             # sync the fp clerical data
@@ -1230,13 +1619,18 @@ class Unicorn(SimStatePlugin):
                 ))
 
         # now we sync registers out of unicorn
-        for r, c in self._uc_regs.items():
-            if r in self.reg_blacklist:
-                continue
-            v = self.uc.reg_read(c)
+        names, ids, wide_regs = self._uc_reg_batch
+        values = (ctypes.c_uint64 * len(names))()
+        err = _UC_NATIVE.get_regs(self.uc._uch, len(names), ids, values)
+        if err != unicorn.UC_ERR_OK:
+            raise unicorn.UcError(err)
+        for r, v in zip(names, values):
             # l.debug('getting $%s = %#x', r, v)
             setattr(self.state.regs, r, v)
 
+        for r, c in wide_regs:
+            setattr(self.state.regs, r, self.uc.reg_read(c))
+
         # some architecture-specific register fixups
         if self.state.arch.name in ('X86', 'AMD64'):
             if self.jumpkind.startswith('Ijk_Sys'):
@@ -1,3 +1,6 @@
+import sys
+import itertools
+
 import cooldict
 import claripy
 import cle
@@ -13,6 +16,30 @@ from .memory_object import SimMemoryObject
 l = logging.getLogger(name=__name__)
 
 
+def _diff_buffers(a, b, start, end, out, granularity=32):
+    """
+    Find the offsets where two buffers differ. Ranges are compared in bulk, and only ranges that differ are split
+    further, so the cost mostly depends on the number of differing bytes instead of the size of the buffers.
+
+    :param a:               The first buffer.
+    :param b:               The second buffer, of the same length.
+    :param int start:       The first offset to compare.
+    :param int end:         The end offset (non-inclusive).
+    :param list out:        The list to append differing offsets to.
+    :param int granularity: Size of the ranges that are compared byte by byte.
+    :return:                None
+    """
+
+    if a[start:end] == b[start:end]:
+        return
+    if end - start <= granularity:
+        out.extend(i for i in range(start, end) if a[i] != b[i])
+    else:
+        mid = (start + end) // 2
+        _diff_buffers(a, b, start, mid, out, granularity=granularity)
+        _diff_buffers(a, b, mid, end, out, granularity=granularity)
+
+
 class BasePage:
     """
     Page object, allowing for more flexibility than just a raw dict.
@@ -22,6 +49,10 @@ class BasePage:
     PROT_WRITE = 2
     PROT_EXEC = 4
 
+    # whether the content of the page is recorded somewhere outside of page tables (e.g., in a VaultPack under an ID
+    # that is derived from it). Such a page is never modified in place, but copied on write, like a shared page.
+    _frozen = False
+
     def __init__(self, page_addr, page_size, permissions=None, executable=False):
         """
         Create a new page object. Carries permissions information.
@@ -39,6 +70,8 @@ class BasePage:
 
         self._page_addr = page_addr
         self._page_size = page_size
+        # number of page tables that hold this page
+        self._refcount = 0
 
         if permissions is None:
             perms = Page.PROT_READ|Page.PROT_WRITE
@@ -48,6 +81,16 @@ class BasePage:
         else:
             self.permissions = permissions
 
+    def __getstate__(self):
+        d = dict(self.__dict__)
+        # the reference count only makes sense for page tables in the current process
+        d['_refcount'] = 0
+        d.pop('_frozen', None)
+        return d
+
+    def __setstate__(self, s):
+        self.__dict__.update(s)
+
     @property
     def concrete_permissions(self):
         if self.permissions.symbolic:
@@ -80,12 +123,39 @@ class BasePage:
             self.store_underwrite(state, new_mo, start, end)
 
     def copy(self):
-        return Page(
+        return self.__class__(
             self._page_addr, self._page_size,
             permissions=self.permissions,
             **self._copy_args()
         )
 
+    def changed_bytes(self, other):
+        """
+        Get the addresses in this page whose content may differ in another page of the same address.
+
+        :param BasePage other:  The other page.
+        :return:                A tuple of (addresses that differ, addresses that have to be compared further).
+        :rtype:                 tuple
+        """
+
+        our_keys = set(self.keys())
+        their_keys = set(other.keys())
+        definite = our_keys ^ their_keys
+        candidates = {
+            i for i in (our_keys & their_keys) if self.load_mo(None, i) is not other.load_mo(None, i)
+        }
+        return definite, candidates
+
+    def approximate_size(self):
+        """
+        Get the approximate number of bytes used by the data structures of this page, without counting the memory
+        objects and ASTs it holds.
+
+        :return: The size in bytes.
+        :rtype: int
+        """
+        return sys.getsizeof(self) + sys.getsizeof(self.__dict__) + self._storage_size()
+
     #
     # Abstract functions
     #
@@ -124,6 +194,9 @@ class BasePage:
     def _copy_args(self):
         raise NotImplementedError()
 
+    def _storage_size(self):
+        raise NotImplementedError()
+
 class TreePage(BasePage):
     """
     Page object, implemented with a sorted dict. Who knows what's underneath!
@@ -241,6 +314,10 @@ class TreePage(BasePage):
     def _copy_args(self):
         return { 'storage': self._storage.copy() }
 
+    def _storage_size(self):
+        # a SortedDict is made of a dict and a sorted list of keys
+        return sys.getsizeof(self._storage) + sys.getsizeof(self._storage.keys()) * 2
+
 class ListPage(BasePage):
     """
     Page object, implemented with a list.
@@ -316,27 +393,365 @@ class ListPage(BasePage):
                 items.append((addr, mo))
         return items
 
+    def changed_bytes(self, other):
+        if type(other) is not ListPage or self._sinkhole is not other._sinkhole:
+            return super(ListPage, self).changed_bytes(other)
+
+        definite, candidates = set(), set()
+        for i, (our_mo, their_mo) in enumerate(zip(self._storage, other._storage)):
+            if our_mo is their_mo:
+                continue
+            if our_mo is None:
+                our_mo = self._sinkhole
+            if their_mo is None:
+                their_mo = other._sinkhole
+            if our_mo is not their_mo:
+                (definite if our_mo is None or their_mo is None else candidates).add(self._page_addr + i)
+        return definite, candidates
+
     def _copy_args(self):
         return { 'storage': list(self._storage), 'sinkhole': self._sinkhole }
 
+    def _storage_size(self):
+        return sys.getsizeof(self._storage)
+
 Page = ListPage
 
+
+class ArrayPage(BasePage):
+    """
+    Page object, optimized for concrete data. Concrete bytes are stored in a bytearray, and only bytes that hold
+    symbolic data are stored as memory objects.
+    """
+
+    def __init__(self, *args, **kwargs):
+        data = kwargs.pop("data", None)
+        concrete = kwargs.pop("concrete", None)
+        symbolic = kwargs.pop("symbolic", None)
+        self._sinkhole = kwargs.pop("sinkhole", None)
+
+        super(ArrayPage, self).__init__(*args, **kwargs)
+        # concrete content of the page
+        self._data = bytearray(self._page_size) if data is None else data
+        # 1 for each byte whose content is in self._data, 0 otherwise
+        self._concrete = bytearray(self._page_size) if concrete is None else concrete
+        # memory objects of all bytes that are not concrete, keyed by their offsets into the page
+        self._symbolic = { } if symbolic is None else symbolic
+
+    @staticmethod
+    def _concrete_value(mo, start, end):
+        """
+        Get the concrete bytes of a memory object in the given range.
+
+        :param SimMemoryObject mo:  The memory object.
+        :param int start:           The start address.
+        :param int end:             The end address (non-inclusive).
+        :return:                    The bytes, or None if the memory object is not concrete.
+        :rtype:                     bytes or None
+        """
+
+        obj = mo.object
+        if obj.op != 'BVV' or mo._byte_width != 8 or obj.size() != mo.length * 8:
+            return None
+        return obj.args[0].to_bytes(mo.length, 'big')[start - mo.base:end - mo.base]
+
+    def _remove_symbolic(self, a, b):
+        if not self._symbolic:
+            return
+        if len(self._symbolic) < b - a:
+            for i in [ k for k in self._symbolic if a <= k < b ]:
+                del self._symbolic[i]
+        else:
+            for i in range(a, b):
+                self._symbolic.pop(i, None)
+
+    def _is_hole(self, i):
+        return not self._concrete[i] and i not in self._symbolic
+
+    def keys(self):
+        if self._sinkhole is not None:
+            return range(self._page_addr, self._page_addr + self._page_size)
+        else:
+            return [ self._page_addr + i for i in range(self._page_size) if not self._is_hole(i) ]
+
+    def replace_mo(self, state, old_mo, new_mo):
+        if self._sinkhole is old_mo:
+            self._sinkhole = new_mo
+        else:
+            start, end = self._resolve_range(old_mo)
+            for i in range(start - self._page_addr, end - self._page_addr):
+                if self._symbolic.get(i, None) is old_mo:
+                    self._symbolic[i] = new_mo
+
+    def store_overwrite(self, state, new_mo, start, end):
+        a, b = start - self._page_addr, end - self._page_addr
+        value = self._concrete_value(new_mo, start, end)
+
+        if value is not None:
+            self._data[a:b] = value
+            self._concrete[a:b] = b'\x01' * (b - a)
+            self._remove_symbolic(a, b)
+        elif a == 0 and b == self._page_size:
+            self._sinkhole = new_mo
+            self._concrete = bytearray(self._page_size)
+            self._symbolic = { }
+        else:
+            self._concrete[a:b] = bytes(b - a)
+            for i in range(a, b):
+                self._symbolic[i] = new_mo
+
+    def store_underwrite(self, state, new_mo, start, end):
+        if self._sinkhole is not None:
+            # there are no holes to fill
+            return
+
+        a, b = start - self._page_addr, end - self._page_addr
+        value = self._concrete_value(new_mo, start, end)
+
+        if value is None and a == 0 and b == self._page_size:
+            self._sinkhole = new_mo
+        elif self._concrete.find(1, a, b) == -1 and not any(a <= k < b for k in self._symbolic):
+            # fast path: the entire range is empty
+            self.store_overwrite(state, new_mo, start, end)
+        else:
+            for i in range(a, b):
+                if self._is_hole(i):
+                    if value is not None:
+                        self._data[i] = value[i - a]
+                        self._concrete[i] = 1
+                    else:
+                        self._symbolic[i] = new_mo
+
+    def load_mo(self, state, page_idx):
+        """
+        Loads a memory object from memory.
+
+        :param page_idx: the index into the page
+        :returns: a tuple of the object
+        """
+        i = page_idx - self._page_addr
+        if self._concrete[i]:
+            return SimMemoryObject(claripy.BVV(self._data[i], 8), page_idx)
+        return self._symbolic.get(i, self._sinkhole)
+
+    def load_slice(self, state, start, end):
+        """
+        Return the memory objects overlapping with the provided slice. Each contiguous span of concrete bytes is
+        returned as a single memory object.
+
+        :param start: the start address
+        :param end: the end address (non-inclusive)
+        :returns: tuples of (starting_addr, memory_object)
+        """
+        items = [ ]
+        if start > self._page_addr + self._page_size or end < self._page_addr:
+            l.warning("Calling load_slice on the wrong page.")
+            return items
+
+        a = max(start, self._page_addr) - self._page_addr
+        b = min(end, self._page_addr + self._page_size) - self._page_addr
+        i = a
+        while i < b:
+            if self._concrete[i]:
+                j = self._concrete.find(0, i, b)
+                if j == -1:
+                    j = b
+                addr = self._page_addr + i
+                items.append((addr, SimMemoryObject(claripy.BVV(bytes(self._data[i:j])), addr)))
+                i = j
+            else:
+                mo = self._symbolic.get(i, self._sinkhole)
+                if mo is not None and (not items or items[-1][1] is not mo):
+                    items.append((self._page_addr + i, mo))
+                i += 1
+        return items
+
+    def load_bytes(self, start, end):
+        """
+        Return the content of the provided slice if all bytes in it are concrete.
+
+        :param start: the start address
+        :param end: the end address (non-inclusive)
+        :returns: the bytes, or None if any byte in the slice is not concrete
+        """
+        a = start - self._page_addr
+        b = end - self._page_addr
+        if self._concrete.find(0, a, b) != -1:
+            return None
+        return bytes(self._data[a:b])
+
+    def changed_bytes(self, other):
+        """
+        Get the addresses in this page whose content may differ in another page. If the other page is an ArrayPage as
+        well, concrete bytes are compared by value in bulk, and only the remaining bytes are compared by the identity of
+        their memory objects.
+
+        :param BasePage other:  The other page.
+        :return:                A tuple of (addresses that differ, addresses that have to be compared further).
+        :rtype:                 tuple
+        """
+
+        if type(other) is not ArrayPage:
+            return super(ArrayPage, self).changed_bytes(other)
+
+        definite, candidates = set(), set()
+        if self._concrete == other._concrete and self._data == other._data and \
+                self._sinkhole is other._sinkhole and self._symbolic == other._symbolic:
+            return definite, candidates
+
+        values = [ ]
+        _diff_buffers(self._data, other._data, 0, self._page_size, values)
+        for i in values:
+            if self._concrete[i] and other._concrete[i]:
+                definite.add(self._page_addr + i)
+
+        flags = [ ]
+        _diff_buffers(self._concrete, other._concrete, 0, self._page_size, flags)
+        for i in flags:
+            # the byte is concrete in exactly one of the pages
+            page = other if self._concrete[i] else self
+            if page.load_mo(None, self._page_addr + i) is None:
+                definite.add(self._page_addr + i)
+            else:
+                candidates.add(self._page_addr + i)
+
+        if self._sinkhole is not other._sinkhole:
+            holes = [ i for i in range(self._page_size) if self._is_hole(i) or other._is_hole(i) ]
+        else:
+            holes = [ ]
+        for i in itertools.chain(holes, self._symbolic, other._symbolic):
+            if self._concrete[i] or other._concrete[i]:
+                continue
+            our_mo = self.load_mo(None, self._page_addr + i)
+            their_mo = other.load_mo(None, self._page_addr + i)
+            if our_mo is not their_mo:
+                (definite if our_mo is None or their_mo is None else candidates).add(self._page_addr + i)
+
+        return definite, candidates
+
+    def _copy_args(self):
+        return {
+            'data': bytearray(self._data),
+            'concrete': bytearray(self._concrete),
+            'symbolic': dict(self._symbolic),
+            'sinkhole': self._sinkhole,
+        }
+
+    def _storage_size(self):
+        return sys.getsizeof(self._data) + sys.getsizeof(self._concrete) + sys.getsizeof(self._symbolic)
+
+
+class SimPageTable:
+    """
+    A mapping from page numbers to pages, together with per-page bookkeeping, that is shared by all SimPagedMemory
+    instances branched from each other until one of them modifies the mapping itself.
+
+    Both page tables and pages are reference counted: `refcount` is the number of SimPagedMemory instances using this
+    page table, and the `_refcount` of each page is the number of page tables holding it. A page is only copied when it
+    is written to while being shared.
+    """
+
+    __slots__ = ('pages', 'symbolic_addrs', 'initialized', 'refcount', )
+
+    def __init__(self, pages=None, symbolic_addrs=None, initialized=None):
+        self.pages = { } if pages is None else pages
+        self.symbolic_addrs = { } if symbolic_addrs is None else symbolic_addrs
+        self.initialized = set() if initialized is None else initialized
+        self.refcount = 1
+
+        for page in self.pages.values():
+            page._refcount += 1
+
+    def __getstate__(self):
+        # the reference count is rebuilt by the SimPagedMemory instances that are unpickled together with this table,
+        # and pickle's memo makes sure that they share it just like before
+        return self.pages, self.symbolic_addrs, self.initialized
+
+    def __setstate__(self, s):
+        self.pages, self.symbolic_addrs, self.initialized = s
+        self.refcount = 0
+
+        for page in self.pages.values():
+            page._refcount += 1
+
+    def copy(self):
+        return SimPageTable(pages=dict(self.pages),
+                            symbolic_addrs=dict(self.symbolic_addrs),
+                            initialized=set(self.initialized)
+                            )
+
+    def release(self):
+        """
+        Called when a SimPagedMemory instance stops using this page table.
+
+        :return: None
+        """
+
+        self.refcount -= 1
+        if self.refcount == 0:
+            for page in self.pages.values():
+                page._refcount -= 1
+
+    def set_page(self, page_num, page):
+        """
+        Put a new page into the page table, replacing the existing one if there is any.
+
+        :param int page_num:    The page number.
+        :param BasePage page:   The page.
+        :return:                None
+        """
+
+        old_page = self.pages.get(page_num, None)
+        if old_page is not None:
+            old_page._refcount -= 1
+        page._refcount += 1
+        self.pages[page_num] = page
+        self.symbolic_addrs[page_num] = set()
+
+    def remove_page(self, page_num):
+        """
+        Remove a page from the page table.
+
+        :param int page_num:    The page number.
+        :return:                None
+        """
+
+        page = self.pages.pop(page_num)
+        page._refcount -= 1
+        self.symbolic_addrs.pop(page_num, None)
+
+    def unshare_page(self, page_num):
+        """
+        Make sure the page is only held by this page table, and copy it if necessary.
+
+        :param int page_num:    The page number.
+        :return:                The page that can be written to.
+        :rtype:                 BasePage
+        """
+
+        page = self.pages[page_num]
+        if page._refcount > 1 or page._frozen:
+            page._refcount -= 1
+            page = page.copy()
+            page._refcount = 1
+            self.pages[page_num] = page
+            self.symbolic_addrs[page_num] = set(self.symbolic_addrs[page_num])
+        return page
+
 #pylint:disable=unidiomatic-typecheck
 
 class SimPagedMemory:
     """
     Represents paged memory.
     """
-    def __init__(self, memory_backer=None, permissions_backer=None, pages=None, initialized=None, name_mapping=None, hash_mapping=None, page_size=None, symbolic_addrs=None, check_permissions=False):
-        self._cowed = set()
+    def __init__(self, memory_backer=None, permissions_backer=None, pages=None, initialized=None, name_mapping=None, hash_mapping=None, page_size=None, symbolic_addrs=None, check_permissions=False, page_table=None):
         self._memory_backer = { } if memory_backer is None else memory_backer
         self._permissions_backer = permissions_backer # saved for copying
         self._executable_pages = False if permissions_backer is None else permissions_backer[0]
         self._permission_map = { } if permissions_backer is None else permissions_backer[1]
-        self._pages = { } if pages is None else pages
-        self._initialized = set() if initialized is None else initialized
+        self._page_table = SimPageTable(pages=pages, symbolic_addrs=symbolic_addrs, initialized=initialized) \
+            if page_table is None else page_table
         self._page_size = 0x1000 if page_size is None else page_size
-        self._symbolic_addrs = dict() if symbolic_addrs is None else symbolic_addrs
         self.state = None
         self._preapproved_stack = range(0)
         self._check_perms = check_permissions
@@ -352,39 +767,104 @@ class SimPagedMemory:
             '_permissions_backer': self._permissions_backer,
             '_executable_pages': self._executable_pages,
             '_permission_map': self._permission_map,
-            '_pages': self._pages,
-            '_initialized': self._initialized,
+            '_page_table': self._page_table,
             '_page_size': self._page_size,
             'state': None,
             '_name_mapping': self._name_mapping,
             '_hash_mapping': self._hash_mapping,
-            '_symbolic_addrs': self._symbolic_addrs,
             '_preapproved_stack': self._preapproved_stack,
             '_check_perms': self._check_perms
         }
 
     def __setstate__(self, s):
-        self._cowed = set()
+        self._updated_mappings = set()
         self.__dict__.update(s)
+        self._page_table.refcount += 1
+
+    def __del__(self):
+        page_table = self.__dict__.get('_page_table', None)
+        if page_table is not None:
+            page_table.release()
 
     def branch(self):
         new_name_mapping = self._name_mapping.branch() if options.REVERSE_MEMORY_NAME_MAP in self.state.options else self._name_mapping
         new_hash_mapping = self._hash_mapping.branch() if options.REVERSE_MEMORY_HASH_MAP in self.state.options else self._hash_mapping
 
-        new_pages = dict(self._pages)
-        self._cowed = set()
+        # both memories share the same page table until one of them modifies it
+        self._page_table.refcount += 1
         m = SimPagedMemory(memory_backer=self._memory_backer,
                            permissions_backer=self._permissions_backer,
-                           pages=new_pages,
-                           initialized=set(self._initialized),
+                           page_table=self._page_table,
                            page_size=self._page_size,
                            name_mapping=new_name_mapping,
                            hash_mapping=new_hash_mapping,
-                           symbolic_addrs=dict(self._symbolic_addrs),
                            check_permissions=self._check_perms)
         m._preapproved_stack = self._preapproved_stack
         return m
 
+    @property
+    def _pages(self):
+        return self._page_table.pages
+
+    @property
+    def _symbolic_addrs(self):
+        return self._page_table.symbolic_addrs
+
+    @property
+    def _initialized(self):
+        return self._page_table.initialized
+
+    def _writable_page_table(self):
+        """
+        Get a page table that is only used by this memory, and copy the current one if it is shared.
+
+        :return: The page table.
+        :rtype:  SimPageTable
+        """
+
+        page_table = self._page_table
+        if page_table.refcount > 1:
+            page_table.release()
+            page_table = page_table.copy()
+            self._page_table = page_table
+        return page_table
+
+    def page_stats(self):
+        """
+        Get statistics of pages in this memory. Sizes are approximate, and do not include memory objects or ASTs.
+
+        :return: A dict with the number of pages (`pages`), the number of pages that are shared with other memories
+                 (`shared_pages`) or only held by this memory (`private_pages`), the number of bytes used by private
+                 pages (`private_bytes`) and shared pages (`shared_bytes`), and the number of bytes used by this
+                 memory when the size of each shared page is split among all its holders (`amortized_bytes`).
+        :rtype:  dict
+        """
+
+        page_table = self._page_table
+        shared_pages, private_pages = 0, 0
+        shared_bytes, private_bytes = 0, 0
+        amortized_bytes = 0.
+
+        for page in page_table.pages.values():
+            size = page.approximate_size()
+            holders = page_table.refcount * page._refcount
+            if holders > 1:
+                shared_pages += 1
+                shared_bytes += size
+            else:
+                private_pages += 1
+                private_bytes += size
+            amortized_bytes += float(size) / holders
+
+        return {
+            'pages': len(page_table.pages),
+            'shared_pages': shared_pages,
+            'private_pages': private_pages,
+            'shared_bytes': shared_bytes,
+            'private_bytes': private_bytes,
+            'amortized_bytes': int(amortized_bytes),
+        }
+
     def __getitem__(self, addr):
         page_num = addr // self._page_size
         page_idx = addr
@@ -460,12 +940,44 @@ class SimPagedMemory:
 
         return result
 
+    def load_concrete_bytes(self, addr, num_bytes):
+        """
+        Load bytes from paged memory, if all of them are concrete. Unlike load_objects(), no memory object is created,
+        so this is much faster on pages that are backed by arrays (see ArrayPage).
+
+        :param addr: Address to start loading.
+        :param num_bytes: Number of bytes to load.
+        :return: The bytes, or None if any of the bytes is missing, not readable, or not stored in an ArrayPage as a
+                 concrete value.
+        :rtype: bytes or None
+        """
+
+        chunks = [ ]
+        end = addr + num_bytes
+        for page_addr in self._containing_pages(addr, end):
+            try:
+                page = self._get_page(page_addr // self._page_size)
+            except KeyError:
+                return None
+
+            if type(page) is not ArrayPage:
+                return None
+            if self.allow_segv and not page.concrete_permissions & Page.PROT_READ:
+                return None
+            chunk = page.load_bytes(max(addr, page_addr), min(end, page_addr + self._page_size))
+            if chunk is None:
+                return None
+            chunks.append(chunk)
+
+        return b''.join(chunks)
+
     #
     # Page management
     #
 
     def _create_page(self, page_num, permissions=None):
-        return Page(
+        page_type = ArrayPage if self.state is not None and options.ARRAY_PAGES in self.state.options else Page
+        return page_type(
             page_num*self._page_size, self._page_size,
             executable=self._executable_pages, permissions=permissions
         )
@@ -568,27 +1080,24 @@ class SimPagedMemory:
     def _get_page(self, page_num, write=False, create=False, initialize=True):
         page_addr = page_num * self._page_size
         try:
-            page = self._pages[page_num]
+            page = self._page_table.pages[page_num]
         except KeyError:
             if not (initialize or create or page_addr in self._preapproved_stack):
                 raise
 
+            page_table = self._writable_page_table()
             page = self._create_page(page_num)
-            self._symbolic_addrs[page_num] = set()
+            page_table.symbolic_addrs[page_num] = set()
             if initialize:
                 initialized = self._initialize_page(page_num, page)
                 if not initialized and not create and page_addr not in self._preapproved_stack:
                     raise
 
-            self._pages[page_num] = page
-            self._cowed.add(page_num)
+            page_table.set_page(page_num, page)
             return page
 
-        if write and page_num not in self._cowed:
-            page = page.copy()
-            self._symbolic_addrs[page_num] = set(self._symbolic_addrs[page_num])
-            self._cowed.add(page_num)
-            self._pages[page_num] = page
+        if write and (self._page_table.refcount > 1 or page._refcount > 1 or page._frozen):
+            page = self._writable_page_table().unshare_page(page_num)
 
         return page
 
@@ -637,12 +1146,16 @@ class SimPagedMemory:
         if self._page_size != other._page_size:
             raise SimMemoryError("SimPagedMemory page sizes differ. This is asking for disaster.")
 
+        if self._page_table is other._page_table:
+            return set()
+
         our_pages = set(self._pages.keys())
         their_pages = set(other._pages.keys())
         their_additions = their_pages - our_pages
         our_additions = our_pages - their_pages
         common_pages = our_pages & their_pages
 
+        differences = set()
         candidates = set()
         for p in their_additions:
             candidates.update(other._pages[p].keys())
@@ -656,11 +1169,10 @@ class SimPagedMemory:
             if our_page is their_page:
                 continue
 
-            our_keys = set(our_page.keys())
-            their_keys = set(their_page.keys())
-            changes = (our_keys - their_keys) | (their_keys - our_keys) | {
-                i for i in (our_keys & their_keys) if our_page.load_mo(self.state, i) is not their_page.load_mo(self.state, i)
-            }
+            # bytes that are only present in one of the pages are known to differ, and all other changed bytes still
+            # have to be compared
+            definite, changes = our_page.changed_bytes(their_page)
+            differences.update(definite)
             candidates.update(changes)
 
         #both_changed = our_changes & their_changes
@@ -670,7 +1182,6 @@ class SimPagedMemory:
         #ours_deleted_only = our_deletions - both_deleted
         #theirs_deleted_only = their_deletions - both_deleted
 
-        differences = set()
         for c in candidates:
             if c not in self and c in other:
                 differences.add(c)
@@ -992,7 +1503,8 @@ class SimPagedMemory:
         page_num = addr // self._page_size
 
         try:
-            page = self._get_page(page_num)
+            # pages may be shared with other states, so only modify our own copy
+            page = self._get_page(page_num, write=permissions is not None)
         except KeyError:
             raise SimMemoryMissingError("page does not exist at given address")
 
@@ -1037,10 +1549,10 @@ class SimPagedMemory:
         if isinstance(permissions, int):
             permissions = claripy.BVV(permissions, 3)
 
+        page_table = self._writable_page_table()
         for page in range(pages):
             page_id = base_page_num + page
-            self._pages[page_id] = self._create_page(page_id, permissions=permissions)
-            self._symbolic_addrs[page_id] = set()
+            page_table.set_page(page_id, self._create_page(page_id, permissions=permissions))
             if init_zero:
                 if self.state is not None:
                     self.state.scratch.push_priv(True)
@@ -1072,9 +1584,9 @@ class SimPagedMemory:
                     l.warning("unmap_region received address and length combination is not mapped")
                     return
 
+        page_table = self._writable_page_table()
         for page in range(pages):
-            del self._pages[base_page_num + page]
-            del self._symbolic_addrs[base_page_num + page]
+            page_table.remove_page(base_page_num + page)
 
     def flush_pages(self, white_list):
         """
@@ -1086,16 +1598,16 @@ class SimPagedMemory:
             for page_addr in range(addr[0], addr[1], self._page_size):
                 white_list_page_number.append(page_addr // self._page_size)
 
-        new_page_dict = {}
+        page_table = self._writable_page_table()
 
         # cycle over all the keys ( the page number )
-        for page in self._pages:
-            if page in white_list_page_number:
-                # l.debug("Page " + str(page) + " not flushed!")
-                new_page_dict[page] = self._pages[page]
+        for page in list(page_table.pages):
+            if page not in white_list_page_number:
+                page_table.remove_page(page)
+            # else:
+            #     l.debug("Page " + str(page) + " not flushed!")
 
-        self._pages = new_page_dict
-        self._initialized = set()
+        page_table.initialized = set()
 
 
 from .. import sim_options as o
@@ -1,17 +1,40 @@
 import collections
 import contextlib
 import tempfile
+import hashlib
 import weakref
 import logging
 import claripy
 import pickle
 import shelve
+import struct
 import uuid
+import zlib
 import os
 import io
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
 l = logging.getLogger("angr.vault")
 
+
+def _digest(data):
+    """
+    A fast digest of data, used to address the content of records of a VaultPack. blake2b is only available in Python
+    3.6 and later.
+    """
+    if hasattr(hashlib, 'blake2b'):
+        return hashlib.blake2b(data, digest_size=20)
+    return hashlib.sha1(data)
+
 class VaultPickler(pickle.Pickler):
     def __init__(self, vault, file, *args, assigned_objects=(), **kwargs):
         """
@@ -42,6 +65,40 @@ class VaultUnpickler(pickle.Unpickler):
     def persistent_load(self, pid):
         return self.vault.load(pid)
 
+class BatchPickler(pickle.Pickler):
+    def __init__(self, vault, file, ast_table):
+        """
+        A pickler that writes ASTs to a shared table instead of the pickle, and only references objects that are
+        registered in the vault by their IDs.
+        """
+
+        super().__init__(file, pickle.HIGHEST_PROTOCOL)
+        self.vault = vault
+        self.ast_table = ast_table
+
+    def persistent_id(self, obj):
+        known = self.vault._known_objects.get(id(obj), None)
+        if known is not None and known[0] is obj:
+            return known[1]
+
+        if isinstance(obj, claripy.ast.Base):
+            h = hash(obj)
+            self.ast_table[h] = obj
+            return ('AST', h)
+
+        return None
+
+class BatchUnpickler(pickle.Unpickler):
+    def __init__(self, vault, file, ast_table):
+        super().__init__(file)
+        self.vault = vault
+        self.ast_table = ast_table
+
+    def persistent_load(self, pid):
+        if type(pid) is tuple:
+            return self.ast_table[pid[1]]
+        return self.vault.load(pid)
+
 class Vault(collections.MutableMapping):
     """
     The vault is a serializer for angr.
@@ -86,12 +143,42 @@ class Vault(collections.MutableMapping):
         self.unsafe_key_baseclasses = {
             claripy.ast.Base, SimType
         }
+        self._known_ids = { }
+        self._known_objects = { }
+
+    def register(self, i, o):
+        """
+        Registers an object under a fixed ID. The object is never stored; instead, references to it are resolved to
+        whatever object is registered under the same ID when loading. This is useful for objects that already exist on
+        the loading side, e.g. in another process.
+
+        :param i: the ID
+        :param o: the object
+        """
+        self._known_ids[i] = o
+        self._known_objects[id(o)] = (o, i)
+
+    def register_project(self, project):
+        """
+        Registers a project and its engines, so that they are not stored with every state.
+
+        :param project: the project
+        """
+        self.register('Project', project)
+        # the memory backer of all states
+        self.register('Project-memory', project.loader.memory)
+        for name in project.engines.order:
+            self.register('Engine-' + name, project.engines.get_plugin(name))
 
     def _get_persistent_id(self, o):
         """
         Determines a persistent ID for an object.
         Does NOT do stores.
         """
+        known = self._known_objects.get(id(o), None)
+        if known is not None and known[0] is o:
+            return known[1]
+
         if type(o) in self.hash_dedup:
             oid = o.__class__.__name__ + "-" + str(hash(o))
             self._object_cache[oid] = o
@@ -141,6 +228,8 @@ class Vault(collections.MutableMapping):
         :param id: an ID to use
         """
         l.debug("LOAD: %s", id)
+        if id in self._known_ids:
+            return self._known_ids[id]
         try:
             l.debug("... trying cached")
             return self._object_cache[id]
@@ -160,6 +249,9 @@ class Vault(collections.MutableMapping):
 
         l.debug("STORE: %s %s", o, actual_id)
 
+        if actual_id in self._known_ids:
+            return actual_id
+
         # this handles recursive objects
         if actual_id in self.storing:
             return actual_id
@@ -175,6 +267,22 @@ class Vault(collections.MutableMapping):
 
         return actual_id
 
+    def store_many(self, objects):
+        """
+        Stores several objects and returns their IDs.
+
+        :param objects: the objects
+        """
+        return [ self.store(o) for o in objects ]
+
+    def load_many(self, ids):
+        """
+        Retrieves several objects with the provided ids.
+
+        :param ids: the IDs
+        """
+        return [ self.load(i) for i in ids ]
+
     def dumps(self, o):
         """
         Returns a serialized string representing the object, post-deduplication.
@@ -195,6 +303,38 @@ class Vault(collections.MutableMapping):
         f = io.BytesIO(s)
         return VaultUnpickler(self, f).load()
 
+    def dumps_batch(self, objects):
+        """
+        Serializes several objects (e.g., states) together. Unlike dumps(), nothing is stored in the vault: the objects
+        are pickled together, so objects that they share are only written once, and all ASTs that they reference are
+        written once to a table, keyed by their hashes. Only objects that are registered in the vault are referenced
+        by their IDs.
+
+        :param objects: the objects
+        """
+        table = { }
+        f = io.BytesIO()
+        BatchPickler(self, f, table).dump(list(objects))
+        # the ASTs are pickled without persistent IDs, so that every node of their DAGs is written once
+        return pickle.dumps((pickle.dumps(table, pickle.HIGHEST_PROTOCOL), f.getvalue()), pickle.HIGHEST_PROTOCOL)
+
+    def loads_batch(self, s):
+        """
+        Deserializes objects that were serialized with dumps_batch(). ASTs are re-interned, so that the objects share
+        them with each other and with all identical ASTs that already exist in this process.
+
+        :param s: the string
+        :return: a list of the objects
+        """
+        table_data, data = pickle.loads(s)
+        table = pickle.loads(table_data)
+        for h, ast in table.items():
+            cache = getattr(type(ast), '_hash_cache', None)
+            existing = None if cache is None else cache.get(h, None)
+            if existing is not None:
+                table[h] = existing
+        return BatchUnpickler(self, io.BytesIO(data), table).load()
+
     @staticmethod
     def close():
         pass
@@ -285,7 +425,286 @@ class VaultShelf(VaultDict):
     def close(self):
         self._dict.close()
 
+class VaultPack(Vault):
+    """
+    A Vault that appends all objects to a single pack file, and keeps an index of their offsets in memory.
+
+    Storage is content-addressed: objects whose pickles are identical are only written once, no matter what their IDs
+    are, and memory pages are stored under IDs derived from their content, so a page that is shared by many states
+    (or that has the same content in many states) is stored once and is shared again by the states that are loaded.
+    Pages that are stored or loaded are frozen: they are copied when they are written to, so their IDs are computed
+    only once. Records are compressed with zstd or lz4 if one of them is installed, and with zlib otherwise.
+
+    The index is written to `path + '.idx'` on close(), and rebuilt by scanning the pack file if it is missing or out
+    of date. A partially written record at the end of the pack file, e.g., after a crash, is discarded.
+    """
+
+    # record header: length of the ID, codec, length of the data
+    _RECORD = struct.Struct('<HBI')
+    _OFFSET = struct.Struct('<Q')
+
+    CODEC_NONE = 0
+    CODEC_ZLIB = 1
+    CODEC_ZSTD = 2
+    CODEC_LZ4 = 3
+    # the record refers to the data of the record at the offset in its data
+    CODEC_LINK = 255
+
+    def __init__(self, path=None, compression='auto'):
+        """
+        :param str path:        Path to the pack file. By default, a temporary file is used.
+        :param compression:     'zstd', 'lz4', 'zlib', None for no compression, or 'auto' for the fastest one that
+                                is available.
+        """
+        super().__init__()
+        if path is None:
+            fd, path = tempfile.mkstemp(suffix='.pack')
+            os.close(fd)
+        self._path = path
+
+        if compression == 'auto':
+            compression = 'zstd' if zstandard is not None else 'lz4' if lz4_frame is not None else 'zlib'
+        self._codec = {
+            None: self.CODEC_NONE, 'zlib': self.CODEC_ZLIB, 'zstd': self.CODEC_ZSTD, 'lz4': self.CODEC_LZ4,
+        }[compression]
+        if self._codec == self.CODEC_ZSTD and zstandard is None or self._codec == self.CODEC_LZ4 and lz4_frame is None:
+            raise AngrVaultError("%s is not installed" % compression)
+        self.content_dedup = { BasePage }
+
+        # ID -> (offset of the data, length of the data, codec)
+        self._index = { }
+        # digest of uncompressed data -> (offset of the data, length of the data, codec)
+        self._digests = { }
+        # pickles of content-addressed objects that are about to be stored, by ID
+        self._pending = { }
+        # IDs of content-addressed objects that are frozen, so that their IDs do not change
+        self._content_ids = weakref.WeakKeyDictionary()
+        self._dirty = False
+        # records that are written to the pack file together by store_many(), or None
+        self._batch = None
+        self._batch_offset = 0
+        # data of records that are read together by load_many(), by index entry
+        self._prefetched = { }
+
+        self._file = open(path, 'a+b')
+        self._load_index()
+
+    def _load_index(self):
+        self._file.seek(0, os.SEEK_END)
+        size = self._file.tell()
+        try:
+            with open(self._path + '.idx', 'rb') as f:
+                index_size, index, digests = pickle.load(f)
+            if index_size == size:
+                self._index = index
+                self._digests = digests
+                return
+        except (OSError, EOFError, pickle.UnpicklingError, ValueError, TypeError):
+            pass
+
+        by_offset = { }
+        offset = 0
+        while offset < size:
+            self._file.seek(offset)
+            header = self._file.read(self._RECORD.size)
+            try:
+                id_len, codec, data_len = self._RECORD.unpack(header)
+            except struct.error:
+                break
+            data_offset = offset + self._RECORD.size + id_len
+            if data_offset + data_len > size:
+                break
+            i = self._file.read(id_len).decode()
+            data = self._file.read(data_len)
+            if codec == self.CODEC_LINK:
+                target, = self._OFFSET.unpack(data)
+                self._index[i] = by_offset[target]
+            else:
+                entry = self._index[i] = by_offset[data_offset] = (data_offset, data_len, codec)
+                # dedup by content also works for objects that were stored before the pack was reopened
+                self._digests.setdefault(_digest(self._decompress(data, codec)).digest(), entry)
+            offset = data_offset + data_len
+
+        if offset < size:
+            l.warning("Discarding a partially written record at the end of %s.", self._path)
+            self._file.truncate(offset)
+
+    def _compress(self, data):
+        if self._codec == self.CODEC_ZSTD:
+            return zstandard.ZstdCompressor().compress(data)
+        if self._codec == self.CODEC_LZ4:
+            return lz4_frame.compress(data)
+        if self._codec == self.CODEC_ZLIB:
+            return zlib.compress(data)
+        return data
+
+    @staticmethod
+    def _decompress(data, codec):
+        if codec == VaultPack.CODEC_ZSTD:
+            return zstandard.ZstdDecompressor().decompress(data)
+        if codec == VaultPack.CODEC_LZ4:
+            return lz4_frame.decompress(data)
+        if codec == VaultPack.CODEC_ZLIB:
+            return zlib.decompress(data)
+        return data
+
+    def _append(self, i, codec, data):
+        encoded_id = i.encode()
+        record = self._RECORD.pack(len(encoded_id), codec, len(data)) + encoded_id + data
+        if self._batch is not None:
+            offset = self._batch_offset + self._RECORD.size + len(encoded_id)
+            self._batch.append(record)
+            self._batch_offset += len(record)
+            return offset
+        self._file.seek(0, os.SEEK_END)
+        offset = self._file.tell() + self._RECORD.size + len(encoded_id)
+        self._file.write(record)
+        self._dirty = True
+        return offset
+
+    def _flush_batch(self):
+        if self._batch:
+            self._file.seek(0, os.SEEK_END)
+            self._file.write(b''.join(self._batch))
+            self._dirty = True
+            del self._batch[:]
+
+    def _put(self, i, raw):
+        digest = _digest(raw).digest()
+        entry = self._digests.get(digest, None)
+        if entry is not None:
+            self._append(i, self.CODEC_LINK, self._OFFSET.pack(entry[0]))
+        else:
+            data = self._compress(raw)
+            entry = (self._append(i, self._codec, data), len(data), self._codec)
+            self._digests[digest] = entry
+        self._index[i] = entry
+
+    @contextlib.contextmanager
+    def _write_context(self, i):
+        f = io.BytesIO()
+        yield f
+        self._put(i, f.getvalue())
+
+    @contextlib.contextmanager
+    def _read_context(self, i):
+        try:
+            offset, length, codec = self._index[i]
+        except KeyError as e:
+            raise AngrVaultError from e
+        data = self._prefetched.get((offset, length, codec), None)
+        if data is None:
+            self._flush_batch()
+            if self._dirty:
+                self._file.flush()
+                self._dirty = False
+            self._file.seek(offset)
+            data = self._file.read(length)
+        yield io.BytesIO(self._decompress(data, codec))
+
+    def is_stored(self, i):
+        return i in self._index
+
+    def keys(self):
+        return self._index.keys()
+
+    def _get_persistent_id(self, o):
+        if isinstance(o, tuple(self.content_dedup)):
+            oid = self._content_ids.get(o, None)
+            if oid is not None and (oid in self._index or oid in self._pending):
+                return oid
+            f = io.BytesIO()
+            VaultPickler(self, f, assigned_objects=(o,)).dump(o)
+            raw = f.getvalue()
+            oid = "%s-%s" % (o.__class__.__name__, _digest(raw).hexdigest())
+            if oid not in self._index:
+                self._pending[oid] = raw
+            # the ID is only valid as long as the content does not change
+            o._frozen = True
+            self._content_ids[o] = oid
+            return oid
+        return super()._get_persistent_id(o)
+
+    def store(self, o, id=None): #pylint:disable=redefined-builtin
+        if id is None and isinstance(o, tuple(self.content_dedup)):
+            id = self._get_persistent_id(o)
+        raw = self._pending.pop(id, None) if id is not None else None
+        if raw is None:
+            return super().store(o, id=id)
+        if id not in self._index:
+            self._put(id, raw)
+        self.stored.add(id)
+        return id
+
+    def store_many(self, objects):
+        """
+        Stores several objects and returns their IDs. All records are appended to the pack file with a single write.
+
+        :param objects: the objects
+        """
+        if self._batch is not None:
+            return super().store_many(objects)
+        self._file.seek(0, os.SEEK_END)
+        self._batch = [ ]
+        self._batch_offset = self._file.tell()
+        try:
+            return super().store_many(objects)
+        finally:
+            self._flush_batch()
+            self._batch = None
+
+    def load_many(self, ids):
+        """
+        Retrieves several objects with the provided ids. The records of the objects are read in the order in which they
+        are stored in the pack file, and adjacent records are read together.
+
+        :param ids: the IDs
+        """
+        ids = list(ids)
+        self._flush_batch()
+        if self._dirty:
+            self._file.flush()
+            self._dirty = False
+
+        entries = sorted(set(self._index[i] for i in ids if i in self._index and i not in self._object_cache))
+        data = { }
+        run = [ ]
+        for entry in entries + [ None ]:
+            # records that are at most 4 KiB apart are read together
+            if run and (entry is None or entry[0] - (run[-1][0] + run[-1][1]) > 0x1000):
+                start = run[0][0]
+                self._file.seek(start)
+                chunk = self._file.read(run[-1][0] + run[-1][1] - start)
+                for offset, length, codec in run:
+                    data[(offset, length, codec)] = chunk[offset - start:offset - start + length]
+                run = [ ]
+            if entry is not None:
+                run.append(entry)
+
+        self._prefetched = data
+        try:
+            return super().load_many(ids)
+        finally:
+            self._prefetched = { }
+
+    def load(self, id): #pylint:disable=redefined-builtin
+        o = super().load(id)
+        if isinstance(o, tuple(self.content_dedup)) and self._object_cache.get(id, None) is not o:
+            # share the object between all objects that are loaded, and make sure that none of them modifies it in
+            # place, since it is also what future loads of this ID return
+            o._frozen = True
+            self._object_cache[id] = o
+            self._content_ids[o] = id
+        return o
+
+    def close(self):
+        self._file.close()
+        self._dirty = False
+        with open(self._path + '.idx', 'wb') as f:
+            pickle.dump((os.path.getsize(self._path), self._index, self._digests), f, pickle.HIGHEST_PROTOCOL)
+
 from .errors import AngrVaultError
 from .project import Project
 from .sim_type import SimType
 from .sim_state import SimState
+from .storage.paged_memory import BasePage
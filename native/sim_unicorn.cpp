@@ -59,6 +59,7 @@ typedef struct CachedPage {
 	size_t size;
 	uint8_t *bytes;
 	uint64_t perms;
+	bool owned; // whether bytes were allocated by the cache
 } CachedPage;
 
 typedef taint_t PageBitmap[PAGE_SIZE];
@@ -81,6 +82,7 @@ typedef struct mem_access {
 
 typedef struct mem_update {
 	uint64_t address, length;
+	uint8_t *data;
 	struct mem_update *next;
 } mem_update_t;
 
@@ -104,6 +106,9 @@ private:
 	BlockCache *block_cache;
 	bool hooked;
 
+	// cached pages that must not be mapped for this state, since the state has its own copy of them
+	std::unordered_set<uint64_t> uncached_pages;
+
 	uc_context *saved_regs;
 
 	std::vector<mem_access_t> mem_writes;
@@ -482,10 +487,30 @@ public:
 	}
 
 	/*
-	 * record consecutive dirty bit rage, return a linked list of ranges
+	 * map a writable range, fill it with its content, and activate all its pages at once
+	 */
+	uc_err map_and_activate(uint64_t address, uint64_t length, uint8_t *bytes, uint64_t permissions, uint8_t *taint) {
+		uc_err err = uc_mem_map(uc, address, length, permissions);
+		if (err) {
+			return err;
+		}
+		err = uc_mem_write(uc, address, bytes, length);
+		if (err) {
+			return err;
+		}
+		for (uint64_t offset = 0; offset < length; offset += 0x1000) {
+			page_activate(address + offset, taint, offset);
+		}
+		return UC_ERR_OK;
+	}
+
+	/*
+	 * record consecutive dirty bit ranges along with their content, return a linked list of ranges.
+	 * ranges that continue on the next active page are merged.
 	 */
 	mem_update_t *sync() {
 		mem_update *head = NULL;
+		std::vector<std::pair<uint64_t, uint64_t>> ranges;
 
 		for (auto it = active_pages.begin(); it != active_pages.end(); it++) {
 			taint_t *start = it->second;
@@ -496,20 +521,28 @@ public:
 					taint_t *j = i;
 					while (j < end && (*j) == TAINT_DIRTY) j++;
 
-					char buf[0x1000];
-					uc_mem_read(uc, it->first + (i - start), buf, j - i);
-					//LOG_D("sync [%#lx, %#lx] = %#lx", it->first + (i - start), it->first + (j - start), *(uint64_t *)buf);
-
-					mem_update_t *range = new mem_update_t;
-					range->address = it->first + (i - start);
-					range->length = j - i;
-					range->next = head;
-					head = range;
+					uint64_t address = it->first + (i - start);
+					if (!ranges.empty() && ranges.back().first + ranges.back().second == address) {
+						ranges.back().second += j - i;
+					} else {
+						ranges.push_back(std::make_pair(address, (uint64_t)(j - i)));
+					}
 
 					i = j;
 				}
 		}
 
+		for (auto it = ranges.begin(); it != ranges.end(); it++) {
+			mem_update_t *range = new mem_update_t;
+			range->address = it->first;
+			range->length = it->second;
+			range->data = new uint8_t[it->second];
+			uc_mem_read(uc, range->address, range->data, range->length);
+			//LOG_D("sync [%#lx, %#lx]", range->address, range->address + range->length);
+			range->next = head;
+			head = range;
+		}
+
 		return head;
 	}
 
@@ -525,7 +558,11 @@ public:
 		}
 	}
 
-	std::pair<uint64_t, size_t> cache_page(uint64_t address, size_t size, char* bytes, uint64_t permissions)
+	/*
+	 * put a range of pages into the page cache. if `copy` is false, the cache refers to `bytes` directly, which must
+	 * stay alive as long as the cache does.
+	 */
+	std::pair<uint64_t, size_t> cache_page(uint64_t address, size_t size, char* bytes, uint64_t permissions, bool copy = true)
 	{
 		//printf("caching page %#lx - %#lx.\n", address, address + size);
 		// Make sure this page is not overlapping with any existing cached page
@@ -551,42 +588,57 @@ public:
 					return std::make_pair(address, size);
 				}
 				size = address + size - (before->first + before->second.size);
+				bytes += before->first + before->second.size - address;
 				address = before->first + before->second.size;
 			}
 		}
 
 		for (uint64_t offset = 0; offset < size; offset += 0x1000) {
-			uint8_t *copy = (uint8_t *)malloc(0x1000);
+			uint8_t *page_bytes = (uint8_t *)&bytes[offset];
+			if (copy) {
+				page_bytes = (uint8_t *)malloc(0x1000);
+				// address should be aligned to 0x1000
+				memcpy(page_bytes, &bytes[offset], 0x1000);
+			}
 			CachedPage cached_page = {
 				0x1000,
-				copy,
-				permissions
+				page_bytes,
+				permissions,
+				copy
 			};
-			// address should be aligned to 0x1000
-			memcpy(copy, &bytes[offset], 0x1000);
 			page_cache->insert(std::pair<uint64_t, CachedPage>(address+offset, cached_page));
 		}
 		return std::make_pair(address, size);
 	}
 
+	/*
+	 * stop using the cached copy of a page in this state, because the state has modified the page or made it
+	 * writable. the page stays in the cache for all other states that share the cache.
+	 */
 	void uncache_page(uint64_t address) {
 		if ((address & 0xfff) != 0) {
 			printf("Warning: Address #%" PRIx64 " passed to uncache_page is not aligned\n", address);
 			return;
 		}
 
+		uncached_pages.insert(address);
 		auto page = page_cache->find(address);
 		if (page != page_cache->end()) {
+			// the cached copy may still be mapped by a previous run on the same engine
 			//printf("Internal: unmapping %#llx size %#x, result %#x", page->first, page->second.size, uc_mem_unmap(uc, page->first, page->second.size));
 			uc_mem_unmap(uc, page->first, page->second.size);
-			//free(page->second.bytes); // other forks might need this I guess :( how the HELL do you make memory management sane?
-			page_cache->erase(page);
 		} else {
 			//printf("Uh oh! Couldn't find page at %#llx\n", address);
 		}
 	}
 
 	bool map_cache(uint64_t address, size_t size) {
+		for (uint64_t page_addr = address & ~0xFFFULL; page_addr < address + size; page_addr += 0x1000) {
+			if (uncached_pages.count(page_addr)) {
+				return false;
+			}
+		}
+
 		auto it = page_cache->lower_bound(address);
 
 		if (it == page_cache->end() && it != page_cache->begin()) {
@@ -1266,6 +1318,7 @@ void simunicorn_destroy(mem_update_t * head) {
 	mem_update_t *next;
 	for (mem_update_t *cur = head; cur; cur = next) {
 		next = cur->next;
+		delete[] cur->data;
 		delete cur;
 	}
 }
@@ -1288,6 +1341,40 @@ void simunicorn_activate(State *state, uint64_t address, uint64_t length, uint8_
 		state->page_activate(address + offset, taint, offset);
 }
 
+extern "C"
+uc_err simunicorn_map_page(State *state, uint64_t address, uint64_t length, uint8_t *bytes, uint64_t permissions, uint8_t *taint) {
+	return state->map_and_activate(address, length, bytes, permissions, taint);
+}
+
+/*
+ * Bulk register synchronization. Registers are at most 64 bits wide, and their values are passed in one array.
+ * These work on the unicorn engine directly, since registers are set up before the native state is allocated.
+ */
+
+extern "C"
+uc_err simunicorn_set_regs(uc_engine *uc, uint64_t count, int *ids, uint64_t *values) {
+	for (uint64_t i = 0; i < count; i++) {
+		uc_err err = uc_reg_write(uc, ids[i], &values[i]);
+		if (err) {
+			return err;
+		}
+	}
+	return UC_ERR_OK;
+}
+
+extern "C"
+uc_err simunicorn_get_regs(uc_engine *uc, uint64_t count, int *ids, uint64_t *values) {
+	// registers narrower than 64 bits only fill the low bytes
+	memset(values, 0, sizeof(uint64_t) * count);
+	for (uint64_t i = 0; i < count; i++) {
+		uc_err err = uc_reg_read(uc, ids[i], &values[i]);
+		if (err) {
+			return err;
+		}
+	}
+	return UC_ERR_OK;
+}
+
 extern "C"
 uint64_t simunicorn_executed_pages(State *state) { // this is HORRIBLE
 	if (state->executed_pages_iterator == NULL) {
@@ -1414,6 +1501,40 @@ void simunicorn_uncache_page(State *state, uint64_t address) {
 	state->uncache_page(address);
 }
 
+/*
+ * Free the page and block caches of a cache key. No state that uses the cache may be alive.
+ */
+extern "C"
+void simunicorn_free_cache(uint64_t cache_key) {
+	auto it = global_cache.find(cache_key);
+	if (it == global_cache.end()) {
+		return;
+	}
+	for (auto page = it->second.page_cache->begin(); page != it->second.page_cache->end(); page++) {
+		if (page->second.owned) {
+			free(page->second.bytes);
+		}
+	}
+	delete it->second.page_cache;
+	delete it->second.block_cache;
+	global_cache.erase(it);
+}
+
+extern "C"
+void simunicorn_uncache_pages(State *state, uint64_t count, uint64_t *addresses) {
+	for (uint64_t i = 0; i < count; i++) {
+		state->uncache_page(addresses[i]);
+	}
+}
+
+/*
+ * Put pages into the cache without copying them. They are mapped on demand into every engine that uses the same cache.
+ */
+extern "C"
+void simunicorn_share_page(State *state, uint64_t address, uint64_t length, char *bytes, uint64_t permissions) {
+	state->cache_page(address, length, bytes, permissions, false);
+}
+
 // Tracking settings
 extern "C"
 void simunicorn_set_tracking(State *state, bool track_bbls, bool track_stack) {
@@ -0,0 +1,55 @@
+import os
+import sys
+import time
+
+import angr
+
+test_location = str(os.path.join(os.path.dirname(os.path.realpath(__file__)), '../../binaries/tests'))
+
+
+def _cfg(binary, context_sensitivity_level):
+    proj = angr.Project(os.path.join(test_location, 'x86_64', binary), load_options={'auto_load_libs': False})
+    cfg = proj.analyses.CFGEmulated(context_sensitivity_level=context_sensitivity_level, keep_state=True,
+                                    state_add_options=angr.sim_options.refs)
+    return proj, cfg
+
+
+def perf_ddg_construction():
+    # larger context sensitivity levels give larger graphs of the same program
+    for binary in ('datadep_test', 'fauxware'):
+        for level in (0, 1, 2, 3):
+            proj, cfg = _cfg(binary, level)
+
+            start = time.time()
+            ddg = proj.analyses.DDG(cfg)
+            elapsed = time.time() - start
+
+            print("%s, context sensitivity %d: %d CFG nodes, %d statements. Construction takes %f sec" % (
+                binary, level, len(cfg.graph), len(ddg.graph), elapsed))
+
+
+def perf_ddg_update():
+    for level in (0, 1, 2, 3):
+        proj, cfg = _cfg('datadep_test', level)
+        ddg = proj.analyses.DDG(cfg, start=cfg.functions['main'].addr)
+
+        node = cfg.get_any_node(0x400667)
+        start = time.time()
+        ddg.update([ node ])
+        elapsed = time.time() - start
+
+        print("datadep_test, context sensitivity %d: %d CFG nodes. Updating one node takes %f sec" % (
+            level, len(cfg.graph), elapsed))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        for arg in sys.argv[1:]:
+            print('perf_' + arg)
+            globals()['perf_' + arg]()
+
+    else:
+        for fk, fv in list(globals().items()):
+            if fk.startswith('perf_') and callable(fv):
+                print(fk)
+                res = fv()
@@ -0,0 +1,45 @@
+import sys
+import time
+
+import angr
+from angr import options as so
+
+HEAP_BASE = 0x10000000
+HEAP_PAGES = 256
+
+
+def _merge_latency(dirty_pages, add_options=None):
+    state = angr.SimState(arch='AMD64', add_options=add_options)
+    for i in range(HEAP_PAGES):
+        state.memory.store(HEAP_BASE + i * 0x1000, b'\x41' * 0x1000)
+
+    s1 = state.copy()
+    s2 = state.copy()
+    for i in range(dirty_pages):
+        addr = HEAP_BASE + i * 0x1000
+        s1.memory.store(addr + 0x10, b'\x42' * 8)
+        s2.memory.store(addr + 0x800, b'\x43' * 8)
+
+    start = time.time()
+    s1.merge(s2)
+    return time.time() - start
+
+
+def perf_merge_dirty_pages():
+    for options, name in ((None, 'ListPage'), ({so.ARRAY_PAGES}, 'ArrayPage')):
+        for dirty_pages in (1, 4, 16, 64, 256):
+            elapsed = _merge_latency(dirty_pages, add_options=options)
+            print("%s: merging %d dirty pages takes %f sec" % (name, dirty_pages, elapsed))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        for arg in sys.argv[1:]:
+            print('perf_' + arg)
+            globals()['perf_' + arg]()
+
+    else:
+        for fk, fv in list(globals().items()):
+            if fk.startswith('perf_') and callable(fv):
+                print(fk)
+                res = fv()
@@ -0,0 +1,44 @@
+import sys
+import time
+
+import angr
+from angr import options as so
+
+
+def _eval_latency(groups, add_options=None, remove_options=None):
+    state = angr.SimState(arch='AMD64', add_options=add_options, remove_options=remove_options)
+    variables = [ state.solver.BVS('v%d' % i, 32) for i in range(groups) ]
+    for i, v in enumerate(variables):
+        state.add_constraints(state.solver.ULT(v, 1000 + i), state.solver.UGT(v * 3, 2000))
+    x = variables[0]
+
+    start = time.time()
+    for i in range(20):
+        state.add_constraints(x != i + 700)
+        state.solver.eval_upto(x, 2)
+        state.solver.satisfiable()
+    return time.time() - start
+
+
+def perf_solver_independent_constraints():
+    for name, options, removed in (
+            ('all constraints', set(), { so.COMPOSITE_SOLVER }),
+            ('composite solver', { so.COMPOSITE_SOLVER }, set()),
+            ('constraint slicing', { so.CONSTRAINT_SLICING }, { so.COMPOSITE_SOLVER }),
+    ):
+        for groups in (10, 100, 300):
+            elapsed = _eval_latency(groups, add_options=options, remove_options=removed)
+            print("%s: 20 queries with %d independent groups take %f sec" % (name, groups, elapsed))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        for arg in sys.argv[1:]:
+            print('perf_' + arg)
+            globals()['perf_' + arg]()
+
+    else:
+        for fk, fv in list(globals().items()):
+            if fk.startswith('perf_') and callable(fv):
+                print(fk)
+                res = fv()
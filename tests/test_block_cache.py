@@ -4,6 +4,7 @@ import logging
 l = logging.getLogger("angr.tests")
 
 import os
+import tempfile
 test_location = str(os.path.join(os.path.dirname(os.path.realpath(__file__)), '../../binaries/tests'))
 
 def test_block_cache():
@@ -15,5 +16,78 @@ def test_block_cache():
     b = p.factory.block(p.entry)
     assert p.factory.block(p.entry).vex is not b.vex
 
+def test_persistent_block_cache():
+    db_path = os.path.join(tempfile.mkdtemp(), "blocks.db")
+
+    p = angr.Project(os.path.join(test_location, "x86_64", "fauxware"), translation_cache=False,
+                     persistent_block_cache=db_path)
+    cache = p._persistent_block_cache
+    b = p.factory.block(p.entry)
+    assert cache.misses == 1 and cache.hits == 0
+    assert len(cache) == 1
+
+    # a new project (e.g., in a new run) uses the blocks that are lifted before
+    p = angr.Project(os.path.join(test_location, "x86_64", "fauxware"), translation_cache=False,
+                     persistent_block_cache=db_path)
+    cache = p._persistent_block_cache
+    b_ = p.factory.block(p.entry)
+    assert cache.misses == 0 and cache.hits == 1
+    assert b_.vex is not b.vex
+    assert b_.vex.size == b.vex.size
+    assert b_.vex.jumpkind == b.vex.jumpkind
+    assert len(b_.vex.statements) == len(b.vex.statements)
+
+def test_persistent_block_cache_stop_points():
+    db_path = os.path.join(tempfile.mkdtemp(), "blocks.db")
+
+    p = angr.Project(os.path.join(test_location, "x86_64", "fauxware"), translation_cache=False,
+                     persistent_block_cache=db_path)
+    full = p.factory.block(p.entry)
+    stop_point = full.instruction_addrs[1]
+
+    # a block that is cut short by a stop point ...
+    p = angr.Project(os.path.join(test_location, "x86_64", "fauxware"), translation_cache=False,
+                     persistent_block_cache=db_path + ".1")
+    short = p.factory.default_engine.lift(clemory=p.loader.memory, addr=p.entry, extra_stop_points={stop_point})
+    assert short.size == stop_point - p.entry
+
+    # ... is not returned to lifts without that stop point
+    p = angr.Project(os.path.join(test_location, "x86_64", "fauxware"), translation_cache=False,
+                     persistent_block_cache=db_path + ".1")
+    irsb = p.factory.default_engine.lift(clemory=p.loader.memory, addr=p.entry)
+    assert irsb.size == full.size
+
+def test_persistent_block_cache_version():
+    import sqlite3
+    from angr.engines.vex.persistent_cache import PersistentBlockCache
+
+    db_path = os.path.join(tempfile.mkdtemp(), "blocks.db")
+
+    cache = PersistentBlockCache(db_path)
+    cache.store(b"key", "irsb")
+    cache.close()
+
+    # blocks are kept across runs of the same version
+    cache = PersistentBlockCache(db_path)
+    assert len(cache) == 1
+    assert cache.load(b"key") == "irsb"
+    cache.close()
+
+    # ... and removed if the database was created by another version of PyVEX
+    conn = sqlite3.connect(db_path)
+    conn.execute("UPDATE meta SET value = '1/0.0.0' WHERE name = 'version'")
+    conn.commit()
+    conn.close()
+
+    cache = PersistentBlockCache(db_path)
+    assert len(cache) == 0
+    assert cache.load(b"key") is None
+    cache.store(b"key", "irsb")
+    assert len(cache) == 1
+    cache.close()
+
 if __name__ == "__main__":
     test_block_cache()
+    test_persistent_block_cache()
+    test_persistent_block_cache_stop_points()
+    test_persistent_block_cache_version()
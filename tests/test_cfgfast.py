@@ -592,6 +592,100 @@ def test_unresolvale_targtes():
     endpoint_addrs = {node.addr for node in func.endpoints}
     nose.tools.assert_equal(len(endpoint_addrs.symmetric_difference(true_endpoint_addrs)), 0)
 
+#
+# Parallel lifting
+#
+
+def test_parallel_lifting():
+
+    path = os.path.join(test_location, 'x86_64', 'fauxware')
+    proj = angr.Project(path, auto_load_libs=False)
+
+    cfg_serial = proj.analyses.CFGFast()
+    nodes_serial = sorted((n.addr, n.size) for n in cfg_serial.graph.nodes())
+    edges_serial = sorted((src.addr, dst.addr) for src, dst in cfg_serial.graph.edges())
+    functions_serial = sorted(cfg_serial.kb.functions.keys())
+
+    cfg_parallel = proj.analyses.CFGFast(parallel=2)
+    nodes_parallel = sorted((n.addr, n.size) for n in cfg_parallel.graph.nodes())
+    edges_parallel = sorted((src.addr, dst.addr) for src, dst in cfg_parallel.graph.edges())
+    functions_parallel = sorted(cfg_parallel.kb.functions.keys())
+
+    nose.tools.assert_equal(nodes_serial, nodes_parallel)
+    nose.tools.assert_equal(edges_serial, edges_parallel)
+    nose.tools.assert_equal(functions_serial, functions_parallel)
+    # blocks are actually taken from the worker processes
+    assert cfg_parallel._prelifted_hits > 0
+
+def test_parallel_lifting_stop_points():
+
+    path = os.path.join(test_location, 'x86_64', 'fauxware')
+    proj = angr.Project(path, auto_load_libs=False)
+
+    cfg = proj.analyses.CFGFast(parallel=2)
+    block = proj.factory.block(proj.entry)
+    irsb = block.vex_nostmt
+    stop_point = block.instruction_addrs[1]
+
+    # a prelifted block is used if the stop points did not change ...
+    cfg._prelifted_blocks = { proj.entry: (block.size, block.bytes, irsb) }
+    prelifted = cfg._pop_prelifted_block(proj.entry, block.size)
+    assert prelifted is not None
+    assert prelifted.vex_nostmt is irsb
+
+    # ... and lifted again if a stop point is inside the block
+    cfg._prelifted_blocks = { proj.entry: (block.size, block.bytes, irsb) }
+    cfg._known_thunks = { stop_point: ('ret', ) }
+    assert cfg._pop_prelifted_block(proj.entry, block.size) is None
+    lifted = cfg._lift(proj.entry, size=block.size, opt_level=cfg._iropt_level, collect_data_refs=True)
+    assert lifted.vex_nostmt.size == stop_point - proj.entry
+
+#
+# Incremental CFG recovery
+#
+
+def test_incremental_cfg():
+
+    path = os.path.join(test_location, 'x86_64', 'fauxware')
+
+    proj = angr.Project(path, auto_load_libs=False)
+    cfg_old = proj.analyses.CFGFast(collect_data_references=True)
+
+    # patch function accepted(): replace "mov edi, 0x400915" with "mov edi, 0x400916"
+    proj_new = angr.Project(path, auto_load_libs=False)
+    proj_new.loader.memory.store(0x4006f1, b"\xbf\x16\x09\x40\x00")
+
+    def _summarize(cfg):
+        nodes = sorted((n.addr, n.size) for n in cfg.graph.nodes())
+        edges = sorted((src.addr, dst.addr) for src, dst in cfg.graph.edges())
+        functions = { }
+        for func in cfg.kb.functions.values():
+            functions[func.addr] = (func.returning,
+                                    sorted((src.addr, dst.addr) for src, dst in func.graph.edges()),
+                                    sorted(n.addr for n in func.endpoints))
+        memory_data = sorted((d.address, d.size, d.sort) for d in cfg.memory_data.values())
+        insn_memory_data = sorted((insn_addr, d.address) for insn_addr, d in cfg.insn_addr_to_memory_data.items())
+        return nodes, edges, functions, memory_data, insn_memory_data
+
+    cfg_fresh = proj_new.analyses.CFGFast(collect_data_references=True)
+    fresh = _summarize(cfg_fresh)
+
+    cfg_incremental = proj_new.analyses.CFGFast(collect_data_references=True, previous_cfg=cfg_old)
+    incremental = _summarize(cfg_incremental)
+
+    nose.tools.assert_equal(fresh[0], incremental[0])
+    nose.tools.assert_equal(fresh[1], incremental[1])
+    nose.tools.assert_equal(sorted(fresh[2]), sorted(incremental[2]))
+    for func_addr in fresh[2]:
+        nose.tools.assert_equal(fresh[2][func_addr], incremental[2][func_addr])
+    nose.tools.assert_equal(fresh[3], incremental[3])
+    nose.tools.assert_equal(fresh[4], incremental[4])
+
+    # the patched block comes from the new binary, and so does the new data reference
+    node = cfg_incremental.get_any_node(0x4006ed)
+    nose.tools.assert_in(b"\xbf\x16\x09\x40\x00", node.byte_string)
+    nose.tools.assert_in(0x400916, cfg_incremental.memory_data)
+
 def run_all():
 
     g = globals()
@@ -626,6 +720,9 @@ def run_all():
     test_tail_call_optimization_detection_armel()
     test_blanket_fauxware()
     test_collect_data_references()
+    test_parallel_lifting()
+    test_parallel_lifting_stop_points()
+    test_incremental_cfg()
 
 
 def main():
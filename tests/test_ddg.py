@@ -73,6 +73,51 @@ def test_ddg_0():
     binary_path = os.path.join(test_location, 'x86_64', 'datadep_test')
     perform_one(binary_path)
 
+def test_ddg_update():
+    binary_path = os.path.join(test_location, 'x86_64', 'datadep_test')
+    proj = angr.Project(binary_path, load_options={'auto_load_libs': False})
+    cfg = proj.analyses.CFGEmulated(context_sensitivity_level=2, keep_state=True,
+                                    state_add_options=angr.sim_options.refs)
+    ddg = proj.analyses.DDG(cfg, start=cfg.functions['main'].addr)
+    edges = set(ddg.graph.edges())
+    data_edges = set(ddg.data_graph.edges())
+
+    # re-computing the def-use chains of a node in the middle of main should give back the same graphs
+    node = cfg.get_any_node(0x400667)
+    ddg.update([ node ])
+    nose.tools.assert_equal(set(ddg.graph.edges()), edges)
+    nose.tools.assert_equal(set(ddg.data_graph.edges()), data_edges)
+
+    # drop all register writes of the node, as if its states were regenerated, and compare against a fresh DDG
+    nodes = cfg.get_all_nodes(0x400667)
+    for n in nodes:
+        for state in n.final_states:
+            state.history.recent_events = [ ev for ev in state.history.recent_events
+                                             if not (isinstance(ev, angr.state_plugins.SimActionData) and
+                                                     ev.type == 'reg' and ev.action == 'write') ]
+    ddg.update(nodes)
+    ddg_fresh = proj.analyses.DDG(cfg, start=cfg.functions['main'].addr)
+    nose.tools.assert_not_equal(set(ddg.graph.edges()), edges)
+    nose.tools.assert_equal(set(ddg.graph.edges()), set(ddg_fresh.graph.edges()))
+    nose.tools.assert_equal(set(ddg.data_graph.edges()), set(ddg_fresh.data_graph.edges()))
+
+def test_ddg_worklist_order():
+    import networkx
+    from angr.analyses.ddg import DDGJob, DDGWorklist
+
+    # 0 -> 1 -> 3, 0 -> 2 -> 3, 3 -> 1
+    graph = networkx.DiGraph([ (0, 1), (1, 3), (0, 2), (2, 3), (3, 1) ])
+    worklist = DDGWorklist(graph, [ 0 ])
+    for n in (3, 1, 0, 2):
+        nose.tools.assert_true(worklist.add(DDGJob(n, 0)))
+    nose.tools.assert_false(worklist.add(DDGJob(3, 0)))
+    nose.tools.assert_equal(len(worklist), 4)
+
+    order = [ worklist.pop().cfg_node for _ in range(4) ]
+    nose.tools.assert_equal(order[0], 0)
+    nose.tools.assert_equal(order[-1], 3)
+    nose.tools.assert_equal(len(worklist), 0)
+
 def run_all():
     functions = globals()
     all_functions = dict(filter((lambda kv: kv[0].startswith('test_') and hasattr(v, '__call__')), functions.items()))
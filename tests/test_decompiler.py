@@ -1,5 +1,7 @@
 
 import os
+import shutil
+import tempfile
 
 import angr
 
@@ -63,8 +65,41 @@ def test_decompiling_mips_allcmps():
     else:
         print("Failed to decompile function %s." % repr(f))
 
+
+def test_batch_decompiling_x86_64():
+    bin_path = os.path.join(test_location, "x86_64", "all")
+    p = angr.Project(bin_path, auto_load_libs=False)
+
+    cfg = p.analyses.CFG(collect_data_references=True)
+    output_dir = tempfile.mkdtemp()
+    finished = [ ]
+    batch = p.analyses.BatchDecompiler(cfg=cfg, workers=2, output_dir=output_dir, result_callback=finished.append)
+
+    funcs = [ f for f in cfg.functions.values() if not f.is_simprocedure ]
+    assert set(batch.results) == set(f.addr for f in funcs)
+    assert len(finished) == len(funcs)
+
+    # callees are submitted before their callers
+    order = angr.analyses.batch_utils.sort_functions(cfg.kb, batch._func_addrs)
+    main = cfg.functions['main']
+    for callee in cfg.functions.callgraph.successors(main.addr):
+        if callee in order and callee != main.addr:
+            assert order.index(callee) < order.index(main.addr)
+
+    # the code is identical to the code that the Decompiler produces in the current process
+    result = batch.results[main.addr]
+    assert result.error is None
+    assert list(result.timings) == [ 'Clinic', 'RegionIdentifier', 'RecursiveStructurer', 'RegionSimplifier',
+                                     'StructuredCodeGenerator' ]
+    with open(result.path) as f:
+        assert f.read() == p.analyses.Decompiler(main, cfg=cfg).codegen.text
+
+    shutil.rmtree(output_dir)
+
+
 if __name__ == "__main__":
     test_decompiling_all_x86_64()
     test_decompiling_all_i386()
     test_decompiling_aes_armel()
     test_decompiling_mips_allcmps()
+    test_batch_decompiling_x86_64()
@@ -0,0 +1,118 @@
+import os
+import shutil
+import tempfile
+
+import nose
+import angr
+
+test_location = str(os.path.join(os.path.dirname(os.path.realpath(__file__)), '../../binaries/tests'))
+
+
+def test_distributed():
+    p = angr.Project(os.path.join(test_location, 'x86_64', 'fauxware'), auto_load_libs=False)
+
+    simgr = p.factory.simulation_manager()
+    simgr.explore(find=0x4006ed, avoid=0x4006aa)
+    expected = sorted(s.posix.dumps(0) for s in simgr.found)
+    assert expected
+
+    spool_dir = tempfile.mkdtemp()
+    try:
+        simgr = p.factory.simulation_manager()
+        distributed = angr.exploration_techniques.Distributed(spool_dir, max_queued=4)
+        simgr.use_technique(distributed)
+        distributed.spawn_workers(2)
+        simgr.explore(find=0x4006ed, avoid=0x4006aa)
+        distributed.shutdown()
+
+        nose.tools.assert_equal(sorted(s.posix.dumps(0) for s in simgr.found), expected)
+        assert all(s.project is p for s in simgr.found)
+        assert not simgr.errored
+        assert not os.listdir(os.path.join(spool_dir, 'claimed'))
+        # the states of all consumed results are removed from the spool
+        assert not [ name for name in os.listdir(os.path.join(spool_dir, 'objects'))
+                     if name.startswith('SimState-') ]
+        # no state refers to the remaining objects anymore
+        assert distributed.collect_garbage(grace=0) > 0
+        assert not os.listdir(os.path.join(spool_dir, 'objects'))
+    finally:
+        shutil.rmtree(spool_dir)
+
+
+def test_distributed_lease():
+    spool_dir = tempfile.mkdtemp()
+    try:
+        spool = angr.exploration_techniques.distributed.Spool(spool_dir)
+        spool.push_job('job0', {'state': 'x'})
+        name, _ = spool.claim_job()
+        nose.tools.assert_equal(name, 'job0')
+        nose.tools.assert_equal(spool.requeue_expired(60), [ ])
+
+        # the worker of the job died a while ago
+        claimed_path = os.path.join(spool_dir, 'claimed', 'job0')
+        os.utime(claimed_path, (os.path.getatime(claimed_path) - 120, os.path.getmtime(claimed_path) - 120))
+        nose.tools.assert_equal(spool.requeue_expired(60), [ 'job0' ])
+        nose.tools.assert_equal(spool.claim_job()[0], 'job0')
+
+        # the first worker finishes late, which must not break the second one
+        spool.push_result('job0', {'stashes': { }, 'errored': [ ]})
+        spool.push_result('job0', {'stashes': { }, 'errored': [ ]})
+        nose.tools.assert_equal([ name for name, _ in spool.pop_results() ], [ 'job0' ])
+    finally:
+        shutil.rmtree(spool_dir)
+
+
+def test_distributed_sweep():
+    p = angr.Project(os.path.join(test_location, 'x86_64', 'fauxware'), auto_load_libs=False)
+
+    spool_dir = tempfile.mkdtemp()
+    try:
+        objects_dir = os.path.join(spool_dir, 'objects')
+        os.makedirs(objects_dir)
+        vault = angr.exploration_techniques.distributed.SpoolVault(objects_dir, p)
+        s = p.factory.entry_state()
+        s.regs.rax = s.solver.BVS('x', 64) + 1
+        s2 = s.copy()
+        s2.regs.rbx = s.solver.BVS('y', 64) + 2
+        sid, sid2 = vault.store(s), vault.store(s2)
+        assert vault.references(sid)
+        assert vault.references(sid2) - vault.references(sid)
+
+        # recently stored objects are kept
+        nose.tools.assert_equal(vault.sweep([ sid ], 60), 0)
+
+        # objects that only the second state refers to are removed
+        removed = vault.sweep([ sid ], 0)
+        assert removed > 0
+        assert not os.path.exists(os.path.join(objects_dir, sid2))
+        ls = angr.exploration_techniques.distributed.SpoolVault(objects_dir, p).load(sid)
+        nose.tools.assert_equal(ls.addr, s.addr)
+        nose.tools.assert_equal(ls.regs.rax.variables, s.regs.rax.variables)
+
+        # objects that were removed are stored again
+        vault.store(s2)
+        assert os.path.exists(os.path.join(objects_dir, sid2))
+    finally:
+        shutil.rmtree(spool_dir)
+
+
+def test_distributed_filter():
+    p = angr.Project(os.path.join(test_location, 'x86_64', 'fauxware'), auto_load_libs=False)
+
+    spool_dir = tempfile.mkdtemp()
+    try:
+        simgr = p.factory.simulation_manager()
+        distributed = angr.exploration_techniques.Distributed(spool_dir, steps=4)
+        simgr.use_technique(distributed)
+        nose.tools.assert_raises(angr.AngrExplorationTechniqueError, simgr.step,
+                                 filter_func=lambda s: 'active')
+        distributed.shutdown()
+    finally:
+        shutil.rmtree(spool_dir)
+
+
+if __name__ == '__main__':
+    test_distributed()
+    test_distributed_lease()
+    test_distributed_sweep()
+    test_distributed_filter()
@@ -1,10 +1,11 @@
+import gc
 import time
 import os
 
 import claripy
 import nose
 
-from angr.storage.paged_memory import SimPagedMemory
+from angr.storage.paged_memory import SimPagedMemory, ArrayPage
 from angr import SimState, SIM_PROCEDURES
 from angr import options as o
 from angr.state_plugins import SimSystemPosix
@@ -646,7 +647,116 @@ def test_crosspage_read():
     assert bytes.fromhex("77665544") in state.solver.eval(r, cast_to=bytes)
     #assert s.solver.eval(r, 2) == ( 0xffeeddccbbaa998877665544, )
 
+def test_cow_pages():
+    s = SimState(arch='AMD64')
+    s.memory.store(0x1000, b'ABCD')
+    s.memory.store(0x2000, b'EFGH')
+
+    # branching shares the whole page table
+    s1 = s.copy()
+    assert s1.memory.mem._page_table is s.memory.mem._page_table
+    stats = s1.memory.page_stats()
+    assert stats['pages'] == stats['shared_pages']
+    assert stats['private_pages'] == 0
+
+    # writing to a page only copies that page
+    s1.memory.store(0x1000, b'abcd')
+    assert s1.memory.mem._page_table is not s.memory.mem._page_table
+    assert s1.memory.mem._pages[1] is not s.memory.mem._pages[1]
+    assert s1.memory.mem._pages[2] is s.memory.mem._pages[2]
+    assert s1.solver.eval(s1.memory.load(0x1000, 4), cast_to=bytes) == b'abcd'
+    assert s.solver.eval(s.memory.load(0x1000, 4), cast_to=bytes) == b'ABCD'
+    stats = s1.memory.page_stats()
+    assert stats['private_pages'] == 1
+    assert stats['shared_pages'] == stats['pages'] - 1
+
+    # once the parent state is gone, its private pages are not copied anymore
+    s2 = s1.copy()
+    del s1
+    gc.collect()
+    page = s2.memory.mem._pages[1]
+    s2.memory.store(0x1000, b'0123')
+    assert s2.memory.mem._pages[1] is page
+    assert s2.solver.eval(s2.memory.load(0x1000, 4), cast_to=bytes) == b'0123'
+
+    # pages that are still shared with other states are copied
+    page = s2.memory.mem._pages[2]
+    s2.memory.store(0x2000, b'efgh')
+    assert s2.memory.mem._pages[2] is not page
+    assert s.memory.mem._pages[2] is page
+    assert s.solver.eval(s.memory.load(0x2000, 4), cast_to=bytes) == b'EFGH'
+
+def test_cow_pages_pickle():
+    import pickle
+
+    s = SimState(arch='AMD64')
+    s.memory.store(0x1000, b'ABCD')
+    s1 = s.copy()
+
+    # branched states that are pickled together still share their page table, and know that they share it
+    s, s1 = pickle.loads(pickle.dumps([ s, s1 ], -1))
+    assert s1.memory.mem._page_table is s.memory.mem._page_table
+    assert s.memory.mem._page_table.refcount == 2
+
+    s1.memory.store(0x1000, b'abcd')
+    s1.memory.store(0x5000, b'EFGH')
+    assert s.solver.eval(s.memory.load(0x1000, 4), cast_to=bytes) == b'ABCD'
+    assert s1.solver.eval(s1.memory.load(0x1000, 4), cast_to=bytes) == b'abcd'
+    assert 5 not in s.memory.mem._pages
+    assert s1.memory.mem._initialized is not s.memory.mem._initialized
+
+def test_array_pages():
+    s = SimState(arch='AMD64', add_options={o.ARRAY_PAGES})
+    x = s.solver.BVS('x', 16)
+    s.memory.store(0x1000, b'ABCDEFGH')
+    s.memory.store(0x1002, x)
+    page = s.memory.mem._pages[1]
+    assert type(page) is ArrayPage
+    assert page._data[:2] == b'AB'
+    assert set(page._symbolic) == { 2, 3 }
+
+    # concrete spans are loaded as one memory object each
+    objs = s.memory.mem.load_objects(0x1000, 8)
+    assert [ a for a, _ in objs ] == [ 0x1000, 0x1002, 0x1004 ]
+    assert objs[1][1].object is x
+    r = s.memory.load(0x1000, 8)
+    assert s.solver.eval_upto(r, 2, cast_to=bytes, extra_constraints=(x == 0x3132,)) == [ b'AB12EFGH' ]
+    assert s.memory.mem.load_concrete_bytes(0x1000, 8) is None
+
+    # concrete writes over symbolic bytes make them concrete again
+    s.memory.store(0x1001, b'bcd')
+    assert not page._symbolic
+    assert s.solver.eval(s.memory.load(0x1000, 8), cast_to=bytes) == b'AbcdEFGH'
+
+    # cross-page writes
+    s.memory.store(0x1ffe, b'WXYZ')
+    assert s.solver.eval(s.memory.load(0x1ffe, 4), cast_to=bytes) == b'WXYZ'
+    assert s.memory.mem.load_concrete_bytes(0x1ffe, 4) == b'WXYZ'
+    assert s.memory.mem.load_concrete_bytes(0x1000, 8) == b'AbcdEFGH'
+
+    # changed bytes are found by comparing concrete data
+    s1 = s.copy()
+    s1.memory.store(0x1004, b'EFgh')
+    s1.memory.store(0x1010, s1.solver.BVS('y', 8))
+    nose.tools.assert_equal(s.memory.changed_bytes(s1.memory), { 0x1006, 0x1007, 0x1010 })
+    assert s.solver.eval(s.memory.load(0x1004, 4), cast_to=bytes) == b'EFGH'
+
+def test_changed_bytes():
+    s = SimState(arch='AMD64')
+    s.memory.store(0x1000, b'ABCDEFGH')
+    s.memory.store(0x3000, b'ABCDEFGH')
+
+    s1 = s.copy()
+    assert s.memory.changed_bytes(s1.memory) == set()
+    s1.memory.store(0x1002, b'cd')
+    s1.memory.store(0x2000, b'X')
+    s1.memory.store(0x3000, b'ABCDEFGH')
+    nose.tools.assert_equal(s.memory.changed_bytes(s1.memory), { 0x1002, 0x1003, 0x2000 })
+
 if __name__ == '__main__':
+    test_changed_bytes()
+    test_array_pages()
+    test_cow_pages()
     test_crosspage_read()
     test_fast_memory()
     test_load_bytes()
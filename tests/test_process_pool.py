@@ -0,0 +1,64 @@
+import os
+
+import nose
+import angr
+
+test_location = str(os.path.join(os.path.dirname(os.path.realpath(__file__)), '../../binaries/tests'))
+
+
+def _run(depth=None):
+    p = angr.Project(os.path.join(test_location, 'x86_64', 'fauxware'), auto_load_libs=False)
+    simgr = p.factory.simulation_manager(save_unsat=True)
+    pool = None
+    if depth is not None:
+        pool = angr.exploration_techniques.ProcessPool(workers=2, depth=depth)
+        simgr.use_technique(pool)
+    simgr.run()
+    if pool is not None:
+        pool.shutdown()
+    return simgr, pool
+
+
+def _stash_summary(simgr):
+    return { name: sorted((s.addr, tuple(s.history.bbl_addrs)) for s in states)
+             for name, states in simgr.stashes.items() if states }
+
+
+def test_process_pool():
+    simgr, _ = _run()
+    expected = _stash_summary(simgr)
+    assert expected['deadended']
+
+    for depth in (1, 3):
+        simgr, pool = _run(depth=depth)
+        nose.tools.assert_equal(_stash_summary(simgr), expected)
+        # all successors that were computed by the workers were used
+        assert not pool._prefetched
+
+        # the states still belong to the project of the simulation manager
+        for state in simgr.deadended:
+            assert state.project is simgr._project
+            assert state.posix.dumps(0)
+
+
+def test_process_pool_selector():
+    p = angr.Project(os.path.join(test_location, 'x86_64', 'fauxware'), auto_load_libs=False)
+    simgr = p.factory.simulation_manager()
+    pool = angr.exploration_techniques.ProcessPool(workers=2, depth=3)
+    simgr.use_technique(pool)
+
+    # states that the selector skips are not sent to the workers
+    simgr.step(selector_func=lambda s: False)
+    assert not pool._prefetched
+
+    simgr.step()
+    assert pool._prefetched
+    finalizer = pool._finalizer
+    pool.shutdown()
+    assert not finalizer.alive
+    assert not pool._prefetched
+
+
+if __name__ == '__main__':
+    test_process_pool()
+    test_process_pool_selector()
@@ -41,6 +41,154 @@ def disabled_reaching_definition_analysis():
         yield run_reaching_definition_analysis, project, cfg.kb.functions[func_name], truth
 
 
+def test_bitset_region():
+
+    from angr.keyed_region import KeyedRegion
+    from angr.analyses.reaching_definitions.bitset_region import BitsetRegion, DefinitionIndex
+
+    def check_equal(bitset_region, keyed_region):
+        for offset in range(0, 16):
+            assert bitset_region.get_objects_by_offset(offset) == keyed_region.get_objects_by_offset(offset)
+
+    index = DefinitionIndex()
+    br, kr = BitsetRegion(index), KeyedRegion()
+    for region in (br, kr):
+        region.set_object(0, 'a', 8)
+        region.set_object(4, 'b', 4)
+    check_equal(br, kr)
+
+    # copies do not see each other's writes
+    br_copy, kr_copy = br.copy(), kr.copy()
+    br_copy.set_object(0, 'c', 2)
+    kr_copy.set_object(0, 'c', 2)
+    check_equal(br, kr)
+    check_equal(br_copy, kr_copy)
+
+    br.merge(br_copy)
+    kr.merge(kr_copy)
+    check_equal(br, kr)
+    assert br.get_objects_by_offset(0) == {'a', 'c'}
+    assert len(index) == 3
+
+
+def test_bitset_region_size():
+
+    import sys
+    from angr.analyses.reaching_definitions.bitset_region import BitsetRegion, DefinitionIndex
+
+    # definitions late in a large function have high indices, so each of their bitsets takes about 12 KiB
+    index = DefinitionIndex()
+    for i in range(100000):
+        index.index(('early', i))
+    regs = 16
+
+    br = BitsetRegion(index)
+    for r in range(regs):
+        br.set_object(r * 8, ('set', r), 8)
+    other = br.copy()
+    for r in range(regs):
+        br.add_object(r * 8, ('added', r), 8)
+        other.set_object(r * 8, ('other', r), 8)
+    br.merge(other)
+
+    assert br.get_objects_by_offset(8) == { ('set', 1), ('added', 1), ('other', 1) }
+    # the bytes of each register share their bitset
+    masks = { id(m): m for m in br._masks.values() }
+    assert len(masks) == regs
+    # ints store 30 bits in each 4-byte digit
+    assert sum(sys.getsizeof(m) for m in masks.values()) < regs * (len(index) // 7)
+
+
+def test_interprocedural_reaching_definitions():
+
+    import pickle
+
+    binary_path = os.path.join(test_location, 'x86_64', 'all')
+    project = angr.Project(binary_path, load_options={'auto_load_libs': False})
+    cfg = project.analyses.CFGFast()
+    main_func = cfg.kb.functions['main']
+
+    ipa = project.analyses.InterproceduralReachingDefinitions(functions=[ main_func ] + [
+        cfg.kb.functions.function(addr=addr) for addr in cfg.kb.functions.callgraph.successors(main_func.addr)])
+
+    summary = ipa.summaries[main_func.addr]
+    assert cfg.kb.function_summaries[main_func.addr] is summary
+    assert summary.return_register is not None
+    assert pickle.loads(pickle.dumps(summary)) == summary
+
+    # summaries in the knowledge base are not computed again
+    ipa_again = project.analyses.InterproceduralReachingDefinitions(functions=[ main_func ])
+    assert ipa_again.summaries[main_func.addr] is summary
+
+
+def _call_shellcode():
+    # 0x0:  mov edi, 5; call 0x10; mov rbx, rax; ret
+    # 0x10: mov rax, rdi; ret
+    project = angr.load_shellcode(b'\xbf\x05\x00\x00\x00\xe8\x06\x00\x00\x00\x48\x89\xc3\xc3\xcc\xcc'
+                                  b'\x48\x89\xf8\xc3', arch='amd64')
+    cfg = project.analyses.CFGFast(normalize=True)
+    return project, cfg
+
+
+def test_interprocedural_reaching_definitions_summaries():
+
+    from angr.analyses.reaching_definitions.atoms import Register, Parameter
+
+    project, cfg = _call_shellcode()
+    rax, rbx, rdi = (Register(*project.arch.registers[name]) for name in ('rax', 'rbx', 'rdi'))
+
+    ipa = project.analyses.InterproceduralReachingDefinitions(functions=[ 0, 0x10 ])
+    assert not ipa.failures
+
+    # the callee reads rdi, and returns it in rax
+    callee = ipa.summaries[0x10]
+    assert callee.used_registers == { rdi }
+    assert set(callee.defined_registers) == { rax }
+    assert callee.return_values.data == { Parameter(rdi) }
+
+    # the caller sees the definition of rax by the callee, with the argument that it passes
+    caller = ipa.summaries[0]
+    assert not caller.used_registers
+    assert caller.return_register == rax
+    assert caller.return_values.data == { 5 }
+    assert caller.defined_registers[rbx].data == { 5 }
+
+
+def test_interprocedural_reaching_definitions_failures():
+
+    from angr.analyses.reaching_definitions import interprocedural
+
+    summarize_function = interprocedural._summarize_function
+
+    def _raise(project, kb, func, *args):
+        if func.addr == 0x10:
+            raise ValueError("test")
+        return summarize_function(project, kb, func, *args)
+
+    def _exit(project, kb, func, *args):
+        if func.addr == 0x10:
+            os._exit(1)
+        return summarize_function(project, kb, func, *args)
+
+    # an exception in the current process, and a worker process that dies
+    for patched, workers, error in ((_raise, 1, 'ValueError'), (_exit, 2, 'died')):
+        project, cfg = _call_shellcode()
+        # worker processes are forked, so they are patched as well
+        interprocedural._summarize_function = patched
+        try:
+            ipa = project.analyses.InterproceduralReachingDefinitions(functions=[ 0, 0x10 ], workers=workers)
+        finally:
+            interprocedural._summarize_function = summarize_function
+
+        # the failure is recorded, and the caller is still summarized without the summary of the callee
+        assert set(ipa.failures) == { 0x10 }
+        assert error in ipa.failures[0x10]
+        assert 0x10 not in ipa.summaries
+        assert 0x10 not in cfg.kb.function_summaries
+        return_values = ipa.summaries[0].return_values
+        assert return_values is None or 5 not in return_values.data
+
+
 def main():
     g = globals()
     for func_name, func in g.items():
@@ -0,0 +1,108 @@
+import nose
+
+import angr
+from angr import options as o
+from angr.state_plugins.solver import _default_query_cache
+
+
+def test_query_cache():
+    _default_query_cache.clear()
+
+    s = angr.SimState(arch='AMD64', add_options={o.SOLVER_QUERY_CACHE})
+    x = s.solver.BVS('x', 32)
+    y = s.solver.BVS('y', 32)
+    s.add_constraints(s.solver.UGT(x, 10), s.solver.ULT(y, 20))
+
+    assert s.solver.satisfiable()
+    nose.tools.assert_equal(s.solver.max(y), 19)
+    nose.tools.assert_equal((_default_query_cache.hits, _default_query_cache.misses), (0, 2))
+
+    # a sibling state with the same constraints in a different order hits the cache
+    s1 = angr.SimState(arch='AMD64', add_options={o.SOLVER_QUERY_CACHE})
+    s1.add_constraints(s1.solver.ULT(y, 20), s1.solver.UGT(x, 10))
+    assert s1.solver.satisfiable()
+    nose.tools.assert_equal(s1.solver.max(y), 19)
+    nose.tools.assert_equal(_default_query_cache.hits, 2)
+
+    # different extra constraints or additional constraints are different queries
+    nose.tools.assert_equal(s1.solver.max(y, extra_constraints=(s1.solver.ULT(y, 5),)), 4)
+    s1.add_constraints(s1.solver.ULT(y, 15))
+    nose.tools.assert_equal(s1.solver.max(y), 14)
+    assert not s1.solver.satisfiable(extra_constraints=(s1.solver.ULT(x, 5),))
+    nose.tools.assert_equal(_default_query_cache.hits, 2)
+    nose.tools.assert_equal(_default_query_cache.misses, 5)
+
+    # the cache is only used with SOLVER_QUERY_CACHE
+    s2 = angr.SimState(arch='AMD64')
+    s2.add_constraints(s2.solver.UGT(x, 10), s2.solver.ULT(y, 20))
+    assert s2.solver.satisfiable()
+    nose.tools.assert_equal(_default_query_cache.hits + _default_query_cache.misses, 7)
+
+
+def test_query_cache_replacements():
+    _default_query_cache.clear()
+
+    options = {o.SOLVER_QUERY_CACHE, o.REPLACEMENT_SOLVER}
+    s0 = angr.SimState(arch='AMD64', add_options=options)
+    s1 = angr.SimState(arch='AMD64', add_options=options)
+    x = s0.solver.BVS('x', 32)
+
+    # states with the same constraints but different replacements do not share results
+    for s, v in ((s0, 5), (s1, 7)):
+        s.add_constraints(s.solver.ULT(x, 10))
+        s.solver._solver.add_replacement(x, s.solver.BVV(v, 32), invalidate_cache=False)
+    nose.tools.assert_equal(s0.solver.max(x), 5)
+    nose.tools.assert_equal(s1.solver.max(x), 7)
+    nose.tools.assert_equal(_default_query_cache.hits, 0)
+
+
+def test_query_cache_eviction():
+    cache = angr.state_plugins.solver.SolverQueryCache(maxsize=2)
+    for i in range(3):
+        cache.store(i, i)
+    nose.tools.assert_equal(len(cache), 2)
+    assert cache.lookup(0) == (False, None)
+    assert cache.lookup(2) == (True, 2)
+    nose.tools.assert_equal(cache.hit_rate, 0.5)
+
+
+def test_constraint_slicing():
+    s = angr.SimState(arch='AMD64', add_options={o.CONSTRAINT_SLICING})
+    x = s.solver.BVS('x', 32)
+    y = s.solver.BVS('y', 32)
+    z = s.solver.BVS('z', 32)
+    s.add_constraints(s.solver.ULT(x, 10), s.solver.ULT(y, 20))
+
+    partitions = s.solver._get_partitions()
+    nose.tools.assert_equal(len(partitions), 2)
+    nose.tools.assert_equal(len(s.solver._query_solver(x).constraints), 1)
+
+    # constraints over several variables merge their groups
+    s.add_constraints(s.solver.UGT(z, x), s.solver.ULT(z, 5))
+    nose.tools.assert_equal(len(partitions), 2)
+    nose.tools.assert_equal(len(s.solver._query_solver(z).constraints), 3)
+
+    nose.tools.assert_equal(s.solver.max(x), 3)
+    nose.tools.assert_equal(s.solver.max(y), 19)
+    nose.tools.assert_equal(sorted(s.solver.eval_upto(z, 10)), [ 1, 2, 3, 4 ])
+    assert s.solver.satisfiable()
+    assert s.solver.satisfiable(extra_constraints=(y == 3,))
+    assert not s.solver.satisfiable(extra_constraints=(s.solver.ULT(z, 1),))
+
+    # partitions are copied with the state
+    s1 = s.copy()
+    s1.add_constraints(y == 7)
+    nose.tools.assert_equal(s1.solver.eval_upto(y, 2), [ 7 ])
+    nose.tools.assert_equal(s.solver.max(y), 19)
+
+    # an unsatisfiable group makes the state unsatisfiable
+    s1.add_constraints(s1.solver.UGT(x, 20))
+    assert not s1.solver.satisfiable()
+    assert s.solver.satisfiable()
+
+
+if __name__ == '__main__':
+    test_constraint_slicing()
+    test_query_cache()
+    test_query_cache_replacements()
+    test_query_cache_eviction()
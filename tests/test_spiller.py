@@ -63,8 +63,85 @@ def test_palindrome2():
         for state in pg.cut
     )
 
+
+@nose.with_setup(setup, teardown)
+def test_budget():
+    project = angr.Project(_bin('tests/cgc/sc2_0b32aa01_01'))
+    pg = project.factory.simulation_manager()
+    pg.use_technique(angr.exploration_techniques.LengthLimiter(max_length=250))
+
+    # pretend that each active state takes 1000 bytes
+    usage = lambda simgr: len(simgr.active) * 1000
+    spiller = angr.exploration_techniques.BudgetSpiller(
+        5000, usage=usage, pickle_callback=pickle_callback, unpickle_callback=unpickle_callback,
+        priority_key=priority_key
+    )
+    pg.use_technique(spiller)
+
+    max_active = 0
+    while pg.active:
+        pg.step()
+        max_active = max(max_active, len(pg.active))
+        nose.tools.assert_less_equal(len(pg.active) * 1000, 5000)
+
+    assert max_active > 1
+    assert spiller.ever_spilled > 0
+    assert spiller.ever_restored == spiller.ever_spilled
+    assert spiller.spilled == 0
+    assert all(
+        ('pickled' not in state.globals and 'unpickled' not in state.globals) or
+        (state.globals['pickled'] and state.globals['unpickled'])
+        for state in pg.cut
+    )
+
+
+def test_budget_compressed():
+    import zlib
+
+    s = angr.SimState(arch='AMD64')
+    s.memory.store(0x10000, b'A' * 0x3000)
+    spiller = angr.exploration_techniques.BudgetSpiller(1)
+    spiller._spill([ s ])
+
+    # the record of the spilled state holds the compressed state, not a reference to a separate record of it
+    assert not any(k.startswith('SimState-') for k in spiller._vault.keys())
+    _, _, sid = spiller._spilled[0]
+    data = spiller._vault.load(sid)
+    raw = zlib.decompress(data)
+    assert len(raw) > 1000
+    assert len(data) < len(raw)
+
+    ls, = spiller._restore(1)
+    nose.tools.assert_equal(ls.solver.eval(ls.memory.load(0x10000, 4), cast_to=bytes), b'AAAA')
+
+
+@nose.with_setup(setup, teardown)
+def test_budget_estimate():
+    project = angr.Project(_bin('tests/cgc/sc2_0b32aa01_01'))
+    pg = project.factory.simulation_manager()
+    pg.use_technique(angr.exploration_techniques.LengthLimiter(max_length=250))
+    pg.run(until=lambda lpg: len(lpg.active) > 1)
+    assert len(pg.active) > 1
+
+    # small stashes are measured completely
+    spiller = angr.exploration_techniques.BudgetSpiller(1, usage='estimate')
+    assert spiller._measure(pg) == pg.footprint(stash='active', top=0).total
+
+    # otherwise the footprint of a sample of the states is scaled up to the whole stash
+    spiller = angr.exploration_techniques.BudgetSpiller(1, usage='estimate', estimate_sample=1)
+    n = len(pg.active)
+    assert spiller._measure(pg) in set(s.footprint(top=0).total * n for s in pg.active)
+
+    pg.use_technique(spiller)
+    pg.step()
+    assert len(pg.active) == 1
+    assert spiller.spilled > 0
+
 if __name__ == '__main__':
     setup()
     test_basic()
     test_palindrome2()
+    test_budget()
+    test_budget_compressed()
+    test_budget_estimate()
     teardown()
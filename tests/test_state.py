@@ -248,6 +248,70 @@ def test_global_condition():
         nose.tools.assert_equal(s.solver.eval_upto(s.regs.rbx, 10), [ 1 ])
         nose.tools.assert_sequence_equal(s.solver.eval_upto(s.regs.rax, 10), [ 25 ])
 
+def test_chunked_history():
+    s = SimState(arch="AMD64", add_options={angr.options.CHUNKED_HISTORY})
+    guard = s.solver.BVS('guard', 64) == 0
+
+    # a long path that forks in the middle of a chunk
+    hist = s.history
+    for i in range(3000):
+        hist = hist.make_child()
+        hist.recent_bbl_addrs.extend((i, i + 0x10000))
+        hist.jumpkind = 'Ijk_Boring' if i % 2 else 'Ijk_Call'
+        if i == 1500:
+            fork = hist
+            fork.jump_guard = guard
+    forked = fork.make_child()
+    forked.recent_bbl_addrs.append(0x1337)
+
+    expected = [ a for i in range(3000) for a in (i, i + 0x10000) ]
+    nose.tools.assert_equal(len(hist.bbl_addrs), 6000)
+    nose.tools.assert_equal(list(hist.bbl_addrs), expected)
+    nose.tools.assert_equal(hist.bbl_addrs[-1], 2999 + 0x10000)
+    nose.tools.assert_equal(hist.bbl_addrs[1234], expected[1234])
+    nose.tools.assert_equal(list(forked.bbl_addrs), expected[:3002] + [ 0x1337 ])
+    nose.tools.assert_equal(hist.jumpkinds[-2:], [ 'Ijk_Call', 'Ijk_Boring' ])
+    nose.tools.assert_equal(len(hist.jump_guards), 1)
+    nose.tools.assert_is(forked.jump_guards[0], guard)
+
+    # the logs of the histories before the fork are shared
+    nose.tools.assert_is(hist._ancestor_logs[0]._chunks[0], forked._ancestor_logs[0]._chunks[0])
+
+    # the same values are returned without the logs
+    hist._ancestor_logs = None
+    s.options.discard(angr.options.CHUNKED_HISTORY)
+    nose.tools.assert_equal(hist.bbl_addrs.hardcopy, expected)
+
+    # events are trimmed from the whole lineage, but constraints are kept
+    hist.recent_events.append(angr.state_plugins.sim_event.SimEvent(s, 'test'))
+    fork.add_action(angr.state_plugins.SimActionConstraint(s, guard))
+    hist.trim_events()
+    nose.tools.assert_equal(len(list(hist.events)), 1)
+
+def test_footprint():
+    s = SimState(arch="AMD64")
+    s.memory.store(0x10000, b'A' * 0x4000)
+    x = s.solver.BVS('x', 64)
+    s.memory.store(0x20000, x)
+    s.add_constraints(x != 0x1337)
+
+    fp = s.footprint(top=3)
+    nose.tools.assert_equal(fp.total, sum(fp.plugins.values()))
+    nose.tools.assert_greater(fp.plugins['memory'], 0x4000)
+    nose.tools.assert_equal(len(fp.top_pages), 3)
+    nose.tools.assert_equal(fp.top_pages, sorted(fp.top_pages, key=lambda t: t[0], reverse=True))
+    nose.tools.assert_true(fp.top_asts)
+    nose.tools.assert_in('memory', fp.report())
+
+    # pages that are shared with the first state are not counted again
+    s2 = s.copy()
+    s2.memory.store(0x10000, b'B')
+    fp = angr.misc.footprint.Footprint()
+    first = fp.add_state(s, group='active')
+    second = fp.add_state(s2, group='active')
+    nose.tools.assert_less(second['memory'] * 2, first['memory'])
+    nose.tools.assert_equal(fp.groups['active'], fp.total)
+
 
 if __name__ == '__main__':
     test_state()
@@ -258,3 +322,5 @@ if __name__ == '__main__':
     test_state_merge_static()
     test_state_pickle()
     test_global_condition()
+    test_chunked_history()
+    test_footprint()
@@ -2,22 +2,29 @@ from __future__ import print_function
 import os
 import sys
 import logging
+import tempfile
+import pickle
+import array
 
 import nose
 import angr
 
 from common import bin_location, do_trace, slow_test
 
-def tracer_cgc(filename, test_name, stdin, copy_states=False):
+def tracer_cgc(filename, test_name, stdin, copy_states=False, trace_path=None, fast_forward=False):
     p = angr.Project(filename)
     p.simos.syscall_library.update(angr.SIM_LIBRARIES['cgcabi_tracer'])
 
     trace, magic, crash_mode, crash_addr = do_trace(p, test_name, stdin)
+    if trace_path is not None:
+        angr.exploration_techniques.TraceFile.write(trace_path, trace)
+        trace = trace_path
     s = p.factory.entry_state(mode='tracing', stdin=angr.SimFileStream, flag_page=magic)
     s.preconstrainer.preconstrain_file(stdin, s.posix.stdin, True)
 
     simgr = p.factory.simulation_manager(s, hierarchy=False, save_unconstrained=crash_mode)
-    t = angr.exploration_techniques.Tracer(trace, crash_addr=crash_addr, keep_predecessors=1, copy_states=copy_states)
+    t = angr.exploration_techniques.Tracer(trace, crash_addr=crash_addr, keep_predecessors=1, copy_states=copy_states,
+                                           fast_forward=fast_forward)
     simgr.use_technique(t)
     simgr.use_technique(angr.exploration_techniques.Oppologist())
 
@@ -47,6 +54,58 @@ def test_recursion():
     nose.tools.assert_true(simgr.crashed)
     nose.tools.assert_true(simgr.crashed[0].solver.symbolic(simgr.crashed[0].regs.ip))
 
+    # follow the same trace from a trace file
+    with tempfile.TemporaryDirectory() as d:
+        simgr, tracer = tracer_cgc(fname, 'tracer_recursion', blob, trace_path=os.path.join(d, 'trace'))
+        nose.tools.assert_is_instance(tracer._trace, angr.exploration_techniques.TraceFile)
+        simgr.run()
+        tracer._trace.close()
+
+    nose.tools.assert_true(simgr.crashed)
+    nose.tools.assert_true(simgr.crashed[0].solver.symbolic(simgr.crashed[0].regs.ip))
+
+
+def test_trace_file():
+    # jumps between the binary, the vsyscall page, and the libraries, in both directions
+    addrs = [ ]
+    for i in range(10000):
+        addrs.append(0x8048000 + (i * 0x34) % 0x2000)
+        if i % 7 == 0:
+            addrs.append(0xffffffffff600000)
+        if i % 13 == 0:
+            addrs.append(0x7ffff7dd0000 + i)
+
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, 'trace')
+        nose.tools.assert_equal(angr.exploration_techniques.TraceFile.write(path, iter(addrs), chunk_size=1000),
+                                len(addrs))
+        traces = [ angr.exploration_techniques.TraceFile(path),
+                   angr.exploration_techniques.ArrayTrace(array.array('Q', addrs), chunk_size=1000) ]
+
+        for trace in traces:
+            nose.tools.assert_equal(len(trace), len(addrs))
+            nose.tools.assert_equal(list(trace), addrs)
+            nose.tools.assert_equal(trace[-1], addrs[-1])
+            nose.tools.assert_equal(trace[-len(addrs)], addrs[0])
+            nose.tools.assert_equal(trace[990:1010], addrs[990:1010])
+            nose.tools.assert_raises(IndexError, trace.__getitem__, len(addrs))
+            for start in (0, 999, 1000, 5555):
+                for value in (0xffffffffff600000, addrs[start + 1500]):
+                    nose.tools.assert_equal(trace.index(value, start), addrs.index(value, start))
+            nose.tools.assert_raises(ValueError, trace.index, 0x1337)
+            nose.tools.assert_raises(ValueError, trace.index, addrs[1500], 0, 1000)
+
+        # deltas between addresses in the same object take two bytes instead of eight
+        local_path = os.path.join(d, 'local_trace')
+        angr.exploration_techniques.TraceFile.write(local_path, (a for a in addrs if a < 0x10000000))
+        nose.tools.assert_less(os.path.getsize(local_path), len(addrs) * 2 + 100)
+
+        # trace files are reopened when they are unpickled
+        trace = pickle.loads(pickle.dumps(traces[0]))
+        nose.tools.assert_equal(trace[4321], addrs[4321])
+        trace.close()
+        traces[0].close()
+
 
 @slow_test
 def broken_cache_stall():
@@ -122,6 +181,24 @@ def test_cgc_se1_palindrome_raw():
     nose.tools.assert_true(simgr.crashed)
 
 
+def test_fast_forward():
+    b = os.path.join(bin_location, "tests/cgc/sc1_0b32aa01_01")
+
+    simgr, _ = tracer_cgc(b, 'tracer_cgc_se1_palindrome_raw_nocrash', b'racecar\n')
+    simgr.run()
+    expected = simgr.traced[0]
+
+    simgr, _ = tracer_cgc(b, 'tracer_cgc_se1_palindrome_raw_nocrash', b'racecar\n', fast_forward=True)
+    simgr.run()
+    state = simgr.traced[0]
+
+    # the trace was followed to the same point, with fewer steps
+    nose.tools.assert_equal(state.addr, expected.addr)
+    nose.tools.assert_less(state.history.depth, expected.history.depth)
+    nose.tools.assert_equal(state.posix.dumps(1), expected.posix.dumps(1))
+    nose.tools.assert_true(state.unicorn.stats.runs > 0)
+
+
 def test_symbolic_sized_receives():
     b = os.path.join(bin_location, "tests/cgc/CROMU_00070")
 
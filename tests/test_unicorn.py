@@ -1,6 +1,7 @@
 import nose
 import angr
 import pickle
+import gc
 import re
 from angr import options as so
 from nose.plugins.attrib import attr
@@ -114,6 +115,120 @@ def test_fauxware():
         b'Username: \nPassword: \nWelcome to the admin console, trusted user!\n'
     )))
 
+def test_fauxware_array_pages():
+    # concrete pages are mapped into unicorn straight from the arrays of the pages
+    p = angr.Project(os.path.join(test_location, 'binaries/tests/x86_64/fauxware'))
+    s_unicorn = p.factory.entry_state(add_options=so.unicorn | { so.ARRAY_PAGES })
+    pg = p.factory.simulation_manager(s_unicorn)
+    pg.explore()
+
+    assert all("Unicorn" in ''.join(p.history.descriptions.hardcopy) for p in pg.deadended)
+    nose.tools.assert_equal(sorted(pg.mp_deadended.posix.dumps(1).mp_items), sorted((
+        b'Username: \nPassword: \nWelcome to the admin console, trusted user!\n',
+        b'Username: \nPassword: \nGo away!',
+        b'Username: \nPassword: \nWelcome to the admin console, trusted user!\n'
+    )))
+
+def test_shared_page_cache():
+    p = angr.Project(os.path.join(test_location, 'binaries/tests/x86_64/fauxware'))
+    s1 = p.factory.entry_state(add_options=so.unicorn)
+    s2 = p.factory.entry_state(add_options=so.unicorn)
+    # all states of a project share the read-only pages of the binary
+    nose.tools.assert_equal(s1.unicorn.cache_key, s2.unicorn.cache_key)
+
+    # a state that modifies a shared page gets its own copy of it
+    main = p.loader.find_symbol('main').rebased_addr
+    s2.memory.store(main, s2.memory.load(main, 1))
+    assert main & ~0xfff in s2.unicorn._uncached_pages
+    assert not s1.unicorn._uncached_pages
+    assert main & ~0xfff in s2.copy().unicorn._uncached_pages
+
+    for s in (s1, s2):
+        pg = p.factory.simulation_manager(s)
+        pg.explore()
+        nose.tools.assert_equal(sorted(pg.mp_deadended.posix.dumps(1).mp_items), sorted((
+            b'Username: \nPassword: \nWelcome to the admin console, trusted user!\n',
+            b'Username: \nPassword: \nGo away!',
+            b'Username: \nPassword: \nWelcome to the admin console, trusted user!\n'
+        )))
+
+def test_shared_page_cache_patched_before_unicorn():
+    p = angr.Project(os.path.join(test_location, 'binaries/tests/x86_64/fauxware'))
+    stop = p.entry + 0x10
+    p.hook(stop, angr.SIM_PROCEDURES['stubs']['PathTerminator']())
+
+    # patch the code before the unicorn plugin exists: mov ebx, 0x1337; jmp stop
+    s = p.factory.entry_state(add_options=so.unicorn)
+    s.memory.store(p.entry, b'\xbb\x37\x13\x00\x00\xeb\x09')
+    pg = p.factory.simulation_manager(s)
+    pg.run()
+
+    # unicorn runs the patched bytes, not the shared page of the binary
+    nose.tools.assert_equal(len(pg.deadended), 1)
+    assert "Unicorn" in ''.join(pg.deadended[0].history.descriptions.hardcopy)
+    nose.tools.assert_equal(pg.deadended[0].solver.eval(pg.deadended[0].regs.rbx), 0x1337)
+    assert p.entry & ~0xfff in pg.deadended[0].unicorn._uncached_pages
+
+    # other states still use the shared page
+    s2 = p.factory.entry_state(add_options=so.unicorn)
+    s2.unicorn._uncache_modified_pages()
+    assert p.entry & ~0xfff not in s2.unicorn._uncached_pages
+
+def test_shared_page_cache_freed():
+    from angr.state_plugins import unicorn_engine
+
+    p = angr.Project(os.path.join(test_location, 'binaries/tests/x86_64/fauxware'))
+    pg = p.factory.simulation_manager(p.factory.entry_state(add_options=so.unicorn))
+    pg.run(n=5)
+    cache_key = pg.active[0].unicorn.cache_key
+    assert cache_key in unicorn_engine._shareable_pages
+
+    # the caches go away with the project
+    del p, pg
+    gc.collect()
+    assert cache_key not in unicorn_engine._shareable_pages
+    assert cache_key not in unicorn_engine._shared_buffers
+
+def test_adaptive_cooldown():
+    from angr.state_plugins.unicorn_engine import STOP
+    stats = angr.state_plugins.UnicornStats(min_payoff=4, hot_payoff=64, min_samples=2, max_backoff=4)
+
+    # not enough samples yet
+    stats.record(0x1000, 1, 0.1, STOP.STOP_SYMBOLIC_MEM)
+    nose.tools.assert_is_none(stats.decide(0x1000))
+
+    # poor payoff: skipped with an exponential backoff
+    stats.record(0x1000, 1, 0.1, STOP.STOP_SYMBOLIC_MEM)
+    nose.tools.assert_equal([ stats.decide(0x1000) for _ in range(3) ], [ False, False, None ])
+    stats.record(0x1000, 2, 0.1, STOP.STOP_SYMBOLIC_REG)
+    nose.tools.assert_equal([ stats.decide(0x1000) for _ in range(5) ], [ False ] * 4 + [ None ])
+    nose.tools.assert_equal(stats.skipped, 6)
+
+    # hot loops are always entered
+    stats.record(0x2000, 1000, 0.1, STOP.STOP_SYMBOLIC_MEM)
+    stats.record(0x2000, 1000, 0.1, STOP.STOP_SYMBOLIC_MEM)
+    assert stats.decide(0x2000) is True
+
+    # counters are per state, statistics by address are shared
+    copied = stats.copy()
+    copied.record(0x3000, 10, 0.1, STOP.STOP_NORMAL)
+    nose.tools.assert_equal(stats.runs, 5)
+    nose.tools.assert_equal(copied.runs, 6)
+    nose.tools.assert_equal(stats.addrs[0x3000].steps, 10)
+    nose.tools.assert_equal(copied.stop_reasons['STOP_SYMBOLIC_MEM'], 4)
+
+    # the scheduler does not change the results
+    p = angr.Project(os.path.join(test_location, 'binaries/tests/i386/fauxware'))
+    s_unicorn = p.factory.entry_state(add_options=so.unicorn | { so.UNICORN_ADAPTIVE_COOLDOWN })
+    pg = p.factory.simulation_manager(s_unicorn)
+    pg.explore()
+    nose.tools.assert_equal(sorted(pg.mp_deadended.posix.dumps(1).mp_items), sorted((
+        b'Username: \nPassword: \nWelcome to the admin console, trusted user!\n',
+        b'Username: \nPassword: \nGo away!',
+        b'Username: \nPassword: \nWelcome to the admin console, trusted user!\n'
+    )))
+    assert all(s.unicorn.stats.runs > 0 for s in pg.deadended)
+
 def test_fauxware_aggressive():
     p = angr.Project(os.path.join(test_location, 'binaries/tests/i386/fauxware'))
     s_unicorn = p.factory.entry_state(
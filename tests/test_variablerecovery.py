@@ -203,6 +203,45 @@ def test_variable_recovery_fauxware():
         yield run_variable_recovery_analysis, project, cfg.kb.functions[func_name], truth, False
 
 
+def test_variable_recovery_batch():
+
+    import shutil
+    import tempfile
+
+    binary_path = os.path.join(test_location, 'x86_64', 'fauxware')
+    cache_dir = tempfile.mkdtemp()
+
+    try:
+        project = angr.Project(binary_path, load_options={'auto_load_libs': False})
+        cfg = project.analyses.CFG(normalize=True)
+        main_func = cfg.kb.functions['main']
+
+        batch = project.analyses.VariableRecoveryBatch(workers=2, cache_dir=cache_dir)
+        nose.tools.assert_in(main_func.addr, batch.recovered)
+        nose.tools.assert_equal(len(batch.cached), 0)
+        variables = cfg.kb.variables[main_func.addr].get_variables()
+        nose.tools.assert_true(variables)
+
+        # a second run on an unchanged binary loads all variables from the cache
+        project = angr.Project(binary_path, load_options={'auto_load_libs': False})
+        cfg = project.analyses.CFG(normalize=True)
+        batch = project.analyses.VariableRecoveryBatch(workers=0, cache_dir=cache_dir)
+        nose.tools.assert_not_in(main_func.addr, batch.recovered)
+        nose.tools.assert_in(main_func.addr, batch.cached)
+        nose.tools.assert_equal(len(cfg.kb.variables[main_func.addr].get_variables()), len(variables))
+
+        # changing a callee invalidates its callers, but not unrelated functions
+        project = angr.Project(binary_path, load_options={'auto_load_libs': False})
+        project.loader.memory.store(0x4006f1, b"\xbf\x16\x09\x40\x00")
+        cfg = project.analyses.CFG(normalize=True)
+        batch = project.analyses.VariableRecoveryBatch(workers=0, cache_dir=cache_dir)
+        nose.tools.assert_in(cfg.kb.functions['accepted'].addr, batch.recovered)
+        nose.tools.assert_in(main_func.addr, batch.recovered)
+        nose.tools.assert_in(cfg.kb.functions['rejected'].addr, batch.cached)
+    finally:
+        shutil.rmtree(cache_dir)
+
+
 def main():
 
     g = globals()
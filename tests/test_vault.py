@@ -1,3 +1,5 @@
+import pickle
+
 import claripy
 import angr
 
@@ -91,11 +93,14 @@ def test_vault():
 	yield do_vault_identity, angr.vaults.VaultDir()
 	yield do_vault_identity, angr.vaults.VaultShelf()
 	yield do_vault_identity, angr.vaults.VaultDict()
+	yield do_vault_noidentity, angr.vaults.VaultPack()
+	yield do_vault_identity, angr.vaults.VaultPack()
 
 def test_ast_vault():
 	yield do_ast_vault, angr.vaults.VaultDir()
 	yield do_ast_vault, angr.vaults.VaultShelf()
 	yield do_ast_vault, angr.vaults.VaultDict()
+	yield do_ast_vault, angr.vaults.VaultPack()
 
 def test_project():
 	v = angr.vaults.VaultDir()
@@ -123,6 +128,142 @@ def test_project():
 	assert sum(1 for k in v.keys() if k.startswith('Project')) == 1
 
 
+def test_pack():
+	import os
+	import gc
+
+	s = angr.SimState(arch='AMD64')
+	s.memory.store(0x10000, b'A' * 0x3000)
+	s2 = s.copy()
+	s2.memory.store(0x10000, b'B')
+
+	v = angr.vaults.VaultPack(compression='zlib')
+	sid, sid2 = v.store_many([s, s2])
+	# the pages are stored once, no matter how many states hold them, and only the modified page is stored twice
+	pages = [ k for k in v.keys() if 'Page-' in k ]
+	assert len(pages) == len(s.memory.mem._pages) + len(s.registers.mem._pages) + 1
+	size = os.path.getsize(v._path)
+	v.store(s2.copy())
+	assert os.path.getsize(v._path) - size < size // 2
+
+	del s, s2
+	gc.collect()
+	ls, ls2 = v.load_many([sid, sid2])
+	assert ls.solver.eval(ls.memory.load(0x10000, 2), cast_to=bytes) == b'AA'
+	assert ls2.solver.eval(ls2.memory.load(0x10000, 2), cast_to=bytes) == b'BA'
+	# the unmodified pages are shared again by the loaded states
+	assert ls.memory.mem._pages[0x11] is ls2.memory.mem._pages[0x11]
+
+	# writing to a shared page does not modify the page of the other state
+	ls2.memory.store(0x11000, b'C')
+	assert ls.solver.eval(ls.memory.load(0x11000, 1), cast_to=bytes) == b'A'
+
+	# the pack can be reopened with and without its index
+	path = v._path
+	v.close()
+	for _ in range(2):
+		v = angr.vaults.VaultPack(path)
+		ls = v.load(sid)
+		assert ls.solver.eval(ls.memory.load(0x12000, 2), cast_to=bytes) == b'AA'
+		v.close()
+		os.remove(path + '.idx')
+
+
+def test_pack_frozen():
+	import gc
+
+	s = angr.SimState(arch='AMD64')
+	s.memory.store(0x10000, b'A' * 0x3000)
+	v = angr.vaults.VaultPack(compression='zlib')
+	v.store(s)
+
+	# stored pages are frozen instead of being counted as held by another page table
+	page = s.memory.mem._pages[0x11]
+	assert page._frozen
+	assert page._refcount == 1
+
+	# a frozen page is copied when it is written to
+	s.memory.store(0x11000, b'B')
+	assert s.memory.mem._pages[0x11] is not page
+	assert not s.memory.mem._pages[0x11]._frozen
+
+	# the IDs of frozen pages are not computed again
+	dumped = [ ]
+	class CountingPickler(angr.vaults.VaultPickler):
+		def dump(self, obj):
+			dumped.append(obj)
+			return super().dump(obj)
+	s2 = s.copy()
+	pickler, angr.vaults.VaultPickler = angr.vaults.VaultPickler, CountingPickler
+	try:
+		sid2 = v.store(s2)
+	finally:
+		angr.vaults.VaultPickler = pickler
+	assert [ o for o in dumped if isinstance(o, angr.storage.paged_memory.BasePage) ] == [ s2.memory.mem._pages[0x11] ]
+
+	# loaded pages are frozen, and only counted once for each page table
+	del s, s2
+	gc.collect()
+	ls = v.load(sid2)
+	assert ls.solver.eval(ls.memory.load(0x11000, 2), cast_to=bytes) == b'BA'
+	assert ls.memory.mem._pages[0x11]._frozen
+	assert ls.memory.mem._pages[0x11]._refcount == 1
+	v.close()
+
+
+def test_pack_reopen():
+	import os
+
+	s = angr.SimState(arch='AMD64')
+	s.memory.store(0x10000, b'A' * 0x3000)
+
+	v = angr.vaults.VaultPack(compression='zlib')
+	sid = v.store(s)
+	path = v._path
+	v.close()
+	size = os.path.getsize(path)
+
+	# a partially written record at the end of the pack is discarded
+	with open(path, 'ab') as f:
+		f.write(b'\x10\x00\x01')
+	for _ in range(2):
+		v = angr.vaults.VaultPack(path)
+		assert os.path.getsize(path) == size
+		# identical content is still stored once after the pack is reopened
+		v.store(s.copy(), id='copy')
+		assert os.path.getsize(path) - size < size // 2
+		ls, = v.load_many([sid])
+		assert ls.solver.eval(ls.memory.load(0x12000, 2), cast_to=bytes) == b'AA'
+		v.close()
+		os.remove(path + '.idx')
+		size = os.path.getsize(path)
+
+
+def test_batch():
+	x = claripy.BVS("x", 64)
+	y = claripy.BVS("y", 64)
+	big = x
+	for i in range(50):
+		big = big * y + i
+
+	s = angr.SimState(arch='AMD64')
+	s.regs.rax = big
+	s2 = s.copy()
+	s2.regs.rbx = big + 1
+	s2.add_constraints(big != 0)
+
+	v = angr.vaults.VaultDict()
+	data = v.dumps_batch([s, s2])
+	# the ASTs that are shared by the states are only written once
+	assert len(data) < len(v.dumps_batch([s])) + len(v.dumps_batch([s2])) - len(pickle.dumps(big, -1))
+
+	ls, ls2 = v.loads_batch(data)
+	# the ASTs are interned again: they are shared by the loaded states, and with the existing ASTs
+	assert ls.regs.rax is big
+	assert ls2.regs.rax is big
+	assert ls2.regs.rbx.args[0] is big
+	assert ls2.solver.satisfiable()
+
 
 if __name__ == '__main__':
 	for _a,_b in test_vault():
@@ -130,3 +271,5 @@ if __name__ == '__main__':
 	for _a,_b in test_ast_vault():
 		_a(_b)
 	test_project()
+	test_pack()
+	test_batch()